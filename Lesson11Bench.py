@@ -0,0 +1,936 @@
+# Micro-benchmarks for the Lesson 11 meter panel helpers.
+# Run with: python Lesson11Bench.py [--json results.json] [benchmark names...]
+# The end to end benchmarks use arduinoEmulator.py on a pty instead of a real Arduino, and the meter benchmarks use a
+# stubbed vPython, so everything runs headless. The results can be written to a JSON file to track them over time.
+
+
+import os
+import sys
+import pty
+import tty
+import math
+import time
+import threading
+import socket
+import subprocess
+import signal
+import tempfile
+import platform
+import json
+import types
+import importlib
+import serial
+import numpy as np
+import crc8Engine
+import serialReader
+import shadowState
+import binaryProtocol
+import sessionRecorder
+import deviceManager
+import sensorHistory
+import thresholdEngine
+import renderGovernor
+import loopProfiler
+import arduinoEmulator
+import pseudoDataSource
+import panelLayout
+import columnarExport
+import sessionAnalytics
+import analyticsPipeline
+import streamServer
+
+# Some typical Arduino sensor data packets, as sent by the TTB-AP-Lesson11 sketch.
+benchPackets = ["512,21.00,45.00,20.80,47.30", "1023,NAN,NAN,20.80,47.30", "0,-9.50,99.90,59.90,0.00", "-1,NAN,NAN,NAN,NAN"]
+
+# The original Lesson11.py calcCRC8() - literally, the Arduino code translated - kept here as the reference.
+def calcCRC8Legacy(data2Check = ""):
+    chksumCRC8 = 0
+    for character in data2Check:
+        dataByte = ord(character)                     # Get the ASCII value of the byte to be processed.
+        for bitCounter in range(8):
+            sum = ((dataByte ^ chksumCRC8) & 1)
+            chksumCRC8 >>= 1
+            if sum:
+                chksumCRC8 ^= 0x8c
+            dataByte >>= 1
+    return chksumCRC8
+
+# Time a function call over a number of repeats and return the best per call time in microseconds.
+def timeIt(benchFunction, callCount = 1000, repeatCount = 5):
+    bestTime = None
+    for repeatCounter in range(repeatCount):
+        timeStart = time.perf_counter()
+        for callCounter in range(callCount):
+            benchFunction()
+        timeTaken = (time.perf_counter() - timeStart) / callCount
+        if bestTime is None or timeTaken < bestTime:
+            bestTime = timeTaken
+    return bestTime * 1e6
+
+# The results of each benchmark, by benchmark name, for the JSON file.
+benchResults = {}
+currentBenchmark = None
+
+# Keep a result value of the current benchmark.
+def recordValue(valueName = "", value = 0.0):
+    benchResults.setdefault(currentBenchmark, {})[valueName] = value
+
+# Print a single benchmark result line, and keep it.
+def reportResult(benchName = "", perCallTime = 0.0, baselineTime = None):
+    if baselineTime:
+        print("%-40s %10.3fus  (x%.1f)" % (benchName, perCallTime, baselineTime / perCallTime))
+        recordValue(benchName, {"perCallUs": perCallTime, "baselineUs": baselineTime})
+    else:
+        print("%-40s %10.3fus" % (benchName, perCallTime))
+        recordValue(benchName, {"perCallUs": perCallTime})
+
+# CRC8: legacy bit loop vs table driven vs batch validation.
+def benchCRC8():
+    # Check that the engines agree before timing them.
+    for packet in benchPackets:
+        assert crc8Engine.calcCRC8(packet) == calcCRC8Legacy(packet)
+        assert crc8Engine.calcCRC8(packet.encode()) == calcCRC8Legacy(packet)
+    assert crc8Engine.calcCRC8("rgbLEDs=0") == 243 and crc8Engine.calcCRC8("rgbLEDs=4") == 146
+    packet = benchPackets[0]
+    packetBytes = packet.encode()
+    legacyTime = timeIt(lambda: calcCRC8Legacy(packet))
+    reportResult("calcCRC8 legacy (str)", legacyTime)
+    reportResult("calcCRC8 table (str)", timeIt(lambda: crc8Engine.calcCRC8(packet)), legacyTime)
+    reportResult("calcCRC8 table (bytes)", timeIt(lambda: crc8Engine.calcCRC8(packetBytes)), legacyTime)
+    # Validate a block of framed lines, twice per packet as the main loop used to do.
+    framedLines = [("%s!%d\r\n" % (packet, calcCRC8Legacy(packet))).encode() for packet in benchPackets * 256]
+    assert crc8Engine.checkCRC8Lines(framedLines).all()
+    blockLegacyTime = timeIt(lambda: [calcCRC8Legacy(str(line, "utf-8").strip("\r\n").split("!")[0]) for line in framedLines], 10)
+    reportResult("legacy x%d lines" % len(framedLines), blockLegacyTime)
+    reportResult("checkCRC8Lines x%d lines" % len(framedLines), timeIt(lambda: crc8Engine.checkCRC8Lines(framedLines), 10), blockLegacyTime)
+
+# Serial ingest: legacy in_waiting/readline() per packet vs chunked reads by the background reader.
+# A pyserial loop:// port stands in for the Arduino, its internal queue holds 4096 bytes so the block is kept below that.
+def benchSerialReader():
+    framedLines = [("%s!%d\r\n" % (packet, calcCRC8Legacy(packet))).encode() for packet in benchPackets * 24]
+    rxStream = b"".join(framedLines)
+    loopPort = serial.serial_for_url("loop://", timeout = 0)
+    def legacyIngest():
+        loopPort.write(rxStream)
+        while loopPort.in_waiting:
+            serialReader.parseSensorPacket(loopPort.readline())
+    def chunkedIngest():
+        loopPort.write(rxStream)
+        arduinoReader = serialReader.serialReader(loopPort, serialReader.sampleRingBuffer(len(framedLines)))
+        while loopPort.in_waiting:
+            arduinoReader.feed(loopPort.read(min(loopPort.in_waiting, arduinoReader.chunkSize)))
+        assert len(arduinoReader.samples) == len(framedLines)
+    legacyTime = timeIt(legacyIngest, 10)
+    reportResult("readline ingest x%d lines" % len(framedLines), legacyTime)
+    reportResult("chunked reader x%d lines" % len(framedLines), timeIt(chunkedIngest, 10), legacyTime)
+
+# The original inline parsing from the Lesson 11 main loop, as a function.
+def parseSensorPacketLegacy(arduinoDataPacket = b""):
+    arduinoDataPacket = str(arduinoDataPacket, 'utf-8')
+    arduinoDataPacket = arduinoDataPacket.strip('\r\n')
+    if "!" in arduinoDataPacket:
+        (sensorData, chksumCRC8) = arduinoDataPacket.split("!")
+    else:
+        sensorData = arduinoDataPacket
+        chksumCRC8 = calcCRC8Legacy(sensorData)
+    if chksumCRC8.isdigit() and crc8Engine.calcCRC8(sensorData) == int(chksumCRC8):
+        (pot1Value, tDHT11, hDHT11, tDHT22, hDHT22) = sensorData.split(",")
+        if pot1Value != "-1":
+            pot1Value = int(pot1Value)
+        if tDHT11 != "NAN":
+            tDHT11   = float(tDHT11)
+        if hDHT11 != "NAN":
+            hDHT11   = float(hDHT11)
+        if tDHT22 != "NAN":
+            tDHT22   = float(tDHT22)
+        if hDHT22 != "NAN":
+            hDHT22   = float(hDHT22)
+        return (pot1Value, tDHT11, hDHT11, tDHT22, hDHT22)
+    return None
+
+# Packet parsing: the original inline parsing vs parseSensorPacket() vs the record parser, which parses in place in the
+# receive buffer into a float64 record. All three use the same table driven CRC8, so only the parsing differs. Then the
+# whole reader, given the lines in 4096 byte reads, parsing each line with parseSensorPacket() vs in place with the record
+# parser. Then the record parser on corrupted and malformed packets, which the inline parsing could raise on.
+def benchPacketParser():
+    emulatedArduino = arduinoEmulator.arduinoEmulator(nanRate = 0.05)
+    framedLines = [emulatedArduino.nextPacket() for lineCounter in range(1024)]
+    emulatedArduino.corruptionRate = 0.05
+    badLines = [emulatedArduino.nextPacket() for lineCounter in range(1024)] + [b"512,21.00\r\n", b"512,21.00,45.00,NAN,NAN,NAN\r\n", b"x,y,z,NAN,NAN\r\n", b"512!-1\r\n", b"\r\n"]
+    emulatedArduino.close()
+    rxStream = b"".join(framedLines)
+    rxBuffer = bytearray(rxStream)
+    recordParser = serialReader.sensorRecordParser()
+    assert [recordParser(framedLine) for framedLine in framedLines] == [parseSensorPacketLegacy(framedLine) for framedLine in framedLines]
+    def recordParse():
+        (lineStart, parseInto) = (0, recordParser.parseInto)
+        lineEnd = rxBuffer.find(b"\n")
+        while lineEnd >= 0:
+            parseInto(rxBuffer, lineStart, lineEnd)
+            lineStart = lineEnd + 1
+            lineEnd = rxBuffer.find(b"\n", lineStart)
+    def readerIngest(packetParser):
+        arduinoReader = serialReader.serialReader(None, serialReader.sampleRingBuffer(len(framedLines)), packetParser)
+        for chunkStart in range(0, len(rxStream), 4096):
+            arduinoReader.feed(rxStream[chunkStart:chunkStart + 4096])
+        assert len(arduinoReader.samples) == len(framedLines)
+    legacyTime = timeIt(lambda: [parseSensorPacketLegacy(framedLine) for framedLine in framedLines], 20)
+    reportResult("inline parsing x%d lines" % len(framedLines), legacyTime)
+    reportResult("parseSensorPacket x%d lines" % len(framedLines), timeIt(lambda: [serialReader.parseSensorPacket(framedLine) for framedLine in framedLines], 20), legacyTime)
+    reportResult("record parser in place x%d lines" % len(framedLines), timeIt(recordParse, 20), legacyTime)
+    splitTime = timeIt(lambda: readerIngest(serialReader.parseSensorPacket), 20)
+    reportResult("reader, parseSensorPacket per line x%d lines" % len(framedLines), splitTime)
+    reportResult("reader, record parser in place x%d lines" % len(framedLines), timeIt(lambda: readerIngest(None), 20), splitTime)
+    badReader = serialReader.serialReader(None)
+    badReader.feed(b"".join(badLines))
+    badStats = {statName: badReader.stats()[statName] for statName in ("packetsReceived", "badPackets", "crcFailures", "malformedPackets")}
+    print("Record parser on %d corrupted or malformed lines: %s" % (len(badLines), badStats))
+    recordValue("badLines", badStats)
+
+# Multi-device ingest: packets per second with 1, 2 and 4 Arduinos, each played by a pty with its own writer thread.
+def benchDeviceRack():
+    framedLines = [("%s!%d\r\n" % (packet, calcCRC8Legacy(packet))).encode() for packet in benchPackets * 1024]
+    rxStream = b"".join(framedLines)
+    for deviceCount in (1, 2, 4):
+        arduinoRack = deviceManager.deviceManager()
+        masterPorts = []
+        for deviceCounter in range(deviceCount):
+            (masterPort, slavePort) = pty.openpty()
+            tty.setraw(slavePort)
+            masterPorts.append((masterPort, slavePort))
+            arduinoRack.openDevice(os.ttyname(slavePort), "arduino%d" % (deviceCounter + 1))
+            arduinoRack["arduino%d" % (deviceCounter + 1)].reader.samples = serialReader.sampleRingBuffer(len(framedLines))
+        arduinoRack.start()
+        writerThreads = [threading.Thread(target = os.write, args = (masterPort, rxStream)) for (masterPort, slavePort) in masterPorts]
+        timeStart = time.perf_counter()
+        for writerThread in writerThreads:
+            writerThread.start()
+        while sum(arduino.reader.packetsReceived for arduino in arduinoRack) < deviceCount * len(framedLines):
+            time.sleep(0.001)
+        timeTaken = time.perf_counter() - timeStart
+        for writerThread in writerThreads:
+            writerThread.join()
+        assert all(len(arduino.reader.samples) == len(framedLines) for arduino in arduinoRack)
+        arduinoRack.stop()
+        for (masterPort, slavePort) in masterPorts:
+            os.close(masterPort)
+            os.close(slavePort)
+        print("%d device(s): %d packets in %.3fs, %.0f packets/s" % (deviceCount, deviceCount * len(framedLines), timeTaken, deviceCount * len(framedLines) / timeTaken))
+
+# A stand in for a vPython primitive, it just counts the attribute assignments that would go to the browser.
+class stubPrimitive():
+    assignments = 0
+    def __setattr__(self, attrName, attrValue):
+        stubPrimitive.assignments += 1
+        object.__setattr__(self, attrName, attrValue)
+
+# The meterType2 segment bar update logic, with or without the shadow state layer.
+def updateSegmentBar(meterSegments, segmentRange, lastSegmentsOn, meterValue, scaleRange = 100):
+    meterSegmentsOn = meterValue / scaleRange * 100 + 1
+    for meterSegment in segmentRange(lastSegmentsOn, meterSegmentsOn, len(meterSegments)):
+        meterSegments[meterSegment].color = "blue" if meterSegment <= int(meterSegmentsOn) else "white"
+        if meterSegment < int(meterSegmentsOn):
+            meterSegments[meterSegment].opacity = 1
+        elif meterSegment == int(meterSegmentsOn):
+            meterSegments[meterSegment].opacity = meterSegmentsOn % 1
+        else:
+            meterSegments[meterSegment].opacity = meterSegment / scaleRange
+    return meterSegmentsOn
+
+# Dirty checking: vPython attribute assignments and time for a 101 segment bar following a slow random walk (a DHT humidity).
+def benchShadowState():
+    rng = np.random.default_rng(11)
+    meterValues = np.clip(50 + np.cumsum(rng.choice([-0.1, 0, 0, 0, 0.1], 2000)), 0, 100).round(1)
+    legacySegments = [stubPrimitive() for segmentCounter in range(101)]
+    shadowSegments = [shadowState.shadowPrimitive(stubPrimitive(), color = "white", opacity = segmentCounter / 100) for segmentCounter in range(101)]
+    def legacyUpdates():
+        for meterValue in meterValues:
+            updateSegmentBar(legacySegments, lambda oldOn, newOn, segmentCount: range(segmentCount), None, meterValue)
+    def shadowUpdates():
+        lastSegmentsOn = None
+        for meterValue in meterValues:
+            lastSegmentsOn = updateSegmentBar(shadowSegments, shadowState.changedSegmentRange, lastSegmentsOn, meterValue)
+    stubPrimitive.assignments = 0
+    legacyUpdates()
+    legacyAssignments = stubPrimitive.assignments
+    stubPrimitive.assignments = 0
+    shadowUpdates()
+    print("vPython assignments for %d updates: legacy %d, shadowed %d" % (len(meterValues), legacyAssignments, stubPrimitive.assignments))
+    legacyTime = timeIt(legacyUpdates, 2)
+    reportResult("segment bar legacy x%d updates" % len(meterValues), legacyTime)
+    reportResult("segment bar shadowed x%d updates" % len(meterValues), timeIt(shadowUpdates, 2), legacyTime)
+
+# Segment bars: per segment Python branching vs the NumPy segmentBarState, for a 500 segment dial swinging over its range.
+def benchSegmentBar():
+    segmentCount = 500
+    rng = np.random.default_rng(8)
+    meterValues = np.clip(50 + np.cumsum(rng.normal(0, 5, 500)), 0, 100)
+    loopSegments = [shadowState.shadowPrimitive(stubPrimitive(), color = "white", opacity = segmentCounter / (segmentCount - 1)) for segmentCounter in range(segmentCount)]
+    numpySegments = [stubPrimitive() for segmentCounter in range(segmentCount)]
+    segmentBar = shadowState.segmentBarState(np.ones(segmentCount), np.arange(segmentCount) / (segmentCount - 1))
+    segmentPalette = ["white", "blue"]
+    def loopUpdates():
+        lastSegmentsOn = None
+        for meterValue in meterValues:
+            meterSegmentsOn = meterValue / 100 * (segmentCount - 1) + 1
+            for meterSegment in shadowState.changedSegmentRange(lastSegmentsOn, meterSegmentsOn, segmentCount):
+                loopSegments[meterSegment].color = "blue" if meterSegment <= int(meterSegmentsOn) else "white"
+                if meterSegment < int(meterSegmentsOn):
+                    loopSegments[meterSegment].opacity = 1
+                elif meterSegment == int(meterSegmentsOn):
+                    loopSegments[meterSegment].opacity = meterSegmentsOn % 1
+                else:
+                    loopSegments[meterSegment].opacity = meterSegment / (segmentCount - 1)
+            lastSegmentsOn = meterSegmentsOn
+    def numpyUpdates():
+        for meterValue in meterValues:
+            segmentBar.apply(numpySegments, segmentPalette, segmentBar.update(meterValue / 100 * (segmentCount - 1) + 1))
+    stubPrimitive.assignments = 0
+    loopUpdates()
+    loopAssignments = stubPrimitive.assignments
+    stubPrimitive.assignments = 0
+    numpyUpdates()
+    assert [segment.shadow for segment in loopSegments] == [{"color": segmentPalette[colorIndex], "opacity": opacity} for (colorIndex, opacity) in zip(segmentBar.colorIndex.tolist(), segmentBar.opacity.tolist())]
+    print("vPython assignments for %d updates: loop %d, numpy %d" % (len(meterValues), loopAssignments, stubPrimitive.assignments))
+    loopTime = timeIt(loopUpdates, 2)
+    reportResult("%d segments loop x%d updates" % (segmentCount, len(meterValues)), loopTime)
+    reportResult("%d segments numpy x%d updates" % (segmentCount, len(meterValues)), timeIt(numpyUpdates, 2), loopTime)
+
+# Rolling statistics: rescanning the window with NumPy after every reading vs the incremental channelHistory.
+def benchSensorHistory():
+    rng = np.random.default_rng(10)
+    readings = rng.normal(25, 3, 2000)
+    readings[rng.random(len(readings)) < 0.05] = np.nan
+    def rescanStats():
+        windowReadings = np.full(1024, np.nan)
+        for (readingIndex, reading) in enumerate(readings):
+            windowReadings[readingIndex % 1024] = reading
+            (np.nanmin(windowReadings), np.nanmax(windowReadings), np.nanmean(windowReadings), np.nanvar(windowReadings))
+    def incrementalStats():
+        readingHistory = sensorHistory.channelHistory(1024)
+        for reading in readings.tolist():
+            readingHistory.append(reading, 0.0)
+            readingHistory.stats()
+    rescanTime = timeIt(rescanStats, 2)
+    reportResult("window rescan x%d readings" % len(readings), rescanTime)
+    reportResult("channelHistory x%d readings" % len(readings), timeIt(incrementalStats, 2), rescanTime)
+
+# The original pseudo random data, one sample at a time.
+def pseudoDataLegacy():
+    pot1Value = int(1023 * np.random.rand())
+    tDHT11 = (70 * np.random.rand() - 10.0)
+    hDHT11 = (100 * np.random.rand())
+    tDHT22 = (70 * np.random.rand() - 10.0)
+    hDHT22 = (100 * np.random.rand())
+    return(pot1Value, tDHT11, hDHT11, tDHT22, hDHT22)
+
+# Pseudo data: the original five np.random.rand() calls per sample vs the block generated signal models, as samples
+# ready for the meters, and as the float64 blocks alone.
+def benchPseudoData():
+    legacyTime = timeIt(lambda: [pseudoDataLegacy() for sampleCounter in range(1024)], 20)
+    reportResult("pseudoData() x1024 samples", legacyTime)
+    pseudoSource = pseudoDataSource.pseudoDataSource(0, dropoutRate = 0.01)
+    reportResult("pseudoDataSource x1024 samples", timeIt(lambda: [pseudoSource.nextSample() for sampleCounter in range(1024)], 20), legacyTime)
+    reportResult("generateBlock x1024 samples", timeIt(lambda: pseudoSource.generateBlock(1024), 20), legacyTime)
+    assert list(pseudoDataSource.pseudoDataSource(0).samples(5000)) == list(pseudoDataSource.pseudoDataSource(0).samples(5000))
+
+# The original Lesson11.py rgbLEDsAction() - no hysteresis - kept here as the reference.
+def rgbLEDsActionLegacy(sensorValue = "nan", bgThreshold = 30, rgThreshold = 70):
+    if sensorValue != "nan":
+        if sensorValue < bgThreshold:
+            return 1
+        if bgThreshold <= sensorValue <= rgThreshold:
+            return 2
+        return 4
+    return 0
+
+# Threshold hysteresis: rgbLEDs commands and LED recolours for a potentiometer voltage jittering around the 1.5V and 3.5V thresholds.
+def benchThresholds():
+    rng = np.random.default_rng(11)
+    # A slow sweep up and down the range, with +/-2 ADC counts of jitter.
+    pot1Values = np.clip(np.round(np.concatenate([np.linspace(0, 1023, 5000), np.linspace(1023, 0, 5000)]) + rng.integers(-2, 3, 10000)), 0, 1023)
+    pot1Voltages = np.round(5 * pot1Values / 1024, 2).tolist()
+    def countChanges(actionFunction):
+        (lastAction, actionChanges) = (None, 0)
+        for pot1Voltage in pot1Voltages:
+            arduinoAction = actionFunction(pot1Voltage)
+            if arduinoAction != lastAction:
+                (lastAction, actionChanges) = (arduinoAction, actionChanges + 1)
+        return actionChanges
+    rgbLEDsThresholds = thresholdEngine.thresholdClassifier((1.5, 3.5), 0.5)
+    legacyChanges = countChanges(lambda pot1Voltage: rgbLEDsActionLegacy(pot1Voltage, 1.5, 3.5))
+    hysteresisChanges = countChanges(lambda pot1Voltage: 1 << rgbLEDsThresholds.classify(pot1Voltage))
+    # Every change is a CRC8 signed rgbLEDs command to the Arduino, and a recolour of the 3 primitives of each virtual LED.
+    print("rgbLEDs commands for %d readings: legacy %d (%d bytes), hysteresis %d (%d bytes)" % (len(pot1Voltages),
+          legacyChanges, legacyChanges * len(deviceManager.signCommand("rgbLEDs=4")), hysteresisChanges, hysteresisChanges * len(deviceManager.signCommand("rgbLEDs=4"))))
+    print("rgbColorLED primitive recolours: legacy %d, hysteresis %d" % (3 * legacyChanges, 3 * hysteresisChanges))
+    reportResult("classify x%d readings" % len(pot1Voltages), timeIt(lambda: [rgbLEDsThresholds.classify(pot1Voltage) for pot1Voltage in pot1Voltages], 5))
+
+# Render governor: main loop frames and CPU time in one second of an idle dashboard (no new data), fixed rate vs governed.
+def benchRenderGovernor():
+    def idleLoop(frameFunction):
+        (timeEnd, frameCount, cpuStart) = (time.monotonic() + 1, 0, time.process_time())
+        while time.monotonic() < timeEnd:
+            frameFunction()
+            frameCount += 1
+        return (frameCount, time.process_time() - cpuStart)
+    (fixedFrames, fixedCPU) = idleLoop(lambda: time.sleep(1 / 100))
+    renderPacer = renderGovernor.renderGovernor(100, 20, idleAfter = 0)
+    (governedFrames, governedCPU) = idleLoop(renderPacer.tick)
+    print("Idle second: fixed rate %d frames, %.1fms CPU, governed %d frames, %.1fms CPU" % (fixedFrames, 1000 * fixedCPU, governedFrames, 1000 * governedCPU))
+
+# Profiling: the chunked reader as it is (profiling off costs nothing, as nothing is wrapped) and fully instrumented.
+def benchProfiler():
+    framedLines = [("%s!%d\r\n" % (packet, calcCRC8Legacy(packet))).encode() for packet in benchPackets * 256]
+    rxStream = b"".join(framedLines)
+    def readerIngest(loopProfile = None):
+        arduinoReader = serialReader.serialReader(None, serialReader.sampleRingBuffer(len(framedLines)))
+        if loopProfile is not None:
+            loopProfile.instrumentReader(arduinoReader)
+        arduinoReader.feed(rxStream)
+        assert len(arduinoReader.samples) == len(framedLines)
+    loopProfile = loopProfiler.loopProfiler()
+    plainTime = timeIt(readerIngest, 10)
+    reportResult("reader x%d lines, profiling off" % len(framedLines), plainTime)
+    reportResult("reader x%d lines, profiling on" % len(framedLines), timeIt(lambda: readerIngest(loopProfile), 10), plainTime)
+    print(loopProfile.reportLine())
+
+# Wire protocol: CSV text vs COBS framed binary records, bytes per sample and reader ingest time.
+def benchBinaryProtocol():
+    sensorSamples = [(512, 21.0, 45.0, 20.8, 47.3), (1023, "NAN", "NAN", 20.8, 47.3), (0, -9.5, 99.9, 59.9, 0.0), ("-1", "NAN", "NAN", "NAN", "NAN")] * 256
+    textStream = b""
+    for sample in sensorSamples:
+        sensorData = "%s,%s,%s,%s,%s" % tuple(reading if reading in ("-1", "NAN") else ("%d" % reading if sampleIndex == 0 else "%.2f" % reading) for (sampleIndex, reading) in enumerate(sample))
+        textStream += ("%s!%d\r\n" % (sensorData, calcCRC8Legacy(sensorData))).encode()
+    binaryFrames = [binaryProtocol.cobsEncode(binaryProtocol.packSensorRecord(sequence, *sample)) for (sequence, sample) in enumerate(sensorSamples)]
+    binaryStream = b"\x00".join(binaryFrames) + b"\x00"
+    print("bytes per sample: text %.1f, binary %.1f" % (len(textStream) / len(sensorSamples), len(binaryStream) / len(sensorSamples)))
+    print("max samples/s at 115200 baud (10 bits/byte): text %d, binary %d" % (11520 * len(sensorSamples) // len(textStream), 11520 * len(sensorSamples) // len(binaryStream)))
+    def ingest(rxStream, txMode, chunkSize = 4096):
+        arduinoReader = serialReader.serialReader(None, serialReader.sampleRingBuffer(len(sensorSamples)))
+        arduinoReader.setTxMode(txMode)
+        for chunkStart in range(0, len(rxStream), chunkSize):
+            arduinoReader.feed(rxStream[chunkStart:chunkStart + chunkSize])
+        assert len(arduinoReader.samples) == len(sensorSamples)
+    textTime = timeIt(lambda: ingest(textStream, binaryProtocol.txModeText), 10)
+    reportResult("text ingest x%d samples" % len(sensorSamples), textTime)
+    reportResult("binary ingest x%d samples" % len(sensorSamples), timeIt(lambda: ingest(binaryStream, binaryProtocol.txModeBinary), 10), textTime)
+    # At the sketch's usual rate, each read has about one packet in it. The best of more, shorter runs, as a read per
+    # packet is the most sensitive to the rest of the machine.
+    textTime = timeIt(lambda: ingest(textStream, binaryProtocol.txModeText, 29), 2, 25)
+    reportResult("text ingest, a packet per read", textTime)
+    reportResult("binary ingest, a packet per read", timeIt(lambda: ingest(binaryStream, binaryProtocol.txModeBinary, 15), 2, 25), textTime)
+    reportResult("binary block decode x%d samples" % len(sensorSamples), timeIt(lambda: binaryProtocol.decodeRecordBlock(binaryFrames), 10), textTime)
+
+# Session recording and replay: per sample recording cost, and replay speed through the whole session.
+def benchSessionRecorder():
+    sampleCount = 100000
+    sessionPath = os.path.join(tempfile.mkdtemp(), "bench.l11rec")
+    sensorSamples = [(512, 21.0, 45.0, 20.8, 47.3), (1023, "NAN", "NAN", 20.8, 47.3), None, ("-1", "NAN", "NAN", "NAN", "NAN")]
+    timeStart = time.perf_counter()
+    with sessionRecorder.sessionRecorder(sessionPath) as sessionFile:
+        for sampleCounter in range(sampleCount):
+            sessionFile.record(sensorSamples[sampleCounter % 4], sampleCounter * 0.1)
+    reportResult("record() per sample", (time.perf_counter() - timeStart) / sampleCount * 1e6)
+    print("session file: %d samples, %d bytes, %.1f hours at 10Hz" % (sampleCount, os.path.getsize(sessionPath), sampleCount / 36000))
+    sessionPlayer = sessionRecorder.sessionReplay(sessionPath, 0)
+    timeStart = time.perf_counter()
+    replayCount = sum(1 for sample in sessionPlayer.samples())
+    reportResult("replay samples() per sample", (time.perf_counter() - timeStart) / replayCount * 1e6)
+    timeStart = time.perf_counter()
+    meanTemperature = np.nanmean(np.concatenate([sessionBlock["tDHT22"][sessionBlock["crcOK"] == 1] for sessionBlock in sessionPlayer.blocks()]))
+    reportResult("replay blocks() mean of %d samples" % sampleCount, (time.perf_counter() - timeStart) * 1e6)
+    os.remove(sessionPath)
+
+# Columnar export and analytics: a day of readings at 10Hz exported in chunks, then the per-minute channel stats, LED band
+# times and CRC8 error rates over the memory-mapped chunks, with the channel stats vs a Python loop over the records.
+def benchColumnarExport():
+    recordCount = 864000
+    sessionRecords = np.zeros(recordCount, dtype = sessionRecorder.sessionDType)
+    readings = pseudoDataSource.pseudoDataSource(10, dropoutRate = 0.01).generateBlock(recordCount)
+    sessionRecords["timestamp"] = np.arange(recordCount) * 0.1
+    sessionRecords["crcOK"] = np.random.default_rng(11).random(recordCount) > 0.01
+    sessionRecords["pot1Value"] = np.where(np.isnan(readings[:, 0]), -1, np.nan_to_num(readings[:, 0]))
+    for (columnIndex, columnName) in enumerate(("tDHT11", "hDHT11", "tDHT22", "hDHT22")):
+        sessionRecords[columnName] = readings[:, columnIndex + 1]
+    with tempfile.TemporaryDirectory() as exportDir:
+        timeStart = time.perf_counter()
+        with columnarExport.columnarExporter(exportDir, wallClockOffset = 0.0) as columnExport:
+            for blockStart in range(0, recordCount, 10000):
+                columnExport.recordBlock(sessionRecords[blockStart:blockStart + 10000])
+        reportResult("export %d records, per record" % recordCount, (time.perf_counter() - timeStart) / recordCount * 1e6)
+        print("%d chunks, %d bytes" % (len(columnExport.exportIndex["chunks"]), sum(os.path.getsize(os.path.join(exportDir, fileName)) for fileName in os.listdir(exportDir))))
+        timeStart = time.perf_counter()
+        with columnarExport.columnarExporter(exportDir + "-tap") as columnExport:
+            for sampleCounter in range(100000):
+                columnExport.record((512, 21.0, 45.0, "NAN", 47.3))
+        reportResult("record() per sample", (time.perf_counter() - timeStart) / 100000 * 1e6)
+        for fileName in os.listdir(exportDir + "-tap"):
+            os.remove(os.path.join(exportDir + "-tap", fileName))
+        os.rmdir(exportDir + "-tap")
+        sensorColumns = sessionAnalytics.columnStore(exportDir)
+        # The per-minute stats the slow way, a record at a time, over a tenth of the day.
+        def loopStats():
+            (bucketStats, lastBucket) = ({}, None)
+            for (timestamp, pot1Value, crcOK, tDHT11, hDHT11, tDHT22, hDHT22) in sessionRecords[:recordCount // 10].tolist():
+                if not crcOK:
+                    continue
+                channelStats = bucketStats.setdefault(int(timestamp // 60), [[0, 0.0, math.inf, -math.inf] for channelName in sessionAnalytics.channelNames])
+                for (channelStat, reading) in zip(channelStats, (math.nan if pot1Value == -1 else pot1Value, tDHT11, hDHT11, tDHT22, hDHT22)):
+                    if reading == reading:
+                        channelStat[0] += 1
+                        channelStat[1] += reading
+                        channelStat[2] = min(channelStat[2], reading)
+                        channelStat[3] = max(channelStat[3], reading)
+            return bucketStats
+        loopTime = timeIt(loopStats, 1, 3) * 10
+        reportResult("per-minute stats, Python loop", loopTime)
+        reportResult("per-minute stats, vectorized", timeIt(lambda: sensorColumns.channelStats(60), 1, 3), loopTime)
+        reportResult("per-minute LED band times", timeIt(lambda: sensorColumns.bandTimes(bucketSeconds = 60), 1, 3))
+        reportResult("per-minute CRC8 error rates", timeIt(lambda: sensorColumns.crcErrorRates(60), 1, 3))
+        print("Band seconds, blue/green/red: %s, mean CRC8 error rate %.2f%%" % ("/".join("%.0f" % bandSeconds for bandSeconds in sensorColumns.bandTimes()["bandSeconds"].sum(axis = 0)),
+              100 * np.nanmean(sensorColumns.crcErrorRates()["errorRate"])))
+
+# A small launcher that runs Lesson11.py as its own child. Linux carries the max RSS of a process over to the programs it
+# starts, so Lesson11.py started from here would report the max RSS of this whole benchmark run. Started by the launcher,
+# it only carries over the launcher's, which is smaller than its own.
+startupLauncher = "import subprocess, sys; sys.exit(subprocess.call(sys.argv[1:]))"
+
+# Run Lesson11.py until it reports its startup time and memory, then stop it, and its launcher.
+# There is no Arduino here, so no serial port opens and there is no serial connection wait to leave out of the time.
+def runStartup(extraArgs = (), extraEnv = None):
+    startupEnv = dict(os.environ, LESSON11_PORT = "no-such-port")
+    startupEnv.update(extraEnv or {})
+    lesson11Path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Lesson11.py")
+    # A new session, so the launcher and Lesson11.py can be stopped together.
+    lesson11 = subprocess.Popen([sys.executable, "-c", startupLauncher, sys.executable, "-u", lesson11Path] + list(extraArgs), env = startupEnv, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True, start_new_session = True)
+    try:
+        for outputLine in lesson11.stdout:
+            if outputLine.startswith("Startup:"):
+                return outputLine.strip()
+        return "No startup report: Lesson11.py exited with %s." % lesson11.wait()
+    finally:
+        try:
+            os.killpg(lesson11.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        lesson11.wait()
+
+# Keep the time and memory from a startup report, e.g. "Startup: Headless mode in 0.089s, max RSS 43964 kB."
+def recordStartup(startupMode = "", startupReport = ""):
+    reportWords = startupReport.rstrip(".").split()
+    if startupReport.startswith("Startup:") and reportWords[-1] == "kB":
+        recordValue(startupMode, {"startupSeconds": float(reportWords[4].rstrip("s,")), "maxRSSkB": int(reportWords[-2])})
+
+# Startup: headless mode against the GUI mode, if vPython is installed.
+def benchStartup():
+    startupReport = runStartup(["--headless"])
+    print(startupReport)
+    recordStartup("headless", startupReport)
+    try:
+        import vpython
+    except ImportError:
+        print("GUI startup skipped: vPython is not installed.")
+        return
+    startupReport = runStartup()
+    print(startupReport)
+    recordStartup("gui", startupReport)
+
+# Panel construction: time and vPython object count, with every static part drawn on its own and merged into compounds.
+def benchPanelStartup():
+    try:
+        import vpython
+        import meterPanel
+    except ImportError:
+        print("Panel construction skipped: vPython is not installed.")
+        return
+    for compoundStaticParts in (False, True):
+        meterPanel.compoundStaticParts = compoundStaticParts
+        meterPanel.drawCanvas()
+        timeStart = time.perf_counter()
+        myMeterPanel = meterPanel.easiFacePanel()
+        constructionTime = time.perf_counter() - timeStart
+        objectCount = len([vpObject for vpObject in vpython.canvas.get_selected().objects if vpObject.visible])
+        print("compoundStaticParts = %s: %.3fs, %d visible objects (%d static parts)" % (compoundStaticParts, constructionTime, objectCount, len(myMeterPanel.staticParts.parts)))
+    meterPanel.compoundStaticParts = True
+
+# Wait for a reader thread to catch up, but not forever if it has died.
+def waitUntil(waitCondition, timeout = 10.0):
+    timeEnd = time.perf_counter() + timeout
+    while not waitCondition():
+        if time.perf_counter() > timeEnd:
+            raise TimeoutError("The serial reader did not catch up with the emulated Arduino.")
+        time.sleep(0.001)
+
+# End to end: samples per second from an emulated Arduino on a pty, through a serialReader, as fast as the pty goes,
+# in text and binary, with 5% NAN readings and 1% corrupted packets. Then the latency from the Arduino writing a packet
+# to its sample being parsed, at 1000 packets per second.
+def benchEndToEnd():
+    for txMode in (binaryProtocol.txModeText, binaryProtocol.txModeBinary):
+        emulatedArduino = arduinoEmulator.arduinoEmulator(0, 20000, nanRate = 0.05, corruptionRate = 0.01, txMode = txMode)
+        arduinoReader = serialReader.serialReader(serial.Serial(emulatedArduino.portName, 115200, timeout = 0.1), serialReader.sampleRingBuffer(20000))
+        arduinoReader.setTxMode(txMode)
+        arduinoReader.start()
+        timeStart = time.perf_counter()
+        emulatedArduino.start()
+        emulatedArduino.join()
+        waitUntil(lambda: arduinoReader.packetsReceived >= emulatedArduino.packetsSent)
+        timeTaken = time.perf_counter() - timeStart
+        arduinoReader.stop()
+        arduinoReader.serialPort.close()
+        emulatedArduino.close()
+        modeName = "binary" if txMode == binaryProtocol.txModeBinary else "text"
+        print("%s: %d packets in %.3fs, %.0f samples/s, %d corrupted, %d bad packets, %d samples" % (modeName, emulatedArduino.packetsSent, timeTaken,
+              emulatedArduino.packetsSent / timeTaken, emulatedArduino.corruptedPackets, arduinoReader.badPackets, len(arduinoReader.samples)))
+        recordValue(modeName, {"samplesPerSecond": emulatedArduino.packetsSent / timeTaken, "packetsSent": emulatedArduino.packetsSent,
+                    "corruptedPackets": emulatedArduino.corruptedPackets, "badPackets": arduinoReader.badPackets})
+    # The reader taps every packet, good or bad, in order, so the tap times line up with the emulator's write times.
+    emulatedArduino = arduinoEmulator.arduinoEmulator(1000, 2000, nanRate = 0.05, corruptionRate = 0.01)
+    arduinoReader = serialReader.serialReader(serial.Serial(emulatedArduino.portName, 115200, timeout = 0.1), serialReader.sampleRingBuffer(2000))
+    tapTimes = []
+    arduinoReader.sampleTap = lambda sample: tapTimes.append(time.perf_counter())
+    arduinoReader.start()
+    emulatedArduino.start()
+    emulatedArduino.join()
+    waitUntil(lambda: len(tapTimes) >= emulatedArduino.packetsSent)
+    arduinoReader.stop()
+    arduinoReader.serialPort.close()
+    emulatedArduino.close()
+    latencies = (np.array(tapTimes) - np.array(emulatedArduino.writeTimes)) * 1e6
+    (p50Latency, p95Latency, p99Latency) = np.percentile(latencies, [50, 95, 99])
+    print("Write to parse latency at 1000 packets/s: p50 %.0fus, p95 %.0fus, p99 %.0fus" % (p50Latency, p95Latency, p99Latency))
+    recordValue("latency", {"p50Us": p50Latency, "p95Us": p95Latency, "p99Us": p99Latency})
+
+# Command channel: the cost to the main loop of sending an rgbLEDs command, a blocking write vs queueing it, then how many
+# of a burst of rgbLEDs changes are actually written, and the acknowledgements and retries with 20% of the ACKs lost.
+def benchCommandChannel():
+    commandArduino = arduinoEmulator.arduinoEmulator(2000)
+    commandArduino.start()
+    arduinoRack = deviceManager.deviceManager()
+    arduino = arduinoRack.openDevice(commandArduino.portName, "arduino")
+    arduinoRack.start()
+    writeTime = timeIt(lambda: arduino.sendCommand("rgbLEDs=4"), 200)
+    reportResult("sendCommand, blocking write", writeTime)
+    arduino.useCommandChannel()
+    arduinoRack.start()
+    reportResult("sendCommand, command channel", timeIt(lambda: arduino.sendCommand("rgbLEDs=4"), 200), writeTime)
+    arduinoRack.stop()
+    commandArduino.close()
+    for (ackTimeout, ackLossRate) in ((None, 0.0), (0.05, 0.2)):
+        commandArduino = arduinoEmulator.arduinoEmulator(2000, commandAcks = ackTimeout is not None, ackLossRate = ackLossRate)
+        commandArduino.start()
+        arduinoRack = deviceManager.deviceManager()
+        arduino = arduinoRack.openDevice(commandArduino.portName, "arduino")
+        arduinoRack.useCommandChannels(ackTimeout)
+        arduinoRack.start()
+        # A burst of 5000 rgbLEDs changes, 10 per ms, with an alertLEDs command now and then, which the emulator (like the sketch)
+        # does not know, so it is refused every time it is tried.
+        for commandCounter in range(5000):
+            arduino.sendCommand("rgbLEDs=%d" % (1 << commandCounter % 3))
+            if commandCounter % 500 == 0:
+                arduino.sendCommand("alertLEDs=%d" % (commandCounter // 500 % 4))
+            if commandCounter % 10 == 0:
+                time.sleep(0.001)
+        arduino.sendCommand("rgbLEDs=0")
+        waitUntil(lambda: commandArduino.rgbLEDs == 0 and not arduino.commands.awaitingAck and not arduino.commands.pendingCommands)
+        arduinoRack.stop()
+        commandArduino.close()
+        channelStats = arduino.commands.stats()
+        print("ACK timeout %s, %.0f%% ACKs lost: %d commands queued, %d written in %d batches, %d ACKs, %d NAKs, %d timeouts, %d retries, %d failed" % (ackTimeout,
+              100 * ackLossRate, channelStats["commandsQueued"], channelStats["commandsWritten"], channelStats["batchesWritten"], channelStats["acks"], channelStats["naks"],
+              channelStats["ackTimeouts"], channelStats["retries"], channelStats["commandFailures"]))
+        recordValue("ackTimeout %s" % ackTimeout, channelStats)
+
+# Link recovery: an emulated Arduino at 100 packets/s goes silent part way through a packet, as if its cable had been pulled,
+# for 0.5s at a time, and the link supervisor reconnects it. Then the port is closed under the reader, like a read error.
+# The time to recover, and the samples lost (as worked out by the supervisor, and really), for each reconnect.
+def benchLinkRecovery():
+    emulatedArduino = arduinoEmulator.arduinoEmulator(100)
+    emulatedArduino.start()
+    arduinoRack = deviceManager.deviceManager()
+    arduino = arduinoRack.openDevice(emulatedArduino.portName, "arduino", timeout = 0.02)
+    arduinoRack.useLinkSupervisor(staleAfter = 0.1, reconnectAfter = 0.3, bootTime = 0.0, backoffMin = 0.05)
+    arduinoRack.start()
+    time.sleep(1.5) # Long enough to measure the packet rate.
+    for dropCounter in range(5):
+        (reconnects, packetsLost) = (arduino.link.reconnects, emulatedArduino.packetsLost)
+        emulatedArduino.dropLink(0.5)
+        waitUntil(lambda: arduino.link.reconnects > reconnects)
+        recovery = arduino.link.recoveries[-1]
+        print("Cable pulled for 0.5s: recovered in %.3fs, %d samples lost (%d really)" % (recovery["recoverSeconds"], recovery["samplesLost"], emulatedArduino.packetsLost - packetsLost))
+        recordValue("drop %d" % (dropCounter + 1), dict(recovery, packetsLost = emulatedArduino.packetsLost - packetsLost))
+        time.sleep(1.0)
+    reconnects = arduino.link.reconnects
+    arduino.serialPort.close()
+    waitUntil(lambda: arduino.link.reconnects > reconnects)
+    recovery = arduino.link.recoveries[-1]
+    print("Read error: recovered in %.3fs, %d samples lost" % (recovery["recoverSeconds"], recovery["samplesLost"]))
+    recordValue("read error", recovery)
+    recordValue("stats", arduino.stats())
+    arduinoRack.stop()
+    emulatedArduino.close()
+
+# Analytics pipeline: the main thread CPU time per sample of handing the samples to the analytics workers (and picking up
+# their results) with 1, 3 and 10 plugins, vs working the same plugins out in the main thread, a batch at a time.
+def benchAnalyticsPipeline():
+    pseudoSource = pseudoDataSource.pseudoDataSource(0, dropoutRate = 0.05)
+    sensorSamples = [pseudoSource.takeSample() for sampleCounter in range(4096)]
+    batchReadings = np.array([(0.0,) + sessionRecorder.sampleToNumbers(sensorSample) for sensorSample in sensorSamples[:64]])
+    batchReadings = {columnName: batchReadings[:, columnIndex] for (columnIndex, columnName) in enumerate(analyticsPipeline.batchColumns)}
+    extraPlugins = tuple((analyticsPipeline.anomalyScore, ("anomalyScore",)) for pluginCounter in range(7))
+    for plugins in (("dewPoint",), tuple(analyticsPipeline.analyticsPlugins), tuple(analyticsPipeline.analyticsPlugins) + extraPlugins):
+        # Enough slots for every batch, so none are dropped while the workers catch up with the burst.
+        panelAnalytics = analyticsPipeline.analyticsPipeline(plugins, slotCount = 65).start()
+        panelAnalytics.submit(sensorSamples[0])
+        panelAnalytics.drain(30) # Wait for the workers to start.
+        inlineTime = timeIt(lambda: [pluginFunction(batchReadings) for (pluginFunction, derivedNames) in panelAnalytics.pluginSpecs], 20) / 64
+        timeStart = time.thread_time()
+        for sensorSample in sensorSamples[1:]:
+            panelAnalytics.submit(sensorSample)
+            panelAnalytics.poll()
+        pipelineTime = (time.thread_time() - timeStart) / (len(sensorSamples) - 1) * 1e6
+        panelAnalytics.drain()
+        reportResult("%d plugin(s), in the main thread" % len(plugins), inlineTime)
+        reportResult("%d plugin(s), worker pool" % len(plugins), pipelineTime, inlineTime)
+        recordValue("%d plugin(s), pipeline stats" % len(plugins), panelAnalytics.stats())
+        panelAnalytics.stop()
+
+# A stream client, on a plain socket, that counts the samples it is sent. A slow client only reads a little now and then.
+class benchStreamClient(threading.Thread):
+    def __init__(self, serverPort, streamQuery = "", readDelay = 0.0):
+        threading.Thread.__init__(self, daemon = True)
+        self.clientSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if readDelay:
+            self.clientSocket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.clientSocket.connect(("127.0.0.1", serverPort))
+        self.clientSocket.sendall(("GET /stream%s HTTP/1.1\r\nHost: localhost\r\n\r\n" % streamQuery).encode())
+        self.readDelay = readDelay
+        self.samplesRead = 0
+        self.lastSequence = 0
+    def run(self):
+        streamTail = b""
+        while True:
+            try:
+                streamData = self.clientSocket.recv(1024 if self.readDelay else 65536)
+            except OSError:
+                return
+            if not streamData:
+                return
+            streamFrames = (streamTail + streamData).split(b"\n\n")
+            streamTail = streamFrames.pop()
+            for streamFrame in streamFrames:
+                if streamFrame.startswith(b"id: "):
+                    self.samplesRead += 1
+                    self.lastSequence = int(streamFrame[4:streamFrame.index(b"\n")])
+            if self.readDelay:
+                time.sleep(self.readDelay)
+    def close(self):
+        self.clientSocket.close()
+
+# Stream server: the main thread cost of publishing a sample to 0, 10 and 50 stream clients, vs turning it into a frame
+# for each client. Then 1000 samples/s for 2s to 20 clients, one of them slow and one downsampled to 10 samples/s.
+def benchStreamServer():
+    benchSample = (512, 21.0, 45.0, 20.8, 47.3)
+    for clientCount in (0, 10, 50):
+        sampleStream = streamServer.streamServer(port = 0)
+        sampleStream.startServing()
+        streamClients = [benchStreamClient(sampleStream.serverPort) for clientCounter in range(clientCount)]
+        for streamClient in streamClients:
+            streamClient.start()
+        waitUntil(lambda: len(sampleStream.clients) == clientCount)
+        frameTime = None
+        if clientCount:
+            frameTime = timeIt(lambda: [streamServer.sampleFrame(1, 0.0, "arduino", benchSample, 4) for clientCounter in range(clientCount)], 200)
+            reportResult("%d clients, a frame for each client" % clientCount, frameTime)
+        reportResult("%d clients, publish" % clientCount, timeIt(lambda: sampleStream.publish("arduino", benchSample, 4), 1000), frameTime)
+        waitUntil(lambda: all(streamClient.lastSequence == sampleStream.sequence for streamClient in streamClients))
+        sampleStream.stop()
+        for streamClient in streamClients:
+            streamClient.close()
+    sampleStream = streamServer.streamServer(port = 0, clientQueue = 64)
+    sampleStream.startServing()
+    streamClients = [benchStreamClient(sampleStream.serverPort) for clientCounter in range(18)]
+    slowClient = benchStreamClient(sampleStream.serverPort, readDelay = 0.1)
+    downsampledClient = benchStreamClient(sampleStream.serverPort, "?rate=10")
+    for streamClient in streamClients + [slowClient, downsampledClient]:
+        streamClient.start()
+    waitUntil(lambda: len(sampleStream.clients) == 20)
+    timeStart = time.perf_counter()
+    for sampleCounter in range(2000):
+        sampleStream.publish("arduino", (sampleCounter % 1024, 21.0, 45.0, 20.8, 47.3), 1 << sampleCounter % 3)
+        time.sleep(max(0.0, timeStart + (sampleCounter + 1) / 1000 - time.perf_counter()))
+    waitUntil(lambda: all(streamClient.samplesRead == 2000 for streamClient in streamClients))
+    serverStats = sampleStream.stats()
+    print("18 fast clients: %d samples each, slow client: %d samples so far, %d dropped, downsampled client: %d samples, %d frames built" % (streamClients[0].samplesRead,
+          slowClient.samplesRead, max(clientStats["framesDropped"] for clientStats in serverStats["clientStats"]), downsampledClient.samplesRead, serverStats["framesBuilt"]))
+    recordValue("fan out", serverStats)
+    sampleStream.stop()
+    for streamClient in streamClients + [slowClient, downsampledClient]:
+        streamClient.close()
+
+# A stand in for a vPython vector, with just the maths the meter panel needs.
+class stubVector():
+    def __init__(self, x = 0.0, y = 0.0, z = 0.0):
+        (self.x, self.y, self.z) = (x, y, z)
+    def __add__(self, other):
+        return stubVector(self.x + other.x, self.y + other.y, self.z + other.z)
+    def __sub__(self, other):
+        return stubVector(self.x - other.x, self.y - other.y, self.z - other.z)
+    def __mul__(self, scale):
+        return stubVector(self.x * scale, self.y * scale, self.z * scale)
+    __rmul__ = __mul__
+
+# A stand in for any vPython object, that counts the objects made, and the attribute assignments after they have been made.
+class stubVPythonObject(stubPrimitive):
+    created = 0
+    def __init__(self, *args, **attrs):
+        stubVPythonObject.created += 1
+        for (attrName, attrValue) in attrs.items():
+            object.__setattr__(self, attrName, attrValue)
+    def rotate(self, **kwargs):
+        pass
+
+# Import meterPanel with a stubbed vPython, without leaving either in sys.modules for the other benchmarks.
+def importStubbedMeterPanel():
+    savedModules = {moduleName: sys.modules.pop(moduleName) for moduleName in ("vpython", "meterPanel") if moduleName in sys.modules}
+    vpythonStub = types.ModuleType("vpython")
+    vpythonStub.vector = stubVector
+    for primitiveName in ("canvas", "box", "cylinder", "sphere", "cone", "pyramid", "arrow", "text", "label", "compound"):
+        setattr(vpythonStub, primitiveName, stubVPythonObject)
+    vpythonStub.color = types.SimpleNamespace(red = stubVector(1, 0, 0), green = stubVector(0, 1, 0), blue = stubVector(0, 0, 1), white = stubVector(1, 1, 1),
+                                              black = stubVector(0, 0, 0), cyan = stubVector(0, 1, 1), magenta = stubVector(1, 0, 1), yellow = stubVector(1, 1, 0),
+                                              gray = lambda luminance: stubVector(luminance, luminance, luminance))
+    vpythonStub.textures = types.SimpleNamespace(metal = "metal")
+    vpythonStub.rate = lambda refreshRate: None
+    sys.modules["vpython"] = vpythonStub
+    try:
+        return importlib.import_module("meterPanel")
+    finally:
+        sys.modules.pop("vpython", None)
+        sys.modules.pop("meterPanel", None)
+        sys.modules.update(savedModules)
+
+# Meter updates: the cost of updating the whole panel with a sample, and the vPython assignments it makes, with a stubbed vPython.
+def benchMeterUpdates():
+    stubbedMeterPanel = importStubbedMeterPanel()
+    timeStart = time.perf_counter()
+    myMeterPanel = stubbedMeterPanel.easiFacePanel()
+    recordValue("panelConstructionSeconds", time.perf_counter() - timeStart)
+    emulatedArduino = arduinoEmulator.arduinoEmulator(nanRate = 0.05)
+    sensorSamples = [serialReader.parseSensorPacket(emulatedArduino.nextPacket()) for sampleCounter in range(1000)]
+    emulatedArduino.close()
+    def panelUpdates():
+        for (pot1Value, tDHT11, hDHT11, tDHT22, hDHT22) in sensorSamples:
+            myMeterPanel.updatePot1(round(5 * pot1Value / 1024, 2), pot1Value)
+            myMeterPanel.updateDHT(tDHT11, hDHT11, tDHT22, hDHT22)
+    stubPrimitive.assignments = 0
+    panelUpdates()
+    print("vPython assignments for %d panel updates: %d" % (len(sensorSamples), stubPrimitive.assignments))
+    recordValue("assignmentsPerUpdate", stubPrimitive.assignments / len(sensorSamples))
+    reportResult("panel update x%d samples" % len(sensorSamples), timeIt(panelUpdates, 2))
+
+# Meter animation: the potentiometer voltage needle of the EasiFace panel, driven by readings that jump about at 2, 10 and
+# 50 samples/s, and drawn at 100 frames/s for 10s (of simulated time), with and without animation. The biggest move of
+# the needle from one frame to the next shows how smooth it looks. Then the cost of an animation frame, with the needle
+# and both columns moving, and with them all settled.
+def benchMeterAnimation():
+    stubbedMeterPanel = importStubbedMeterPanel()
+    snappedPanel = stubbedMeterPanel.easiFacePanel()
+    meterMotion = stubbedMeterPanel.useMeterAnimation(0.2)
+    animatedPanel = stubbedMeterPanel.easiFacePanel()
+    needleAngle = lambda myMeterPanel: math.degrees(math.atan2(myMeterPanel.voltageMeter1.meterNeedle.primitive.axis.y, myMeterPanel.voltageMeter1.meterNeedle.primitive.axis.x))
+    rng = np.random.default_rng(11)
+    frameTimes = iter(np.arange(0, 1000, 0.01))
+    for sampleRate in (2, 10, 50):
+        pot1Values = np.clip(512 + np.cumsum(rng.normal(0, 150, 10 * sampleRate)), 0, 1023).astype(int)
+        (biggestMoves, frameNumber) = ({"snapped": 0.0, "animated": 0.0}, 0)
+        lastAngles = {"snapped": needleAngle(snappedPanel), "animated": needleAngle(animatedPanel)}
+        for frameNumber in range(1000):
+            if frameNumber % (100 // sampleRate) == 0:
+                pot1Value = int(pot1Values[frameNumber * sampleRate // 100])
+                for myMeterPanel in (snappedPanel, animatedPanel):
+                    myMeterPanel.updatePot1(round(5 * pot1Value / 1024, 2), pot1Value)
+            meterMotion.animate(next(frameTimes))
+            for (panelName, myMeterPanel) in (("snapped", snappedPanel), ("animated", animatedPanel)):
+                biggestMoves[panelName] = max(biggestMoves[panelName], abs(needleAngle(myMeterPanel) - lastAngles[panelName]))
+                lastAngles[panelName] = needleAngle(myMeterPanel)
+        print("%2d samples/s: biggest needle move in a frame, snapped %.1f degrees, animated %.1f degrees" % (sampleRate, biggestMoves["snapped"], biggestMoves["animated"]))
+        recordValue("%d samples/s" % sampleRate, {"snappedDegrees": biggestMoves["snapped"], "animatedDegrees": biggestMoves["animated"]})
+    def movingFrame():
+        for springIndex in range(len(meterMotion)):
+            meterMotion.setTarget(springIndex, rng.random())
+        meterMotion.animate(next(frameTimes))
+    reportResult("animation frame, %d moving" % len(meterMotion), timeIt(movingFrame, 1000))
+    for frameCounter in range(500):
+        meterMotion.animate(next(frameTimes))
+    reportResult("animation frame, all settled", timeIt(lambda: meterMotion.animate(next(frameTimes)), 1000))
+    recordValue("stats", meterMotion.stats())
+
+# Panel layouts: building every meter of the EasiFace layout vs building them lazily, on their first valid reading (here
+# only the DHT22 meters get data), and a 24 meter layout. Then the meter geometry, worked out, from the in memory cache,
+# and loaded from a cache file. All with a stubbed vPython, so this is the Python side of the startup only.
+def benchPanelLayout():
+    stubbedMeterPanel = importStubbedMeterPanel()
+    easiFaceLayout = panelLayout.loadLayout()
+    def buildPanel(panelLayout = None, lazyMeters = False):
+        stubbedMeterPanel.useGeometryCache()
+        stubVPythonObject.created = 0
+        myMeterPanel = stubbedMeterPanel.easiFacePanel(panelLayout, lazyMeters)
+        myMeterPanel.updateDHT("NAN", "NAN", 21.5, 45.0)
+        return stubVPythonObject.created
+    for lazyMeters in (False, True):
+        objectCount = buildPanel(easiFaceLayout, lazyMeters)
+        reportResult("EasiFace panel, lazy %s (%d objects)" % (lazyMeters, objectCount), timeIt(lambda: buildPanel(easiFaceLayout, lazyMeters), 5))
+    # A big panel, 6 rows of the 4 DHT meters.
+    bigLayout = {"meters": [dict(meterSpec, name = "%s%d" % (meterSpec["name"], rowCounter), pos = [meterSpec["pos"][0], meterSpec["pos"][1] + 4 * rowCounter, meterSpec["pos"][2]])
+                            for rowCounter in range(6) for meterSpec in easiFaceLayout["meters"] if meterSpec["type"] in ("meterType2", "meterType3")]}
+    for lazyMeters in (False, True):
+        objectCount = buildPanel(bigLayout, lazyMeters)
+        reportResult("24 meter panel, lazy %s (%d objects)" % (lazyMeters, objectCount), timeIt(lambda: buildPanel(bigLayout, lazyMeters), 5))
+    geometryParams = [("arcScale", 0, 5, 5 * np.pi / 6, np.pi / 6, 1), ("arcScale", 0, 5, 5 * np.pi / 6, np.pi / 6, 10), ("arcScale", 0, 100, 8 * np.pi / 6, np.pi / 6, 1),
+                      ("linearScale", -10, 60, 11), ("linearScale", -10, 60, 51), ("ledRow", 10, 0.675)]
+    def workOutGeometry(meterGeometry):
+        for geometryParam in geometryParams:
+            meterGeometry.get(*geometryParam)
+        return meterGeometry
+    computeTime = timeIt(lambda: workOutGeometry(panelLayout.geometryCache()), 100)
+    reportResult("EasiFace geometry, worked out", computeTime)
+    meterGeometry = workOutGeometry(panelLayout.geometryCache())
+    reportResult("EasiFace geometry, cached in memory", timeIt(lambda: workOutGeometry(meterGeometry), 100), computeTime)
+    with tempfile.TemporaryDirectory() as cacheDir:
+        meterGeometry.cachePath = os.path.join(cacheDir, "geometry.npz")
+        meterGeometry.save()
+        reportResult("EasiFace geometry, cache file", timeIt(lambda: workOutGeometry(panelLayout.geometryCache(meterGeometry.cachePath)), 100), computeTime)
+
+# All the benchmarks, in the order they are run.
+benchmarks = [benchCRC8, benchPacketParser, benchSerialReader, benchDeviceRack, benchShadowState, benchSegmentBar, benchSensorHistory, benchPseudoData, benchThresholds, benchRenderGovernor, benchProfiler, benchBinaryProtocol, benchSessionRecorder, benchColumnarExport,
+              benchEndToEnd, benchCommandChannel, benchLinkRecovery, benchAnalyticsPipeline, benchStreamServer, benchMeterUpdates, benchMeterAnimation, benchPanelLayout, benchStartup, benchPanelStartup]
+
+# Write the results, and what they were run on, to a JSON file.
+def writeResults(jsonPath = "bench_results.json"):
+    try:
+        gitCommit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output = True, text = True, cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        gitCommit = ""
+    benchRun = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "gitCommit": gitCommit, "python": platform.python_version(), "numpy": np.__version__,
+                "platform": platform.platform(), "results": benchResults}
+    with open(jsonPath, "w") as jsonFile:
+        json.dump(benchRun, jsonFile, indent = 2, default = float)
+    print("Results written to %s" % jsonPath)
+
+if __name__ == "__main__":
+    benchArgs = sys.argv[1:]
+    jsonPath = None
+    if "--json" in benchArgs:
+        jsonPath = benchArgs.pop(benchArgs.index("--json") + 1)
+        benchArgs.remove("--json")
+    for benchmark in benchmarks:
+        if benchArgs and benchmark.__name__ not in benchArgs:
+            continue
+        print("--- %s ---" % benchmark.__name__)
+        currentBenchmark = benchmark.__name__
+        benchmark()
+    if jsonPath:
+        writeResults(jsonPath)
+
+# EOF
@@ -11,12 +11,16 @@
 //  CRC-8/MAXIM
 //    rgbLEDs=0!243 | rgbLEDs=1!173 | rgbLEDs=2!79  | rgbLEDs=3!17
 //    rgbLEDs=4!146 | rgbLEDs=5!204 | rgbLEDs=6!46  | rgbLEDs=7!112
+//    txMode=0!215  | txMode=1!137
+
+// https://en.wikipedia.org/wiki/Consistent_Overhead_Byte_Stuffing
 
 #include <Watchdog.h>         // A simple watchdog library.
 #include <DHT.h>              // DHT11/22 sensor library.
 
 //Debugging & testing defines - uncomment this define to enable some debug code.
 //#define TESTSRX               // Enable serial received command testing serial prints.
+//#define COMMANDACKS           // Acknowledge every received command with "ack=subject,action!crc", or refuse it with "nak=...".
 
 // DHT11/22 sensor defines.
 #define DHTTYPE11 DHT11       // Blue module, DHT11 defined as 11 in <DHT.h>.
@@ -40,6 +44,17 @@
 // Function prototypes - this allows the definition of default values.
 void rgbLEDBank(int action = 0);
 
+// Transmit mode defines - the sensor data can be sent as CSV text or as COBS framed binary records.
+#define TXMODETEXT 0          // "%d,%s,%s,%s,%s!crc\r\n" CSV text lines (the default).
+#define TXMODEBINARY 1        // A binary sensorRecord, COBS encoded and terminated with a 0x00 byte.
+// Binary record validity bitmask defines - a bit is set if the matching reading is valid.
+#define VALIDPOT1 0x01
+#define VALIDTDHT11 0x02
+#define VALIDHDHT11 0x04
+#define VALIDTDHT22 0x08
+#define VALIDHDHT22 0x10
+#define READINGSCALE 100      // The DHT readings are sent as int16 values x 100.
+
 //Code loop job defines.
 #define JOB1CYCLE 100         // Job 1 execution cycle: 0.1s  - Get the data: Read the potentiometers.
 #define JOB2CYCLE 1000        // Job 2 execution cycle: 1s    - Get the data: Read the DHT11 sensor.
@@ -57,6 +72,20 @@ char rxBuffer[RXBUFFERMAX + 1];     // A character array variable to hold incomi
 const char crcDelimiter[] = ":~!";  // The delimiter between the command and CRC8 checksum can be any of these characters.
 const char cmdDelimiter[] = " ,=";  // The delimiter between the command subject and command action can be any of these characters.
 bool commandReady = false;          // A flag to indicate that the current command is ready to be actioned.
+byte txMode = TXMODETEXT;           // The current transmit mode, changed by the "txMode" command.
+
+// The binary sensor record - AVR is little endian, so this matches the Python struct "<BBhhhhhB" (13 bytes).
+struct sensorRecord {
+  uint8_t sequence;                 // Incremented for every record sent.
+  uint8_t validMask;                // Which of the readings are valid.
+  int16_t pot1Value;
+  int16_t temperatureDHT11;         // Temperatures and humidities x READINGSCALE.
+  int16_t humidityDHT11;
+  int16_t temperatureDHT22;
+  int16_t humidityDHT22;
+  uint8_t chksumCRC8;               // The CRC8 checksum of all the bytes before it.
+} __attribute__((packed));
+byte txFrame[sizeof(sensorRecord) + 2]; // A COBS frame is one byte longer than the data, plus the 0x00 delimiter.
 
 // Watchdog initialisation.
 Watchdog cerberous;
@@ -90,16 +119,19 @@ void loop() {
   // Initialise the potentiometer variable to something that indicates an invalid reading.
   static int pot1Value = -1;
   // Initialise the DHT variables to something that indicates invalid readings.
-  //static float temperatureDHT11 = NAN;
-  //static float humidityDHT11    = NAN;
-  //static float temperatureDHT22 = NAN;
-  //static float humidityDHT22    = NAN;
+  static float temperatureDHT11 = NAN;
+  static float humidityDHT11    = NAN;
+  static float temperatureDHT22 = NAN;
+  static float humidityDHT22    = NAN;
   static char temperatureDHT11str[8] = "NAN";
   static char humidityDHT11str[8]    = "NAN";
   static char temperatureDHT22str[8] = "NAN";
   static char humidityDHT22str[8]    = "NAN";
   // Initialise the CRC8 checksum variable.
   byte chksumCRC8 = 0;
+  // The binary record and its sequence number.
+  static sensorRecord txRecord;
+  static byte txSequence = 0;
   // Record the current time. When a single timeNow is used for all jobs it ensures they are synchronised.
   unsigned long timeNow = millis();
   // Job variables. Set to timeNow so that jobs do not start immediately - this allows the sensors to settle.
@@ -119,33 +151,50 @@ void loop() {
   if (timeNow - timeMark2 >= JOB2CYCLE) {
     timeMark2 = timeNow;
     // Do something...   
-    //temperatureDHT11 = myDHT11.readTemperature();
-    //humidityDHT11 = myDHT11.readHumidity();
-    dtostrf(myDHT11.readTemperature(), 3, 2, temperatureDHT11str);  // The temperature is needed as a string.
-    dtostrf(myDHT11.readHumidity(),    3, 2, humidityDHT11str);     // The humidity is needed as a string.
+    temperatureDHT11 = myDHT11.readTemperature();
+    humidityDHT11 = myDHT11.readHumidity();
+    dtostrf(temperatureDHT11, 3, 2, temperatureDHT11str);  // The temperature is needed as a string.
+    dtostrf(humidityDHT11,    3, 2, humidityDHT11str);     // The humidity is needed as a string.
   }
   // Job 3 - Get the data: Read the DHT22 sensor.
   if (timeNow - timeMark3 >= JOB3CYCLE) {
     timeMark3 = timeNow;
     // Do something...
-    //temperatureDHT22 = myDHT22.readTemperature();
-    //humidityDHT22 = myDHT22.readHumidity();
-    dtostrf(myDHT22.readTemperature(), 3, 2, temperatureDHT22str);  // The temperature is needed as a string.
-    dtostrf(myDHT22.readHumidity(),    3, 2, humidityDHT22str);     // The humidity is needed as a string.
+    temperatureDHT22 = myDHT22.readTemperature();
+    humidityDHT22 = myDHT22.readHumidity();
+    dtostrf(temperatureDHT22, 3, 2, temperatureDHT22str);  // The temperature is needed as a string.
+    dtostrf(humidityDHT22,    3, 2, humidityDHT22str);     // The humidity is needed as a string.
   }
-  // Job 4 - Share the results: Output CSV data to the serial console.
+  // Job 4 - Share the results: Output CSV data, or a binary record, to the serial console.
   if (timeNow - timeMark4 >= JOB4CYCLE) {
     timeMark4 = timeNow;
     // Do something...
-    // Construct the sensor data string using the strings for the temperatures and humidities - sprintf does not support %f.
-    sprintf(txBuffer, "%d,%s,%s,%s,%s", pot1Value, temperatureDHT11str, humidityDHT11str, temperatureDHT22str, humidityDHT22str);
-    // Calculate the CRC8 checksum of the txBuffer.
-    chksumCRC8 = calcCRC8((byte*)txBuffer); // Cast the char array pointer to a byte array pointer.
-    // Print the results.
-    Serial.print(txBuffer);
-    // Add the CRC8 checksum to the end.
-    Serial.print("!");
-    Serial.println(chksumCRC8);
+    if (txMode == TXMODEBINARY) {
+      // Fill in the binary record, marking which readings are valid.
+      txRecord.sequence = txSequence++;
+      txRecord.validMask = 0;
+      txRecord.pot1Value = pot1Value;
+      if (pot1Value != -1) txRecord.validMask |= VALIDPOT1;
+      txRecord.temperatureDHT11 = scaleReading(temperatureDHT11, VALIDTDHT11, &txRecord.validMask);
+      txRecord.humidityDHT11    = scaleReading(humidityDHT11,    VALIDHDHT11, &txRecord.validMask);
+      txRecord.temperatureDHT22 = scaleReading(temperatureDHT22, VALIDTDHT22, &txRecord.validMask);
+      txRecord.humidityDHT22    = scaleReading(humidityDHT22,    VALIDHDHT22, &txRecord.validMask);
+      // Calculate the CRC8 checksum of the record, not including the checksum itself.
+      txRecord.chksumCRC8 = calcCRC8Length((byte*)&txRecord, sizeof(txRecord) - 1);
+      // COBS encode the record and send it, the 0x00 delimiter is already on the end.
+      Serial.write(txFrame, cobsEncode((byte*)&txRecord, sizeof(txRecord), txFrame));
+    }
+    else {
+      // Construct the sensor data string using the strings for the temperatures and humidities - sprintf does not support %f.
+      sprintf(txBuffer, "%d,%s,%s,%s,%s", pot1Value, temperatureDHT11str, humidityDHT11str, temperatureDHT22str, humidityDHT22str);
+      // Calculate the CRC8 checksum of the txBuffer.
+      chksumCRC8 = calcCRC8((byte*)txBuffer); // Cast the char array pointer to a byte array pointer.
+      // Print the results.
+      Serial.print(txBuffer);
+      // Add the CRC8 checksum to the end.
+      Serial.print("!");
+      Serial.println(chksumCRC8);
+    }
   }
   // Job 5 - Action commands: Parse and action any received serial commands.
   if (timeNow - timeMark5 >= JOB5CYCLE) {
@@ -162,8 +211,13 @@ void loop() {
         }
       }
       // Parse the command - NULL is returned if nothing is found by strtok().
-      char *subject = strtok(command, cmdDelimiter);  // A pointer to a NULL terminated part of the receive buffer.
-      char *action  = strtok(NULL, cmdDelimiter);     // A pointer to another NULL terminated part of the receive buffer.
+      // A cancelled command is not parsed at all, as strtok(NULL, ...) would carry on from the end of the checksum.
+      char *subject = NULL;                             // A pointer to a NULL terminated part of the receive buffer.
+      char *action  = NULL;                             // A pointer to another NULL terminated part of the receive buffer.
+      if (command != NULL) {
+        subject = strtok(command, cmdDelimiter);
+        action  = strtok(NULL, cmdDelimiter);
+      }
       #ifdef TESTSRX
         Serial.print("Command : ");
         if (subject != NULL) {
@@ -181,12 +235,31 @@ void loop() {
           Serial.println(chksum);
         }
         Serial.print("Exp CRC8: ");
-        Serial.println(calcCRC8((byte*)command)); // Cast the char array pointer to a byte array pointer.
+        if (command != NULL) {
+          Serial.println(calcCRC8((byte*)command)); // Cast the char array pointer to a byte array pointer.
+        }
       #endif
       // Lets action the command.
-      if (strcmp(subject, "rgbLEDs") == 0 and action != NULL) {
+      bool commandOK = false;
+      if (subject == NULL) {
+        // Refuse a command that failed the CRC8 check, or was empty, before anything else looks at it.
+        #ifdef COMMANDACKS
+          sendCommandAck("nak", NULL, NULL);
+        #endif
+      }
+      else if (strcmp(subject, "rgbLEDs") == 0 and action != NULL) {
         rgbLEDBank((byte)atoi(action)); // We have a recognised subject and an action for it. 
+        commandOK = atoi(action) >= 0 and atoi(action) <= 7;
+      }
+      else if (strcmp(subject, "txMode") == 0 and action != NULL) {
+        setTxMode((byte)atoi(action));  // The host wants to change the transmit mode.
       }
+      #ifdef COMMANDACKS
+        // Refuse a command that was not recognised. The txMode command acknowledges itself.
+        if (subject != NULL and strcmp(subject, "txMode") != 0) {
+          sendCommandAck(commandOK ? "ack" : "nak", subject, action);
+        }
+      #endif
       // All done, so clear the ready flag for the next command to be received.
       commandReady = false;
     }
@@ -251,6 +324,95 @@ void rgbLEDBank(byte action) {
   }
 }
 
+// Acknowledge a transmit mode change, in the current mode's framing, and then change to the new mode.
+void setTxMode(byte newTxMode) {
+  // Valid modes are text and binary, otherwise the requested mode is ignored.
+  if (newTxMode == TXMODETEXT or newTxMode == TXMODEBINARY) {
+    sprintf(txBuffer, "txMode=%d", newTxMode);
+    Serial.print(txBuffer);
+    Serial.print("!");
+    Serial.print(calcCRC8((byte*)txBuffer));
+    // The acknowledgement is terminated the way the host currently expects.
+    if (txMode == TXMODEBINARY) {
+      Serial.write((byte)0x00);
+    }
+    else {
+      Serial.println();
+    }
+    txMode = newTxMode;
+  }
+}
+
+// Acknowledge (ack) or refuse (nak) a received command, e.g. "ack=rgbLEDs,4!175", in the current transmit mode's framing.
+// A command that failed its CRC8 check is refused without a subject and action, as "nak=!177".
+void sendCommandAck(const char *ackType, const char *subject, const char *action) {
+  if (subject != NULL) {
+    snprintf(txBuffer, sizeof(txBuffer), "%s=%s,%s", ackType, subject, action != NULL ? action : "");
+  }
+  else {
+    snprintf(txBuffer, sizeof(txBuffer), "%s=", ackType);
+  }
+  Serial.print(txBuffer);
+  Serial.print("!");
+  Serial.print(calcCRC8((byte*)txBuffer));
+  if (txMode == TXMODEBINARY) {
+    Serial.write((byte)0x00);
+  }
+  else {
+    Serial.println();
+  }
+}
+
+// Scale a DHT reading into an int16 for the binary record, and set its validity bit if it is a number.
+int16_t scaleReading(float reading, byte validBit, uint8_t *validMask) {
+  if (isnan(reading)) {
+    return 0;
+  }
+  *validMask |= validBit;
+  return (int16_t)round(reading * READINGSCALE);
+}
+
+// COBS encode a block of data into a frame, so that the only 0x00 byte is the delimiter on the end. Returns the frame length.
+// The records are much shorter than 254 bytes, so the 0xFF long block code is never needed.
+byte cobsEncode(byte* dataBuffer, byte dataLength, byte* frameBuffer) {
+  byte codeIndex = 0;   // Where the current block's code byte is.
+  byte frameIndex = 1;  // Where the next data byte goes.
+  byte blockCode = 1;   // The offset to the next zero.
+  for (byte dataIndex = 0; dataIndex < dataLength; dataIndex++) {
+    if (dataBuffer[dataIndex] == 0) {
+      frameBuffer[codeIndex] = blockCode;
+      codeIndex = frameIndex++;
+      blockCode = 1;
+    }
+    else {
+      frameBuffer[frameIndex++] = dataBuffer[dataIndex];
+      blockCode++;
+    }
+  }
+  frameBuffer[codeIndex] = blockCode;
+  frameBuffer[frameIndex++] = 0x00; // The frame delimiter.
+  return frameIndex;
+}
+
+// Calculate the CRC8 checksum of a fixed length byte array, which may contain 0x00 bytes.
+byte calcCRC8Length(byte* dataBuffer, byte dataLength) {
+  // Initialise the CRC8 checksum.
+  byte chksumCRC8 = 0;
+  while (dataLength--) {
+    byte currentByte = *dataBuffer++; // Get the byte to be processed.
+    // Process each bit of the byte. 
+    for (byte bitCounter = 0; bitCounter < 8; bitCounter++) {
+        byte sum = (chksumCRC8 ^ currentByte) & 0x01;
+        chksumCRC8 >>= 1;
+        if (sum) {
+           chksumCRC8 ^= 0x8C;
+        }
+        currentByte >>= 1;
+     }
+  }
+  return chksumCRC8;
+}
+
 // Calculate the CRC8 checksum of a null terminated character array.
 // Based on the CRC8 formulas by Dallas/Maxim (GNU GPL 3.0 license).
 byte calcCRC8(byte* dataBuffer) {
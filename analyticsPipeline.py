@@ -0,0 +1,262 @@
+# Derived analytics for the Lesson 11 sensor data, worked out in a pool of worker processes, off the render thread.
+# The samples are written into batches in shared memory NumPy buffers, and only the batch slot and sample count are
+# sent to a worker, which runs every analytics plugin over the whole batch and writes the derived values back into
+# shared memory. The main loop never waits for a worker: it just hands over full (or old enough) batches, and picks up
+# whichever have finished, so its cost per sample stays the same however many plugins there are, or however slow.
+# A plugin is a module level function (so the workers can import it) that is given a batch as a dict of float arrays,
+# the timestamps and the five readings (NaN when missing), and returns a dict of derived arrays, one value per sample.
+# Plugins only ever see one batch, which may go to any worker, so they must not keep state between batches.
+
+# https://docs.python.org/3/library/multiprocessing.html#module-multiprocessing.pool
+# https://docs.python.org/3/library/multiprocessing.shared_memory.html
+# https://en.wikipedia.org/wiki/Dew_point#Calculating_the_dew_point
+# https://en.wikipedia.org/wiki/Median_absolute_deviation
+
+
+import sys
+import functools
+import time
+import queue
+import signal
+import warnings
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from sessionRecorder import sampleToNumbers
+from panelLayout import derivedChannels, derivedChannelNames
+
+# The columns of a batch, a timestamp and the five readings.
+batchColumns = ("timestamp", "pot1Value", "tDHT11", "hDHT11", "tDHT22", "hDHT22")
+
+# The dew point of each DHT sensor, from its temperature and humidity, with the Magnus formula.
+def dewPoint(batchReadings):
+    derivedValues = {}
+    for sensorName in ("DHT11", "DHT22"):
+        (temperatures, humidities) = (batchReadings["t" + sensorName], batchReadings["h" + sensorName])
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            gamma = np.log(humidities / 100) + 17.62 * temperatures / (243.12 + temperatures)
+            derivedValues["dewPoint" + sensorName] = np.where(humidities > 0, 243.12 * gamma / (17.62 - gamma), np.nan)
+    return derivedValues
+
+# The DHT11 and DHT22 should agree to within their combined accuracies (+/-2C and +/-0.5C, +/-5%RH and +/-2%RH).
+# The drift is the DHT11 reading less the DHT22 reading, and the alarm is 1 when the median drift of the batch is
+# outside the combined accuracy for the temperatures or the humidities, 0 when it is inside for every one of them with
+# readings, or NaN when neither the temperatures nor the humidities have a sample with readings from both sensors.
+def sensorDrift(batchReadings):
+    derivedValues = {}
+    readingAlarms = [] # The alarm of each reading with drifts, worked out on its own.
+    for (readingName, driftTolerance) in (("t", 2.5), ("h", 7.0)):
+        readingDrift = batchReadings[readingName + "DHT11"] - batchReadings[readingName + "DHT22"]
+        derivedValues[readingName + "Drift"] = readingDrift
+        if not np.all(np.isnan(readingDrift)):
+            readingAlarms.append(abs(np.nanmedian(readingDrift)) > driftTolerance)
+    derivedValues["driftAlarm"] = np.full(len(batchReadings["timestamp"]), float(any(readingAlarms)) if readingAlarms else np.nan)
+    return derivedValues
+
+# How unusual each sample is, the largest robust z-score (distance from the median in scaled median absolute deviations)
+# of its readings within the batch. The MAD is taken as at least 0.1, the finest resolution of the readings, so readings
+# that sit still do not make every small change look like an anomaly.
+def anomalyScore(batchReadings):
+    readings = np.column_stack([batchReadings[columnName] for columnName in batchColumns[1:]])
+    if np.all(np.isnan(readings)):
+        return {"anomalyScore": np.full(len(readings), np.nan)}
+    with np.errstate(invalid = "ignore", divide = "ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning) # The median of a channel with no readings is NaN.
+        readingMedians = np.nanmedian(readings, axis = 0)
+        readingMADs = 1.4826 * np.nanmedian(np.abs(readings - readingMedians), axis = 0)
+        zScores = np.abs(readings - readingMedians) / np.maximum(readingMADs, 0.1)
+        return {"anomalyScore": np.nanmax(np.where(np.isnan(zScores), -np.inf, zScores), axis = 1).clip(0)}
+
+# The plugins, by name, and the derived values each one makes, as named in panelLayout.py for the meters.
+analyticsPlugins = {"dewPoint": (dewPoint, derivedChannels["dewPoint"]),
+                    "sensorDrift": (sensorDrift, derivedChannels["sensorDrift"]),
+                    "anomalyScore": (anomalyScore, derivedChannels["anomalyScore"])}
+
+# The shared memory buffers and plugins of a worker process, set up once when it starts.
+workerState = {}
+
+def attachWorker(inputName, outputName, inputShape, outputShape, pluginSpecs):
+    # Ctrl+C is for the main process, which stops the workers itself.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for (bufferName, shmName, bufferShape) in (("inputs", inputName, inputShape), ("outputs", outputName, outputShape)):
+        sharedBuffer = shared_memory.SharedMemory(name = shmName)
+        workerState[bufferName + "Memory"] = sharedBuffer
+        workerState[bufferName] = np.ndarray(bufferShape, dtype = np.float64, buffer = sharedBuffer.buf)
+    workerState["plugins"] = pluginSpecs
+
+# Run every plugin over a batch, in a worker process. Returns the slot, so the main process knows which batch is done.
+def analyseBatch(slotIndex, sampleCount):
+    batch = workerState["inputs"][slotIndex, :sampleCount]
+    batchReadings = {columnName: batch[:, columnIndex] for (columnIndex, columnName) in enumerate(batchColumns)}
+    batchReadings["pot1Value"] = np.where(batchReadings["pot1Value"] == -1, np.nan, batchReadings["pot1Value"])
+    outputs = workerState["outputs"][slotIndex, :sampleCount]
+    outputIndex = 0
+    for (pluginFunction, derivedNames) in workerState["plugins"]:
+        derivedValues = pluginFunction(batchReadings)
+        for derivedName in derivedNames:
+            outputs[:, outputIndex] = derivedValues[derivedName]
+            outputIndex += 1
+    return slotIndex
+
+class analyticsPipeline():
+    #  plugins      The plugins to run, by name (see analyticsPlugins) or as (function, derivedNames).
+    #  workerCount  The number of worker processes.
+    #  batchSize    The most samples in a batch.
+    #  slotCount    The number of batches that can be in shared memory at once, being filled, worked on or waiting to be read.
+    #  maxBatchAge  Seconds before a batch that is not full is sent anyway, so slow data still gets its derived values.
+    #  importMain   Workers started by spawn (e.g. on Windows) normally import the main script again. Lesson11.py has
+    #               no __main__ guard, so by default they do not. Set True for plugins that live in a guarded main script.
+    def __init__(self, plugins = tuple(analyticsPlugins), workerCount = 2, batchSize = 64, slotCount = 8, maxBatchAge = 0.5, importMain = False):
+        self.pluginSpecs = [analyticsPlugins[plugin] if isinstance(plugin, str) else plugin for plugin in plugins]
+        self.derivedNames = tuple(derivedName for (pluginFunction, derivedNames) in self.pluginSpecs for derivedName in derivedNames)
+        self.workerCount = workerCount
+        self.batchSize = batchSize
+        self.slotCount = slotCount
+        self.maxBatchAge = maxBatchAge
+        self.importMain = importMain
+        self.workerPool = None
+        # An optional function that is given the timestamps and derived values (a samples x derivedNames array) of every
+        # finished batch, e.g. to log them.
+        self.onResults = None
+        self.latest = None              # The derived values of the newest sample, by name, as poll() returns them.
+        self.finishedSlots = queue.SimpleQueue()
+        self.failedSlots = queue.SimpleQueue()
+        # Counters.
+        self.samplesSubmitted = 0
+        self.droppedSamples = 0         # Samples that arrived while every slot was busy.
+        self.batchesSent = 0
+        self.batchesDone = 0
+        self.workerErrors = 0
+        self.lastError = None
+    # Make the shared memory buffers and start the worker processes.
+    def start(self):
+        inputShape = (self.slotCount, self.batchSize, len(batchColumns))
+        outputShape = (self.slotCount, self.batchSize, max(len(self.derivedNames), 1))
+        self.inputMemory = shared_memory.SharedMemory(create = True, size = int(np.prod(inputShape)) * 8)
+        self.outputMemory = shared_memory.SharedMemory(create = True, size = int(np.prod(outputShape)) * 8)
+        self.inputs = np.ndarray(inputShape, dtype = np.float64, buffer = self.inputMemory.buf)
+        self.outputs = np.ndarray(outputShape, dtype = np.float64, buffer = self.outputMemory.buf)
+        # Spawned workers, unlike forked ones, do not inherit the threads (serial readers, vPython) of this process.
+        # They are all started here, and only restarted if one dies.
+        mainModule = sys.modules["__main__"]
+        mainFile = getattr(mainModule, "__file__", None)
+        if mainFile is not None and not self.importMain:
+            del mainModule.__file__
+        try:
+            self.workerPool = multiprocessing.get_context("spawn").Pool(self.workerCount, attachWorker,
+                              (self.inputMemory.name, self.outputMemory.name, inputShape, outputShape, self.pluginSpecs))
+        finally:
+            if mainFile is not None and not self.importMain:
+                mainModule.__file__ = mainFile
+        self.freeSlots = list(range(self.slotCount - 1, 0, -1))
+        self.fillSlot = 0
+        self.fillCount = 0
+        self.fillStart = None
+        self.slotCounts = [0] * self.slotCount       # The number of samples in the batch in each slot.
+        self.slotSequence = [0] * self.slotCount     # The order the batches were sent in, they may finish in any order.
+        self.batchSequence = 0
+        self.latestSequence = -1
+        return self
+    # Add a sample, with the usual "-1" and "NAN" markers, to the batch being filled. This never waits for a worker.
+    def submit(self, sample, timestamp = None):
+        self.samplesSubmitted += 1
+        if self.fillSlot is None:
+            # Every slot is busy, so try to free one up, or drop the sample.
+            self.collect()
+            if self.fillSlot is None:
+                self.droppedSamples += 1
+                return False
+        if self.fillCount == 0:
+            self.fillStart = time.monotonic()
+        self.inputs[self.fillSlot, self.fillCount] = (time.monotonic() if timestamp is None else timestamp,) + sampleToNumbers(sample)
+        self.fillCount += 1
+        if self.fillCount == self.batchSize:
+            self.sendBatch()
+        return True
+    # Hand the batch being filled over to a worker, and start filling the next free slot.
+    def sendBatch(self):
+        if self.fillSlot is None or self.fillCount == 0:
+            return
+        self.batchSequence += 1
+        self.slotSequence[self.fillSlot] = self.batchSequence
+        self.workerPool.apply_async(analyseBatch, (self.fillSlot, self.fillCount), callback = self.finishedSlots.put,
+                                    error_callback = functools.partial(self.workerFailed, self.fillSlot))
+        self.slotCounts[self.fillSlot] = self.fillCount
+        self.batchesSent += 1
+        self.fillSlot = self.freeSlots.pop() if self.freeSlots else None
+        self.fillCount = 0
+    # Called in the pool's result thread if a plugin raised an exception. The batch has no derived values, but its slot is
+    # freed by the next collect(), so a plugin that keeps failing never uses up the slots.
+    def workerFailed(self, slotIndex, err):
+        self.workerErrors += 1
+        self.lastError = err
+        self.failedSlots.put(slotIndex)
+    # Read the derived values of the finished batches, and free their slots, and the slots of any failed batches.
+    def collect(self):
+        while True:
+            try:
+                self.freeSlot(self.failedSlots.get_nowait())
+            except queue.Empty:
+                break
+        while True:
+            try:
+                slotIndex = self.finishedSlots.get_nowait()
+            except queue.Empty:
+                break
+            sampleCount = self.slotCounts[slotIndex]
+            if self.slotSequence[slotIndex] > self.latestSequence:
+                self.latestSequence = self.slotSequence[slotIndex]
+                self.latest = {derivedName: "NAN" if derivedValue != derivedValue else derivedValue
+                               for (derivedName, derivedValue) in zip(self.derivedNames, self.outputs[slotIndex, sampleCount - 1].tolist())}
+            if self.onResults is not None:
+                self.onResults(self.inputs[slotIndex, :sampleCount, 0].copy(), self.outputs[slotIndex, :sampleCount, :len(self.derivedNames)].copy())
+            self.batchesDone += 1
+            self.freeSlot(slotIndex)
+    def freeSlot(self, slotIndex):
+        if self.fillSlot is None:
+            self.fillSlot = slotIndex
+        else:
+            self.freeSlots.append(slotIndex)
+    # Send the batch being filled if it is old enough, collect the finished batches, and return the derived values of the
+    # newest sample (by name, "NAN" if missing) if there are any new ones, otherwise None. Call it once per frame.
+    def poll(self):
+        if self.fillCount and time.monotonic() - self.fillStart >= self.maxBatchAge:
+            self.sendBatch()
+        latestSequence = self.latestSequence
+        self.collect()
+        return self.latest if self.latestSequence != latestSequence else None
+    # Send the batch being filled, and wait (up to timeout seconds) for every batch to finish.
+    def drain(self, timeout = 10.0):
+        self.sendBatch()
+        timeEnd = time.monotonic() + timeout
+        while self.batchesDone + self.workerErrors < self.batchesSent and time.monotonic() < timeEnd:
+            time.sleep(0.001)
+            self.collect()
+        return self.batchesDone + self.workerErrors == self.batchesSent
+    # Stop the workers and free the shared memory.
+    def stop(self):
+        if self.workerPool is None:
+            return
+        self.workerPool.terminate()
+        self.workerPool.join()
+        self.workerPool = None
+        del self.inputs, self.outputs
+        for sharedBuffer in (self.inputMemory, self.outputMemory):
+            sharedBuffer.close()
+            sharedBuffer.unlink()
+    def stats(self):
+        return {"samplesSubmitted": self.samplesSubmitted, "droppedSamples": self.droppedSamples, "batchesSent": self.batchesSent,
+                "batchesDone": self.batchesDone, "workerErrors": self.workerErrors}
+
+# Append the timestamp and derived values of every sample to a CSV file, a batch at a time, as an analyticsPipeline.onResults function.
+class analyticsLog():
+    def __init__(self, logPath = "lesson11-analytics.csv", derivedNames = derivedChannelNames):
+        self.logFile = open(logPath, "a")
+        if self.logFile.tell() == 0:
+            self.logFile.write(",".join(("timestamp",) + tuple(derivedNames)) + "\n")
+    def write(self, timestamps, derivedValues):
+        np.savetxt(self.logFile, np.column_stack((timestamps, derivedValues)), fmt = ["%.3f"] + ["%.6g"] * derivedValues.shape[1], delimiter = ",")
+    def close(self):
+        self.logFile.close()
+
+# EOF
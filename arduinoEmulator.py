@@ -0,0 +1,172 @@
+# A stand in for the TTB-AP-Lesson11 Arduino sketch, for benchmarking and testing without the real thing.
+# The emulator owns one end of a pty pair and writes sensor packets to it at a set rate, in the sketch's CSV text
+# format ("512,21.00,45.00,NAN,NAN!123\r\n") or as COBS framed binary records. The other end of the pty is opened
+# like any other serial port, e.g. serialReader(serial.Serial(emulator.portName)) or LESSON11_PORT=<portName>.
+# Missing DHT readings (NAN) and corrupted packets can be mixed in, and it answers the txMode and rgbLEDs commands.
+# Like the sketch built with COMMANDACKS, it can acknowledge (or refuse) every command, and lose some of those replies.
+# It can also go silent for a while part way through a packet, as if its cable had been pulled, to test reconnecting.
+
+# https://docs.python.org/3/library/pty.html
+
+
+import os
+import pty
+import tty
+import time
+import select
+import threading
+import numpy as np
+from crc8Engine import calcCRC8
+from binaryProtocol import txModeText, txModeBinary, frameDelimiters, cobsEncode, packSensorRecord
+
+class arduinoEmulator(threading.Thread):
+    def __init__(self, sampleRate = 10, sampleCount = None, nanRate = 0.0, corruptionRate = 0.0, txMode = txModeText, randomSeed = 11, commandAcks = False, ackLossRate = 0.0):
+        threading.Thread.__init__(self, name = "arduinoEmulator", daemon = True)
+        self.sampleRate = sampleRate            # Packets per second, 0 for as fast as the pty will take them.
+        self.sampleCount = sampleCount          # Stop after this many packets, None to keep going.
+        self.nanRate = nanRate                  # The chance of each DHT reading being NAN.
+        self.corruptionRate = corruptionRate    # The chance of a packet having one of its bytes changed.
+        self.txMode = txMode
+        self.commandAcks = commandAcks          # Acknowledge every command with "ack=subject,action", or refuse it with "nak=...".
+        self.ackLossRate = ackLossRate          # The chance of an acknowledgement being lost.
+        self.rng = np.random.default_rng(randomSeed)
+        (self.masterPort, self.slavePort) = pty.openpty()
+        tty.setraw(self.slavePort)
+        self.portName = os.ttyname(self.slavePort)
+        self.running = threading.Event()
+        self.rxBuffer = bytearray()
+        # The sensor readings wander about, like the real ones.
+        self.pot1Value = 512
+        self.readings = [21.0, 45.0, 20.8, 47.3]
+        self.sequence = 0
+        self.rgbLEDs = 0
+        self.silentUntil = 0.0                  # The perf_counter time until which the packets are lost, see dropLink().
+        self.truncateNext = False
+        # Counters, and when each packet was written (perf_counter seconds), in order.
+        self.packetsSent = 0
+        self.corruptedPackets = 0
+        self.nanReadings = 0
+        self.packetsLost = 0
+        self.commandsReceived = {}
+        self.acksSent = 0
+        self.naksSent = 0
+        self.writeTimes = []
+    # Make the next sensor packet, already framed for the current transmit mode.
+    def nextPacket(self):
+        self.pot1Value = int(np.clip(self.pot1Value + self.rng.integers(-8, 9), 0, 1023))
+        self.readings = [reading + self.rng.normal(0, 0.05) for reading in self.readings]
+        dhtReadings = []
+        for reading in self.readings:
+            if self.nanRate and self.rng.random() < self.nanRate:
+                dhtReadings.append("NAN")
+                self.nanReadings += 1
+            else:
+                dhtReadings.append(round(reading, 2))
+        if self.txMode == txModeBinary:
+            sensorPacket = cobsEncode(packSensorRecord(self.sequence, self.pot1Value, *dhtReadings)) + frameDelimiters[txModeBinary]
+        else:
+            # The sketch uses dtostrf(reading, 3, 2) for the readings.
+            sensorData = ",".join([str(self.pot1Value)] + [dhtReading if dhtReading == "NAN" else "%3.2f" % dhtReading for dhtReading in dhtReadings])
+            sensorPacket = ("%s!%d\r\n" % (sensorData, calcCRC8(sensorData))).encode()
+        self.sequence = (self.sequence + 1) & 0xff
+        if self.corruptionRate and self.rng.random() < self.corruptionRate:
+            # Flip one bit, but never in (or into) the frame delimiter or the CR, so the corruption stays inside this one packet.
+            sensorPacket = bytearray(sensorPacket)
+            byteIndex = int(self.rng.integers(0, len(sensorPacket) - len(frameDelimiters[self.txMode]) - (self.txMode == txModeText)))
+            corruptByte = sensorPacket[byteIndex]
+            while corruptByte == sensorPacket[byteIndex] or corruptByte in (0x00, 0x0a, 0x0d):
+                corruptByte = sensorPacket[byteIndex] ^ (1 << int(self.rng.integers(0, 8)))
+            sensorPacket[byteIndex] = corruptByte
+            sensorPacket = bytes(sensorPacket)
+            self.corruptedPackets += 1
+        return sensorPacket
+    # Act on any complete commands the host has sent, e.g. b"rgbLEDs=4!146\n" or b"txMode=1!31\n".
+    def readCommands(self):
+        while select.select([self.masterPort], [], [], 0)[0]:
+            self.rxBuffer += os.read(self.masterPort, 1024)
+        commandLines = self.rxBuffer.split(b"\n")
+        self.rxBuffer = commandLines.pop()
+        for commandLine in commandLines:
+            (arduinoCmd, chksumSep, chksumCRC8) = bytes(commandLine).strip().partition(b"!")
+            if chksumCRC8 and (not chksumCRC8.isdigit() or calcCRC8(arduinoCmd) != int(chksumCRC8)):
+                # Cancel the command if the CRC8 checksum has failed, as the sketch does.
+                if self.commandAcks:
+                    self.sendAck("nak=")
+                continue
+            (subject, actionSep, action) = arduinoCmd.decode("latin-1").partition("=")
+            self.commandsReceived[subject] = self.commandsReceived.get(subject, 0) + 1
+            if subject == "txMode" and action.isdigit() and int(action) in frameDelimiters:
+                # Acknowledge in the current framing, then change mode, as setTxMode() in the sketch does.
+                self.sendAck("txMode=%d" % int(action))
+                self.txMode = int(action)
+                continue
+            commandOK = subject == "rgbLEDs" and action.isdigit() and int(action) <= 7
+            if commandOK:
+                self.rgbLEDs = int(action)
+            if self.commandAcks:
+                self.sendAck("%s=%s,%s" % ("ack" if commandOK else "nak", subject, action))
+    # Send an acknowledgement in the current framing, unless it is lost on the way.
+    def sendAck(self, ackCommand = ""):
+        if ackCommand.startswith(("ack=", "nak=")):
+            if self.ackLossRate and self.rng.random() < self.ackLossRate:
+                return
+            if ackCommand.startswith("ack="):
+                self.acksSent += 1
+            else:
+                self.naksSent += 1
+        ackTerminator = frameDelimiters[txModeBinary] if self.txMode == txModeBinary else b"\r\n"
+        os.write(self.masterPort, ("%s!%d" % (ackCommand, calcCRC8(ackCommand))).encode() + ackTerminator)
+    # Send half of the next packet, then lose the packets for a while, as if the cable had been pulled.
+    def dropLink(self, silentSeconds = 1.0):
+        self.silentUntil = time.perf_counter() + silentSeconds
+        self.truncateNext = True
+    def run(self):
+        self.running.set()
+        timeNext = time.perf_counter()
+        while self.running.is_set() and (self.sampleCount is None or self.packetsSent < self.sampleCount):
+            if self.sampleRate:
+                waitTime = timeNext - time.perf_counter()
+                if waitTime > 0:
+                    time.sleep(waitTime)
+                timeNext += 1 / self.sampleRate
+            self.readCommands()
+            sensorPacket = self.nextPacket()
+            if self.truncateNext or time.perf_counter() < self.silentUntil:
+                if self.truncateNext:
+                    os.write(self.masterPort, sensorPacket[:len(sensorPacket) // 2])
+                    self.truncateNext = False
+                self.packetsLost += 1
+                continue
+            self.writeTimes.append(time.perf_counter())
+            try:
+                os.write(self.masterPort, sensorPacket)
+            except OSError:
+                break
+            self.packetsSent += 1
+        self.running.clear()
+    def stop(self, timeout = 1):
+        self.running.clear()
+        if self.is_alive():
+            self.join(timeout)
+    def close(self):
+        self.stop()
+        os.close(self.masterPort)
+        os.close(self.slavePort)
+    def stats(self):
+        return {"packetsSent": self.packetsSent, "corruptedPackets": self.corruptedPackets, "nanReadings": self.nanReadings, "packetsLost": self.packetsLost, "commandsReceived": dict(self.commandsReceived),
+                "acksSent": self.acksSent, "naksSent": self.naksSent}
+
+# Run an emulated Arduino until stopped, e.g. to run Lesson11.py against it with LESSON11_PORT set to the port it prints.
+if __name__ == "__main__":
+    emulatedArduino = arduinoEmulator(sampleRate = 10)
+    print("Emulated Arduino on %s" % emulatedArduino.portName)
+    emulatedArduino.start()
+    try:
+        while emulatedArduino.is_alive():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    emulatedArduino.close()
+    print(emulatedArduino.stats())
+
+# EOF
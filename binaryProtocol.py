@@ -0,0 +1,193 @@
+# The optional binary wire protocol for the Lesson 11 meter panel.
+# Each sensor sample is a fixed layout little endian record, CRC8 checked and framed with COBS, so a 0x00 byte only
+# ever appears at the end of a frame. A record is 13 bytes (15 on the wire) instead of the ~35 bytes of the CSV text.
+
+# https://en.wikipedia.org/wiki/Consistent_Overhead_Byte_Stuffing
+# https://docs.python.org/3/library/struct.html
+
+#  Offset Type    Field
+#  0      uint8   Sequence number, incremented for every record.
+#  1      uint8   Validity bitmask, see the valid* bits below.
+#  2      int16   Potentiometer 1 raw ADC value, 0 - 1023.
+#  4      int16   DHT11 temperature x 100.
+#  6      int16   DHT11 humidity x 100.
+#  8      int16   DHT22 temperature x 100.
+#  10     int16   DHT22 humidity x 100.
+#  12     uint8   CRC8 (Dallas/Maxim) of bytes 0 - 11.
+
+
+import struct
+import numpy as np
+from crc8Engine import calcCRC8, calcCRC8Rows
+
+# The transmit modes, as used by the Arduino "txMode" command.
+txModeText = 0
+txModeBinary = 1
+
+# The frame delimiters for each transmit mode.
+frameDelimiters = {txModeText: b"\n", txModeBinary: b"\x00"}
+
+# Validity bitmask bits.
+validPot1 = 0x01
+validTDHT11 = 0x02
+validHDHT11 = 0x04
+validTDHT22 = 0x08
+validHDHT22 = 0x10
+
+# The DHT readings are sent as scaled int16 values.
+readingScale = 100
+
+# The record layout, and the same layout as a NumPy dtype for decoding whole blocks of records at once.
+recordStruct = struct.Struct("<BBhhhhhB")
+# A record is always one COBS code byte longer on the wire, as it is shorter than a full 254 byte block.
+recordFrameSize = recordStruct.size + 1
+# The start of every frame that is not a sensor record, the Arduino's replies, which are CRC8 signed text. A record frame
+# always starts with a COBS code byte, 1 - recordFrameSize, never a letter.
+replyPrefixes = (b"txMode=", b"ack=", b"nak=")
+recordDType = np.dtype([("sequence", "u1"), ("validMask", "u1"), ("pot1Value", "<i2"), ("tDHT11", "<i2"), ("hDHT11", "<i2"), ("tDHT22", "<i2"), ("hDHT22", "<i2"), ("chksumCRC8", "u1")])
+
+# COBS encode a block of data. The returned frame has no zero bytes and does not include the 0x00 delimiter.
+def cobsEncode(rawData = b""):
+    cobsFrame = bytearray([0])
+    codeIndex = 0   # Where the current block's code byte is.
+    blockCode = 1   # The offset to the next zero, or the block length plus one.
+    for dataByte in rawData:
+        if dataByte == 0:
+            cobsFrame[codeIndex] = blockCode
+            codeIndex = len(cobsFrame)
+            cobsFrame.append(0)
+            blockCode = 1
+        else:
+            cobsFrame.append(dataByte)
+            blockCode += 1
+            if blockCode == 0xff: # A full block of 254 non-zero bytes.
+                cobsFrame[codeIndex] = blockCode
+                codeIndex = len(cobsFrame)
+                cobsFrame.append(0)
+                blockCode = 1
+    cobsFrame[codeIndex] = blockCode
+    return bytes(cobsFrame)
+
+# COBS decode a frame (without its 0x00 delimiter). Returns None if the frame is not valid COBS.
+def cobsDecode(cobsFrame = b""):
+    rawData = bytearray()
+    frameIndex = 0
+    frameLength = len(cobsFrame)
+    while frameIndex < frameLength:
+        blockCode = cobsFrame[frameIndex]
+        blockEnd = frameIndex + blockCode
+        if blockCode == 0 or blockEnd > frameLength:
+            return None
+        rawData += cobsFrame[frameIndex + 1:blockEnd]
+        frameIndex = blockEnd
+        if blockCode < 0xff and frameIndex < frameLength:
+            rawData.append(0)
+    return rawData
+
+# Build a binary record from sensor values, as the Arduino does. Invalid readings are passed as "-1" or "NAN", or NaN.
+def packSensorRecord(sequence = 0, pot1Value = "-1", tDHT11 = "NAN", hDHT11 = "NAN", tDHT22 = "NAN", hDHT22 = "NAN"):
+    validMask = 0
+    scaledValues = []
+    for (validBit, dhtReading) in ((validTDHT11, tDHT11), (validHDHT11, hDHT11), (validTDHT22, tDHT22), (validHDHT22, hDHT22)):
+        if dhtReading != "NAN" and dhtReading == dhtReading: # NaN is not equal to itself.
+            validMask |= validBit
+            scaledValues.append(int(round(dhtReading * readingScale)))
+        else:
+            scaledValues.append(0)
+    if pot1Value != "-1" and pot1Value != -1:
+        validMask |= validPot1
+    else:
+        pot1Value = 0
+    recordData = recordStruct.pack(sequence & 0xff, validMask, int(pot1Value), *scaledValues, 0)[:-1]
+    return recordData + bytes([calcCRC8(recordData)])
+
+# Convert a received binary frame (without its 0x00 delimiter) into sensor values, the same as parseSensorPacket() does for text.
+# None is returned if the frame fails its COBS decode, length or CRC8 checks.
+# Only a frame of exactly recordFrameSize bytes can hold a record, so instead of a general cobsDecode(), the chain of code
+# bytes, each the offset to the next, is followed through a copy of the record bytes, putting back a 0x00 for each one.
+def parseBinaryPacket(cobsFrame = b""):
+    if len(cobsFrame) != recordFrameSize:
+        return None
+    recordData = bytearray(cobsFrame[1:])
+    codeIndex = cobsFrame[0]
+    while codeIndex < recordFrameSize:
+        recordData[codeIndex - 1] = 0
+        codeIndex += cobsFrame[codeIndex]
+    # A chain that runs past the end of the frame is not valid COBS. The CRC8 of a whole record, including its own
+    # checksum, is always 0 if the record is intact.
+    if codeIndex != recordFrameSize or calcCRC8(recordData) != 0:
+        return None
+    (sequence, validMask, pot1Value, tDHT11, hDHT11, tDHT22, hDHT22, chksumCRC8) = recordStruct.unpack_from(recordData)
+    # Invalid readings use the same "-1" and "NAN" markers as the text protocol.
+    return (pot1Value if validMask & validPot1 else "-1",
+            tDHT11 / readingScale if validMask & validTDHT11 else "NAN",
+            hDHT11 / readingScale if validMask & validHDHT11 else "NAN",
+            tDHT22 / readingScale if validMask & validTDHT22 else "NAN",
+            hDHT22 / readingScale if validMask & validHDHT22 else "NAN")
+
+# Decode a block of COBS frames in one go into a NumPy structured array of the valid records, with float64 readings.
+# Invalid readings are NaN (and -1 for the potentiometer), and frames that fail their COBS decode, length or CRC8 checks
+# are left out. Only a frame of exactly recordFrameSize bytes can hold a record, so all the frames are COBS decoded
+# together, by following the chain of code bytes, each the offset to the next, one step at a time for every frame at once.
+def decodeRecordBlock(cobsFrames = ()):
+    frameBlock = b"".join(cobsFrame for cobsFrame in cobsFrames if len(cobsFrame) == recordFrameSize)
+    frameBytes = np.frombuffer(frameBlock, dtype = np.uint8).reshape(-1, recordFrameSize)
+    rawBytes = frameBytes[:, 1:].copy()
+    frameRows = np.arange(len(frameBytes))
+    codeIndex = frameBytes[:, 0].astype(np.intp)
+    inFrame = codeIndex < recordFrameSize
+    while inFrame.any():
+        # Every code byte inside the frame stands for a 0x00 in the record.
+        (chainRows, chainIndex) = (frameRows[inFrame], codeIndex[inFrame])
+        rawBytes[chainRows, chainIndex - 1] = 0
+        codeIndex[inFrame] = chainIndex + frameBytes[chainRows, chainIndex]
+        inFrame = codeIndex < recordFrameSize
+    # A chain that runs past the end of its frame is not valid COBS. Check all the CRC8 checksums together too - the CRC8
+    # of an intact record, including its own checksum, is 0.
+    rawBytes = rawBytes[codeIndex == recordFrameSize]
+    rawRecords = rawBytes.view(recordDType).reshape(-1)[calcCRC8Rows(rawBytes) == 0]
+    sensorRecords = np.empty(len(rawRecords), dtype = [("sequence", "u1"), ("pot1Value", "i2"), ("tDHT11", "f8"), ("hDHT11", "f8"), ("tDHT22", "f8"), ("hDHT22", "f8")])
+    sensorRecords["sequence"] = rawRecords["sequence"]
+    sensorRecords["pot1Value"] = np.where(rawRecords["validMask"] & validPot1, rawRecords["pot1Value"], -1)
+    for (fieldName, validBit) in (("tDHT11", validTDHT11), ("hDHT11", validHDHT11), ("tDHT22", validTDHT22), ("hDHT22", validHDHT22)):
+        sensorRecords[fieldName] = np.where(rawRecords["validMask"] & validBit, rawRecords[fieldName] / readingScale, np.nan)
+    return sensorRecords
+
+# Decode a block of COBS frames in one go into sensor values, the same as parseBinaryPacket() gives for each frame that is valid.
+def decodeRecordSamples(cobsFrames = ()):
+    return [(pot1Value if pot1Value != -1 else "-1",
+             tDHT11 if tDHT11 == tDHT11 else "NAN", hDHT11 if hDHT11 == hDHT11 else "NAN", # NaN is not equal to itself.
+             tDHT22 if tDHT22 == tDHT22 else "NAN", hDHT22 if hDHT22 == hDHT22 else "NAN")
+            for (sequence, pot1Value, tDHT11, hDHT11, tDHT22, hDHT22) in decodeRecordBlock(cobsFrames).tolist()]
+
+# Build the CRC8 signed command that asks the Arduino to change its transmit mode.
+def txModeCommand(txMode = txModeText):
+    arduinoCmd = "txMode=%d" % txMode
+    return "%s!%d\n" % (arduinoCmd, calcCRC8(arduinoCmd))
+
+# Check if a received frame is the Arduino's acknowledgement of a transmit mode change, e.g. b"txMode=1!31\r".
+# Returns the new transmit mode, or None if it is not a valid acknowledgement.
+def parseTxModeAck(rxFrame = b""):
+    if not rxFrame.startswith(b"txMode="):
+        return None
+    (ackCommand, chksumSep, chksumCRC8) = bytes(rxFrame).rstrip(b"\r\n").partition(b"!")
+    if not chksumCRC8.isdigit() or calcCRC8(ackCommand) != int(chksumCRC8):
+        return None
+    txMode = ackCommand[len(b"txMode="):]
+    if not txMode.isdigit() or int(txMode) not in frameDelimiters:
+        return None
+    return int(txMode)
+
+# Check if a received frame is the Arduino acknowledging (ACK) or refusing (NAK) a command, e.g. b"ack=rgbLEDs,4!175\r".
+# A sketch built with COMMANDACKS answers every command this way, and sends b"nak=" on its own for a failed CRC8 check.
+# Returns (acknowledged, subject, action), with None for the subject and action of a bare NAK, or None if it is neither.
+def parseCommandAck(rxFrame = b""):
+    if not rxFrame.startswith((b"ack=", b"nak=")):
+        return None
+    (ackCommand, chksumSep, chksumCRC8) = bytes(rxFrame).rstrip(b"\r\n").partition(b"!")
+    if not chksumCRC8.isdigit() or calcCRC8(ackCommand) != int(chksumCRC8):
+        return None
+    (subject, actionSep, action) = ackCommand[4:].decode("latin-1").partition(",")
+    return (ackCommand.startswith(b"ack"), subject or None, action if actionSep else None)
+
+# EOF
@@ -0,0 +1,142 @@
+# Columnar export of Lesson 11 sensor data, for analysing days of readings offline, see sessionAnalytics.py.
+# The samples are collected into a fixed size chunk of records, and every full chunk is written out as one NumPy .npy
+# file per column (timestamp, crcOK and the five sensor readings), in one large sequential write each, so the memory
+# used never grows past one chunk however long the export runs. An index file lists the chunks, with their record
+# counts, time ranges and clock offsets, and is only replaced once a chunk has been completely written. An export
+# directory can be added to by later runs, and the monotonic timestamps of each run are turned into wall clock times
+# with that run's clock offset. With pyarrow, an export can also be converted into a Parquet file, a row group per chunk.
+
+# https://numpy.org/doc/stable/reference/generated/numpy.lib.format.html
+# https://arrow.apache.org/docs/python/parquet.html
+
+#  Export directory layout:
+#  index.json             The format, the columns (and their dtypes), and the chunks, in order.
+#  000000-timestamp.npy   The columns of the first chunk, one file each.
+#  000000-pot1Value.npy   ...
+
+
+import os
+import sys
+import json
+import time
+import numpy as np
+from sessionRecorder import sessionDType, sampleToNumbers, openSession
+
+exportFormat = "L11COL01"
+indexFileName = "index.json"
+# The columns, in the same order and with the same dtypes as a session record.
+exportColumns = sessionDType.names
+
+# The path of a column file of a chunk.
+def columnPath(exportDir, chunkIndex, columnName):
+    return os.path.join(exportDir, "%06d-%s.npy" % (chunkIndex, columnName))
+
+# Read the index of an export directory.
+def readIndex(exportDir):
+    with open(os.path.join(exportDir, indexFileName), "r") as indexFile:
+        exportIndex = json.load(indexFile)
+    if exportIndex.get("format") != exportFormat:
+        raise ValueError("%s is not a Lesson 11 column export" % exportDir)
+    return exportIndex
+
+# Stream sensor samples into a directory of chunked column files.
+class columnarExporter():
+    #  wallClockOffset  Add this to the timestamps for wall clock (Unix) times, None for the offset of time.monotonic() now.
+    def __init__(self, exportDir = "lesson11-columns", chunkRecords = 262144, wallClockOffset = None):
+        self.exportDir = exportDir
+        self.chunkRecords = chunkRecords
+        self.wallClockOffset = time.time() - time.monotonic() if wallClockOffset is None else wallClockOffset
+        self.chunk = np.zeros(chunkRecords, dtype = sessionDType)
+        self.chunkCount = 0         # Records in the current chunk.
+        self.recordCount = 0        # Total number of records exported, including by earlier runs.
+        os.makedirs(exportDir, exist_ok = True)
+        if os.path.exists(os.path.join(exportDir, indexFileName)):
+            self.exportIndex = readIndex(exportDir)
+            self.recordCount = sum(chunkInfo["records"] for chunkInfo in self.exportIndex["chunks"])
+        else:
+            self.exportIndex = {"format": exportFormat, "columns": {columnName: sessionDType[columnName].str for columnName in exportColumns}, "chunks": []}
+            self.writeIndex()
+    # Record a sample, it can be used as a serialReader.sampleTap. A sample of None records a packet that failed its
+    # CRC8 check, or could not be parsed.
+    def record(self, sample = None, timestamp = None):
+        exportRecord = self.chunk[self.chunkCount]
+        exportRecord["timestamp"] = time.monotonic() if timestamp is None else timestamp
+        if sample is None:
+            exportRecord["crcOK"] = 0
+            exportRecord["pot1Value"] = -1
+            for columnName in ("tDHT11", "hDHT11", "tDHT22", "hDHT22"):
+                exportRecord[columnName] = np.nan
+        else:
+            exportRecord["crcOK"] = 1
+            (exportRecord["pot1Value"], exportRecord["tDHT11"], exportRecord["hDHT11"], exportRecord["tDHT22"], exportRecord["hDHT22"]) = sampleToNumbers(sample)
+        self.chunkCount += 1
+        if self.chunkCount == self.chunkRecords:
+            self.flush()
+    # Record a whole block of records at once, e.g. a block of a session file, or any structured array with the session field names.
+    def recordBlock(self, sessionRecords):
+        blockStart = 0
+        while blockStart < len(sessionRecords):
+            blockRecords = min(len(sessionRecords) - blockStart, self.chunkRecords - self.chunkCount)
+            chunkSlice = self.chunk[self.chunkCount:self.chunkCount + blockRecords]
+            for columnName in exportColumns:
+                chunkSlice[columnName] = sessionRecords[columnName][blockStart:blockStart + blockRecords]
+            self.chunkCount += blockRecords
+            blockStart += blockRecords
+            if self.chunkCount == self.chunkRecords:
+                self.flush()
+    # Write the current chunk out as column files, and add it to the index.
+    def flush(self):
+        if self.chunkCount == 0:
+            return
+        chunkIndex = len(self.exportIndex["chunks"])
+        for columnName in exportColumns:
+            np.save(columnPath(self.exportDir, chunkIndex, columnName), np.ascontiguousarray(self.chunk[columnName][:self.chunkCount]))
+        timestamps = self.chunk["timestamp"][:self.chunkCount]
+        self.exportIndex["chunks"].append({"chunk": chunkIndex, "records": self.chunkCount, "firstTime": float(timestamps.min()), "lastTime": float(timestamps.max()),
+                                           "wallClockOffset": self.wallClockOffset})
+        self.writeIndex()
+        self.recordCount += self.chunkCount
+        self.chunkCount = 0
+    # Write to a temporary file first, so a half written index is never read.
+    def writeIndex(self):
+        indexPath = os.path.join(self.exportDir, indexFileName)
+        with open(indexPath + ".tmp", "w") as indexFile:
+            json.dump(self.exportIndex, indexFile, indent = 1)
+        os.replace(indexPath + ".tmp", indexPath)
+    def close(self):
+        self.flush()
+    def __enter__(self):
+        return self
+    def __exit__(self, excType, excValue, excTraceback):
+        self.close()
+
+# Export a recorded session file, a block at a time, so even a very long session never has to fit in memory.
+# The session was last written at about the time of its last record, which gives the clock offset of its timestamps.
+def exportSession(sessionPath = "session.l11rec", exportDir = "lesson11-columns", chunkRecords = 262144):
+    sessionRecords = openSession(sessionPath)
+    wallClockOffset = os.path.getmtime(sessionPath) - float(sessionRecords["timestamp"][-1]) if len(sessionRecords) else 0.0
+    with columnarExporter(exportDir, chunkRecords, wallClockOffset) as columnExport:
+        for blockStart in range(0, len(sessionRecords), chunkRecords):
+            columnExport.recordBlock(sessionRecords[blockStart:blockStart + chunkRecords])
+    return len(sessionRecords)
+
+# Convert an export into a Parquet file, with a row group for each chunk. This needs pyarrow.
+def exportParquet(exportDir = "lesson11-columns", parquetPath = "lesson11.parquet"):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    exportIndex = readIndex(exportDir)
+    parquetSchema = pa.schema([(columnName, pa.from_numpy_dtype(np.dtype(columnDType))) for (columnName, columnDType) in exportIndex["columns"].items()])
+    with pq.ParquetWriter(parquetPath, parquetSchema) as parquetFile:
+        for chunkInfo in exportIndex["chunks"]:
+            parquetFile.write_table(pa.table({columnName: np.load(columnPath(exportDir, chunkInfo["chunk"], columnName), mmap_mode = "r") for columnName in exportIndex["columns"]},
+                                             schema = parquetSchema))
+
+# Export session files from the command line, e.g. "python columnarExport.py session.l11rec lesson11-columns".
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python columnarExport.py <session file>... <export directory>")
+        sys.exit(1)
+    for sessionPath in sys.argv[1:-1]:
+        print("%s: %d records exported to %s" % (sessionPath, exportSession(sessionPath, sys.argv[-1]), sys.argv[-1]))
+
+# EOF
@@ -0,0 +1,201 @@
+# An asynchronous command channel, so that sending commands to a Lesson 11 Arduino never holds up the main loop.
+# Commands are queued by their subject and written from an asyncio event loop in a background thread. A command that
+# has not been written yet is superseded by a newer one with the same subject (only the latest "rgbLEDs" action is ever
+# sent), and the waiting commands for different subjects are sent together, in as few writes as possible.
+# With an ACK timeout, every command is expected to be acknowledged by the Arduino (a sketch built with COMMANDACKS), and
+# is sent again if the Arduino refuses it (NAK) or does not acknowledge it in time, until it has been tried maxAttempts times.
+
+# https://docs.python.org/3/library/asyncio-eventloop.html#asyncio.loop.call_soon_threadsafe
+# https://docs.python.org/3/library/asyncio-sync.html#asyncio.Event
+
+
+import time
+import asyncio
+import threading
+import serial
+from crc8Engine import calcCRC8
+
+# The Arduino's serial receive buffer is 64 bytes, and the sketch only takes one command out of it every 10ms (job 5),
+# so a batch of commands must fit in it.
+maxBatchBytes = 60
+
+# Build a CRC8 signed Arduino command, e.g. "rgbLEDs=4" becomes b"rgbLEDs=4!146\n".
+def signCommand(arduinoCmd = ""):
+    return ("%s!%d\n" % (arduinoCmd, calcCRC8(arduinoCmd))).encode()
+
+class commandChannel(threading.Thread):
+    #  serialPort  The Arduino's serial port, its write timeout stops a stuck board from holding up the channel for long.
+    #  ackTimeout  Seconds to wait for each command to be acknowledged, or None if the Arduino does not acknowledge them.
+    #  maxAttempts The number of times a command is sent before giving up on it, when it is not acknowledged.
+    #  batchDelay  Seconds to wait, once a command is queued, for more commands to join its batch.
+    #  batchBytes  The most bytes to send in one write.
+    def __init__(self, serialPort, ackTimeout = None, maxAttempts = 3, batchDelay = 0.002, batchBytes = maxBatchBytes):
+        threading.Thread.__init__(self, name = "commandChannel", daemon = True)
+        self.serialPort = serialPort
+        self.ackTimeout = ackTimeout
+        self.maxAttempts = maxAttempts
+        self.batchDelay = batchDelay
+        self.batchBytes = batchBytes
+        # The next command to send for each subject, and which attempt it is. Shared with the threads that send commands.
+        self.pendingCommands = {}
+        self.pendingLock = threading.Lock()
+        self.wakeRequested = False
+        # The commands that have been sent and not yet acknowledged, oldest first, with their ACK deadlines. Only used by the event loop.
+        self.awaitingAck = {}
+        self.commandLoop = None
+        self.wakeUp = None
+        self.running = threading.Event()
+        # An optional function that is given the subject and command of every command that could not be sent, or was never acknowledged.
+        self.onFailure = None
+        # Counters.
+        self.commandsQueued = 0
+        self.commandsCoalesced = 0  # Commands superseded by a newer one before they were sent.
+        self.commandsWritten = 0
+        self.batchesWritten = 0
+        self.acks = 0
+        self.naks = 0
+        self.ackTimeouts = 0
+        self.staleAcks = 0          # Acknowledgements for commands that had been superseded, or given up on.
+        self.retries = 0
+        self.commandFailures = 0
+        self.writeErrors = 0
+        self.lastError = None
+    # Queue a command, e.g. "rgbLEDs=4", replacing any command with the same subject that has not been sent yet.
+    # This never waits for the serial port, so it can be called from the main loop, or any other thread.
+    def send(self, arduinoCmd = ""):
+        subject = arduinoCmd.partition("=")[0]
+        with self.pendingLock:
+            if subject in self.pendingCommands:
+                self.commandsCoalesced += 1
+            self.pendingCommands[subject] = (arduinoCmd, 1)
+            self.commandsQueued += 1
+            wakeUp = not self.wakeRequested
+            self.wakeRequested = True
+        # Only the first command since the last batch needs to wake the event loop up.
+        if wakeUp and self.commandLoop is not None:
+            self.commandLoop.call_soon_threadsafe(self.wakeUp.set)
+    # Pass on an acknowledgement from the Arduino, as returned by binaryProtocol.parseCommandAck(). Called by the serial reader.
+    def acknowledge(self, commandAck):
+        if self.commandLoop is not None:
+            self.commandLoop.call_soon_threadsafe(self.handleAck, commandAck)
+    def handleAck(self, commandAck):
+        (acknowledged, subject, action) = commandAck
+        if subject is None:
+            # A bare NAK (a failed CRC8 check) is for the oldest command waiting, as the sketch actions them in order.
+            subject = next(iter(self.awaitingAck), None)
+            if subject is None:
+                self.staleAcks += 1
+                return
+            action = self.awaitingAck[subject][0].partition("=")[2]
+        waitingCommand = self.awaitingAck.get(subject)
+        if waitingCommand is None or waitingCommand[0].partition("=")[2] != action:
+            self.staleAcks += 1
+            return
+        del self.awaitingAck[subject]
+        if acknowledged:
+            self.acks += 1
+        else:
+            self.naks += 1
+            self.retry(subject, waitingCommand[0], waitingCommand[1])
+    # Send a command again, unless it has been superseded or has had all its attempts.
+    def retry(self, subject, arduinoCmd, attempt):
+        if attempt >= self.maxAttempts:
+            self.commandFailed(subject, arduinoCmd)
+            return
+        with self.pendingLock:
+            if subject in self.pendingCommands:
+                return
+            self.pendingCommands[subject] = (arduinoCmd, attempt + 1)
+            self.wakeRequested = True
+        self.retries += 1
+        self.wakeUp.set()
+    def commandFailed(self, subject, arduinoCmd):
+        self.commandFailures += 1
+        if self.onFailure is not None:
+            self.onFailure(subject, arduinoCmd)
+    # Retry the commands whose acknowledgements are overdue, and return how long until the next one is due, or None.
+    def checkAcks(self):
+        timeNow = time.monotonic()
+        for (subject, (arduinoCmd, attempt, ackDeadline)) in list(self.awaitingAck.items()):
+            if ackDeadline <= timeNow:
+                del self.awaitingAck[subject]
+                self.ackTimeouts += 1
+                self.retry(subject, arduinoCmd, attempt)
+        if not self.awaitingAck:
+            return None
+        return max(0.0, min(ackDeadline for (arduinoCmd, attempt, ackDeadline) in self.awaitingAck.values()) - timeNow)
+    # Send all the waiting commands, in batches of up to batchBytes.
+    def writePending(self):
+        with self.pendingLock:
+            pendingCommands = self.pendingCommands
+            self.pendingCommands = {}
+            self.wakeRequested = False
+        batchData = b""
+        batchCommands = []
+        for (subject, (arduinoCmd, attempt)) in pendingCommands.items():
+            signedCommand = signCommand(arduinoCmd)
+            if batchCommands and len(batchData) + len(signedCommand) > self.batchBytes:
+                self.writeBatch(batchData, batchCommands)
+                batchData = b""
+                batchCommands = []
+            batchData += signedCommand
+            batchCommands.append((subject, arduinoCmd, attempt))
+        if batchCommands:
+            self.writeBatch(batchData, batchCommands)
+    def writeBatch(self, batchData, batchCommands):
+        try:
+            self.serialPort.write(batchData)
+        except serial.SerialException as err: # Including serial.SerialTimeoutException.
+            self.writeErrors += 1
+            self.lastError = err
+            for (subject, arduinoCmd, attempt) in batchCommands:
+                self.commandFailed(subject, arduinoCmd)
+            return False
+        self.batchesWritten += 1
+        self.commandsWritten += len(batchCommands)
+        if self.ackTimeout is not None:
+            ackDeadline = time.monotonic() + self.ackTimeout
+            for (subject, arduinoCmd, attempt) in batchCommands:
+                # A newer command replaces the one waiting for the same subject, and goes to the back of the queue.
+                self.awaitingAck.pop(subject, None)
+                self.awaitingAck[subject] = (arduinoCmd, attempt, ackDeadline)
+        return True
+    async def serve(self):
+        self.wakeUp = asyncio.Event()
+        self.commandLoop = asyncio.get_running_loop()
+        # Anything queued before the event loop started has not woken it up.
+        with self.pendingLock:
+            if self.pendingCommands:
+                self.wakeUp.set()
+        ackWait = None
+        while self.running.is_set():
+            try:
+                await asyncio.wait_for(self.wakeUp.wait(), ackWait)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeUp.clear()
+            ackWait = self.checkAcks()
+            if self.pendingCommands:
+                if self.batchDelay:
+                    await asyncio.sleep(self.batchDelay)
+                self.writePending()
+                ackWait = self.checkAcks()
+        # Send whatever is still waiting, e.g. a last rgbLEDs command, before stopping.
+        self.writePending()
+        self.commandLoop = None
+    def run(self):
+        self.running.set()
+        asyncio.run(self.serve())
+    def stop(self, timeout = 1):
+        self.running.clear()
+        if self.commandLoop is not None and self.is_alive():
+            self.commandLoop.call_soon_threadsafe(self.wakeUp.set)
+        if self.is_alive():
+            self.join(timeout)
+    # A snapshot of the channel counters.
+    def stats(self):
+        return {"commandsQueued": self.commandsQueued, "commandsCoalesced": self.commandsCoalesced, "commandsWritten": self.commandsWritten,
+                "batchesWritten": self.batchesWritten, "acks": self.acks, "naks": self.naks, "ackTimeouts": self.ackTimeouts, "staleAcks": self.staleAcks,
+                "retries": self.retries, "commandFailures": self.commandFailures, "writeErrors": self.writeErrors, "awaitingAck": len(self.awaitingAck)}
+
+# EOF
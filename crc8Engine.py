@@ -0,0 +1,98 @@
+# A table driven Dallas/Maxim CRC8 engine for the Lesson 11 meter panel.
+# It gives bit identical results to calcCRC8() in TTB-AP-Lesson11.ino, but does a single table lookup per byte.
+
+# https://crccalc.com/?method=crc8
+#  CRC-8/MAXIM
+#    rgbLEDs=0!243 | rgbLEDs=1!173 | rgbLEDs=4!146
+# http://www.sunshine2k.de/articles/coding/crc/understanding_crc.html
+
+
+import numpy as np
+
+# The reflected Dallas/Maxim CRC8 polynomial, as used by the Arduino sketch.
+crc8Polynomial = 0x8c
+
+# Build the 256 entry lookup table, once, using the Arduino bit-at-a-time algorithm.
+def buildCRC8Table(polynomial = crc8Polynomial):
+    crc8Table = []
+    for tableIndex in range(256):
+        chksumCRC8 = tableIndex
+        for bitCounter in range(8):
+            if chksumCRC8 & 1:
+                chksumCRC8 = (chksumCRC8 >> 1) ^ polynomial
+            else:
+                chksumCRC8 >>= 1
+        crc8Table.append(chksumCRC8)
+    return bytes(crc8Table)
+
+crc8Table = buildCRC8Table()
+# The same table as a NumPy array for the vectorised batch functions.
+crc8TableNP = np.frombuffer(crc8Table, dtype = np.uint8)
+
+# Calculate a Dallas/Maxim CRC8 checksum of a string, bytes, bytearray or memoryview.
+def calcCRC8(data2Check = b"", chksumCRC8 = 0):
+    # Strings are converted with latin-1 so that each character maps to the same byte value that ord() would give.
+    # Characters outside latin-1, e.g. the replacement character from decoding a corrupted packet, become "?" (and fail the check).
+    if isinstance(data2Check, str):
+        data2Check = data2Check.encode("latin-1", "replace")
+    # Local name lookups are faster than global ones in the loop.
+    table = crc8Table
+    for dataByte in data2Check:
+        chksumCRC8 = table[chksumCRC8 ^ dataByte]
+    return chksumCRC8
+
+# Split a framed packet, e.g. b"512,21.00,45.00,NAN,NAN!123\r\n", into its data and CRC8 parts.
+# The CRC8 part is returned as an int, or -1 if there is no valid checksum.
+def splitFramedLine(framedLine = b""):
+    if isinstance(framedLine, str):
+        framedLine = framedLine.encode("latin-1")
+    framedLine = bytes(framedLine).rstrip(b"\r\n")
+    delimiterIndex = framedLine.rfind(b"!")
+    if delimiterIndex < 0:
+        return (framedLine, -1)
+    chksumField = framedLine[delimiterIndex + 1:]
+    if not chksumField.isdigit() or len(chksumField) > 3:
+        return (framedLine[:delimiterIndex], -1)
+    return (framedLine[:delimiterIndex], int(chksumField))
+
+# Calculate the CRC8 checksums of many byte strings at once.
+# The data is packed into a zero padded 2D array and processed one column (byte position) at a time, for all rows together.
+def calcCRC8Batch(dataBlocks = ()):
+    dataBlocks = [dataBlock.encode("latin-1") if isinstance(dataBlock, str) else bytes(dataBlock) for dataBlock in dataBlocks]
+    blockCount = len(dataBlocks)
+    chksumsCRC8 = np.zeros(blockCount, dtype = np.uint8)
+    if blockCount == 0:
+        return chksumsCRC8
+    blockLengths = np.fromiter((len(dataBlock) for dataBlock in dataBlocks), dtype = np.intp, count = blockCount)
+    maxLength = int(blockLengths.max())
+    if maxLength == 0:
+        return chksumsCRC8
+    # Pack all the data into a single padded array with one row per data block.
+    dataArray = np.zeros((blockCount, maxLength), dtype = np.uint8)
+    packedData = np.frombuffer(b"".join(dataBlocks), dtype = np.uint8)
+    rowIndex = np.repeat(np.arange(blockCount), blockLengths)
+    columnIndex = np.arange(packedData.size) - np.repeat(np.cumsum(blockLengths) - blockLengths, blockLengths)
+    dataArray[rowIndex, columnIndex] = packedData
+    # Walk the columns - rows that have run out of data keep their checksum unchanged.
+    for byteIndex in range(maxLength):
+        activeRows = blockLengths > byteIndex
+        updatedCRC8 = crc8TableNP[chksumsCRC8 ^ dataArray[:, byteIndex]]
+        chksumsCRC8 = np.where(activeRows, updatedCRC8, chksumsCRC8)
+    return chksumsCRC8
+
+# Calculate the CRC8 checksums of the rows of a 2D uint8 array, e.g. a block of fixed length binary records.
+def calcCRC8Rows(dataArray):
+    chksumsCRC8 = np.zeros(dataArray.shape[0], dtype = np.uint8)
+    for byteIndex in range(dataArray.shape[1]):
+        chksumsCRC8 = crc8TableNP[chksumsCRC8 ^ dataArray[:, byteIndex]]
+    return chksumsCRC8
+
+# Validate a block of framed packets in a single call.
+# Returns a NumPy boolean array, True where a packet has a checksum and it matches its data.
+def checkCRC8Lines(framedLines = ()):
+    splitLines = [splitFramedLine(framedLine) for framedLine in framedLines]
+    expectedCRC8 = np.fromiter((chksumCRC8 for (sensorData, chksumCRC8) in splitLines), dtype = np.int16, count = len(splitLines))
+    actualCRC8 = calcCRC8Batch([sensorData for (sensorData, chksumCRC8) in splitLines])
+    return expectedCRC8 == actualCRC8
+
+# EOF
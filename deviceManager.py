@@ -0,0 +1,188 @@
+# Driving a rack of Lesson 11 Arduinos from one process.
+# Every Arduino gets its own serial port, background serialReader thread and ring buffer, so a slow or silent board
+# never holds up the others. The samples are tagged with the ID of the device they came from, and can be routed to a
+# meter panel per device, or combined into one rack-wide aggregateView. Commands are sent to each board on its own port.
+# A link supervisor can watch every board's link, and reconnect any that are lost, see linkSupervisor.py.
+
+# https://pyserial.readthedocs.io/en/latest/url_handlers.html
+
+
+import time
+import serial
+import numpy as np
+from binaryProtocol import txModeBinary
+from serialReader import serialReader, sampleRingBuffer
+from sessionRecorder import sampleToNumbers
+from commandChannel import commandChannel, signCommand
+from linkSupervisor import linkSupervisor
+
+# One Arduino, its serial port and its background reader.
+class arduinoDevice():
+    def __init__(self, deviceID, serialPort, sampleBuffer = None):
+        self.deviceID = deviceID
+        self.serialPort = serialPort
+        self.reader = serialReader(serialPort, sampleBuffer if sampleBuffer is not None else sampleRingBuffer())
+        self.reader.name = "serialReader-%s" % deviceID
+        self.rgbLEDs = "NAN" # The last rgbLEDs action sent to this Arduino, invalid until we send one.
+        self.commands = None # The background command channel, if there is one.
+        self.link = None     # The health of the serial link, if it is supervised.
+        self.commandsSent = 0
+        self.writeErrors = 0
+        self.lastError = None
+    # Send the commands from a background command channel, which coalesces, batches and (optionally) retries them.
+    # The serial reader passes the Arduino's command acknowledgements on to it.
+    def useCommandChannel(self, ackTimeout = None, maxAttempts = 3):
+        self.commands = commandChannel(self.serialPort, ackTimeout, maxAttempts)
+        self.commands.name = "commandChannel-%s" % self.deviceID
+        self.commands.onFailure = self.commandFailed
+        self.reader.ackTap = self.commands.acknowledge
+        return self.commands
+    # Send a command to this Arduino. The port write timeout stops a stuck board from holding up the caller for long.
+    # With a command channel, the command is just queued, and True means it will be sent.
+    def sendCommand(self, arduinoCmd = ""):
+        if self.commands is not None:
+            self.commands.send(arduinoCmd)
+            self.commandsSent += 1
+            return True
+        try:
+            self.serialPort.write(signCommand(arduinoCmd))
+        except serial.SerialException as err: # Including serial.SerialTimeoutException.
+            self.writeErrors += 1
+            self.lastError = err
+            return False
+        self.commandsSent += 1
+        return True
+    # A command that was never sent, or never acknowledged, leaves the Arduino in an unknown state, so forget the last
+    # rgbLEDs action (unless a newer one has been sent since) and it is sent again with the next sample.
+    def commandFailed(self, subject, arduinoCmd):
+        if subject == "rgbLEDs" and arduinoCmd == "rgbLEDs=%s" % self.rgbLEDs:
+            self.rgbLEDs = "NAN"
+    def stats(self):
+        deviceStats = self.reader.stats()
+        deviceStats.update({"commandsSent": self.commandsSent, "writeErrors": self.writeErrors})
+        if self.commands is not None:
+            channelStats = self.commands.stats()
+            channelStats["writeErrors"] += self.writeErrors
+            deviceStats.update(channelStats)
+        if self.link is not None:
+            deviceStats.update(self.link.stats())
+        return deviceStats
+
+# A set of Arduinos, keyed by their device IDs, in the order they were added.
+class deviceManager():
+    def __init__(self):
+        self.devices = {}
+        self.openErrors = {} # The serial errors of the devices that could not be opened.
+        self.supervisor = None # The link supervisor, if there is one.
+    def __len__(self):
+        return len(self.devices)
+    def __iter__(self):
+        return iter(self.devices.values())
+    def __getitem__(self, deviceID):
+        return self.devices[deviceID]
+    # Add a device with a serial port that is already open, e.g. a pyserial loop:// port for testing.
+    def addDevice(self, deviceID, serialPort, sampleBuffer = None):
+        arduino = arduinoDevice(deviceID, serialPort, sampleBuffer)
+        self.devices[deviceID] = arduino
+        return arduino
+    # Open a serial port (a port name, a pty, or any pyserial URL) and add it as a device, using the port name as the
+    # device ID if none is given. Returns None, and keeps the error in openErrors, if the port cannot be opened.
+    # With keepOnError, a port that cannot be opened is still added, closed, for a link supervisor to open later.
+    def openDevice(self, portName, deviceID = None, baudRate = 115200, timeout = 0.1, writeTimeout = 0.5, keepOnError = False):
+        deviceID = portName if deviceID is None else deviceID
+        serialPort = None
+        try:
+            serialPort = serial.serial_for_url(portName, baudRate, timeout = timeout, write_timeout = writeTimeout, do_not_open = True)
+            serialPort.open()
+        except serial.SerialException as err:
+            self.openErrors[deviceID] = err
+            if serialPort is None or not keepOnError:
+                return None
+        return self.addDevice(deviceID, serialPort)
+    # Send the commands to every device from its own background command channel, see arduinoDevice.useCommandChannel().
+    def useCommandChannels(self, ackTimeout = None, maxAttempts = 3):
+        for arduino in self:
+            arduino.useCommandChannel(ackTimeout, maxAttempts)
+    # Watch the link of every device from a background link supervisor, which reconnects any that are lost.
+    def useLinkSupervisor(self, staleAfter = 0.5, reconnectAfter = 3.0, bootTime = 2.5, backoffMin = 0.25, backoffMax = 8.0):
+        self.supervisor = linkSupervisor(self, staleAfter, reconnectAfter, bootTime, backoffMin, backoffMax)
+        return self.supervisor
+    # Start all the reader threads, command channels, and the link supervisor.
+    def start(self):
+        for arduino in self:
+            if not arduino.reader.is_alive():
+                arduino.reader.start()
+            if arduino.commands is not None and not arduino.commands.is_alive():
+                arduino.commands.start()
+        if self.supervisor is not None and not self.supervisor.is_alive():
+            self.supervisor.start()
+    # Ask every Arduino to change its transmit mode at once, then wait for them all together (not one timeout each).
+    # Returns the device IDs that did not acknowledge the change, these carry on in their current mode. A supervised link
+    # asks for the transmit mode again every time it is reconnected, or first connected if its port is not open yet.
+    def negotiateTxMode(self, txMode = txModeBinary, timeout = 1.0):
+        for arduino in self:
+            if arduino.link is not None:
+                arduino.link.wantedTxMode = txMode
+            if arduino.reader.txMode != txMode and arduino.reader.portOpen.is_set():
+                arduino.reader.requestTxMode(txMode)
+        timeEnd = time.monotonic() + timeout
+        for arduino in self:
+            if arduino.reader.portOpen.is_set():
+                arduino.reader.txModeChanged.wait(max(0, timeEnd - time.monotonic()))
+        return [arduino.deviceID for arduino in self if arduino.reader.txMode != txMode]
+    # The newest sample from every device that has something new, as (deviceID, sample) pairs.
+    def latestSamples(self):
+        deviceSamples = []
+        for arduino in self:
+            sample = arduino.reader.samples.getLatest()
+            if sample is not None:
+                deviceSamples.append((arduino.deviceID, sample))
+        return deviceSamples
+    # Every waiting sample from every device, oldest first for each device, as (deviceID, sample) pairs.
+    def allSamples(self):
+        deviceSamples = []
+        for arduino in self:
+            deviceSamples.extend((arduino.deviceID, sample) for sample in arduino.reader.samples.getAll())
+        return deviceSamples
+    # Send a command to one device, or to every device if no device ID is given.
+    def sendCommand(self, arduinoCmd = "", deviceID = None):
+        if deviceID is not None:
+            return self.devices[deviceID].sendCommand(arduinoCmd)
+        return all([arduino.sendCommand(arduinoCmd) for arduino in self])
+    # Stop the link supervisor, the command channels and reader threads, and close the serial ports.
+    def stop(self):
+        if self.supervisor is not None:
+            self.supervisor.stop()
+        for arduino in self:
+            if arduino.commands is not None:
+                arduino.commands.stop()
+            arduino.reader.stop()
+            arduino.serialPort.close()
+    def stats(self):
+        return {arduino.deviceID: arduino.stats() for arduino in self}
+
+# A rack-wide view of the newest sample from every device, e.g. to drive one shared meter panel with the rack average.
+class aggregateView():
+    def __init__(self, deviceIDs = ()):
+        self.deviceRows = {deviceID: deviceRow for (deviceRow, deviceID) in enumerate(deviceIDs)}
+        # One row per device of pot1Value, tDHT11, hDHT11, tDHT22, hDHT22. Missing values are NaN.
+        self.readings = np.full((len(self.deviceRows), 5), np.nan)
+    def update(self, deviceID, sample):
+        readings = sampleToNumbers(sample)
+        self.readings[self.deviceRows[deviceID]] = (np.nan if readings[0] == -1 else readings[0],) + readings[1:]
+    # The minimum, mean and maximum of each reading over the devices that have a valid value, NaN if none do.
+    def summary(self):
+        validCount = np.count_nonzero(~np.isnan(self.readings), axis = 0)
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            meanReadings = np.nansum(self.readings, axis = 0) / validCount
+        minReadings = np.where(validCount > 0, np.fmin.reduce(self.readings, axis = 0), np.nan)
+        maxReadings = np.where(validCount > 0, np.fmax.reduce(self.readings, axis = 0), np.nan)
+        return {fieldName: (minReadings[fieldIndex], meanReadings[fieldIndex], maxReadings[fieldIndex])
+                for (fieldIndex, fieldName) in enumerate(("pot1Value", "tDHT11", "hDHT11", "tDHT22", "hDHT22"))}
+    # The rack average as a sample, with the usual "-1" and "NAN" markers, ready for a meter panel.
+    def meanSample(self):
+        meanReadings = [summary[1] for summary in self.summary().values()]
+        pot1Value = "-1" if np.isnan(meanReadings[0]) else int(round(meanReadings[0]))
+        return tuple([pot1Value] + ["NAN" if np.isnan(reading) else float(reading) for reading in meanReadings[1:]])
+
+# EOF
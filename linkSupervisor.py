@@ -0,0 +1,195 @@
+# A link supervisor for a rack of Lesson 11 Arduinos, so that a lost serial link comes back by itself.
+# Every link is checked a few times a second. A link with no good packets for staleAfter seconds is stale, and its meters
+# should show no data. After reconnectAfter seconds, or as soon as its reader has a read error (e.g. the USB cable was
+# pulled), the port is closed and opened again in the background, and a port that cannot be opened (including one that
+# could not be opened at startup) is tried again with an exponential backoff, from backoffMin up to backoffMax seconds.
+# The same port object is opened again, so the reader, the command channel and anything wrapping the port carry on.
+# Every reconnect is timed, from the link being lost to the first good packet after it, and the samples lost are worked
+# out from the packet rate before the link was lost.
+
+# https://pyserial.readthedocs.io/en/latest/pyserial_api.html#serial.Serial.open
+# https://en.wikipedia.org/wiki/Exponential_backoff
+
+
+import time
+import threading
+import collections
+import serial
+from binaryProtocol import txModeText
+
+# The states of a link.
+linkUp = "up"                   # Good packets are arriving.
+linkStale = "stale"             # The port is open, but no good packets have arrived for a while.
+linkDown = "down"               # The port is closed, waiting to be opened again.
+linkConnecting = "connecting"   # The port has been opened again, waiting for the first good packet.
+
+# A sample with no readings, to show on the meters of a link that has stopped.
+noDataSample = ("-1", "NAN", "NAN", "NAN", "NAN")
+
+# The health of one Arduino's serial link.
+class linkHealth():
+    def __init__(self, portOpen = True, backoffMin = 0.25, timeNow = None):
+        timeNow = time.monotonic() if timeNow is None else timeNow
+        self.state = linkConnecting if portOpen else linkDown
+        self.openedAt = timeNow
+        self.staleCount = 0         # The number of times the link has stopped being up.
+        self.packetRate = 0.0       # Good packets per second while the link is up, smoothed.
+        self.packetCount = 0        # The reader's packet count, and when it was taken, for the packet rate.
+        self.packetCountTime = timeNow
+        self.lostAt = None          # When the link was lost, and the last good packet before that.
+        self.lastPacketBefore = None
+        self.backoff = backoffMin
+        self.nextAttempt = timeNow
+        self.attempts = 0           # Attempts to open the port since the link was lost.
+        self.wantedTxMode = txModeText
+        # Counters, and the most recent reconnects.
+        self.reconnects = 0
+        self.failedOpens = 0
+        self.samplesLost = 0
+        self.recoveries = collections.deque(maxlen = 100)
+        self.lastError = None
+    def stats(self):
+        recoverTimes = [recovery["recoverSeconds"] for recovery in self.recoveries]
+        return {"linkState": self.state, "packetRate": self.packetRate, "reconnects": self.reconnects, "failedOpens": self.failedOpens, "samplesLost": self.samplesLost,
+                "lastRecoverSeconds": recoverTimes[-1] if recoverTimes else None, "maxRecoverSeconds": max(recoverTimes) if recoverTimes else None}
+
+# A background thread that watches the links of a set of Arduinos, e.g. a deviceManager, and reconnects them.
+class linkSupervisor(threading.Thread):
+    #  devices        The arduinoDevices to supervise, e.g. a deviceManager.
+    #  staleAfter     Seconds without a good packet before a link is stale. The sketch sends a packet every 0.1s.
+    #  reconnectAfter Seconds without a good packet before the port is closed and opened again.
+    #  bootTime       Seconds for an Arduino to start sending after its port is opened, which resets it.
+    #  backoffMin     Seconds to wait before trying again to open a port that could not be opened, or that stayed silent...
+    #  backoffMax     ...doubling after every failed attempt, up to this.
+    #  checkInterval  Seconds between checks of the links.
+    def __init__(self, devices, staleAfter = 0.5, reconnectAfter = 3.0, bootTime = 2.5, backoffMin = 0.25, backoffMax = 8.0, checkInterval = 0.05):
+        threading.Thread.__init__(self, name = "linkSupervisor", daemon = True)
+        self.devices = devices
+        self.staleAfter = staleAfter
+        self.reconnectAfter = reconnectAfter
+        self.bootTime = bootTime
+        self.backoffMin = backoffMin
+        self.backoffMax = backoffMax
+        self.checkInterval = checkInterval
+        self.running = threading.Event()
+        timeNow = time.monotonic()
+        for arduino in devices:
+            arduino.link = linkHealth(arduino.reader.portOpen.is_set(), backoffMin, timeNow)
+            arduino.reader.reconnectable = True
+        # The stale count of each link the last time the main loop asked, see newlyStale(). Only used by the main loop.
+        self.reportedStale = {}
+        # An optional function that is given the device ID and the details of every reconnect.
+        self.onReconnect = None
+    # Check every link, and reconnect any that have been lost.
+    def checkLinks(self, timeNow = None):
+        timeNow = time.monotonic() if timeNow is None else timeNow
+        for arduino in self.devices:
+            self.checkLink(arduino, arduino.link, timeNow)
+    def checkLink(self, arduino, link, timeNow):
+        reader = arduino.reader
+        if not reader.portOpen.is_set():
+            if link.state != linkDown:
+                self.linkLost(link, reader, timeNow)
+            if timeNow >= link.nextAttempt:
+                self.openPort(arduino, link, timeNow)
+            return
+        lastPacketTime = reader.lastPacketTime
+        if link.state in (linkConnecting, linkDown):
+            if lastPacketTime is not None and lastPacketTime >= link.openedAt:
+                self.linkRecovered(arduino, link, lastPacketTime)
+            elif timeNow - link.openedAt >= self.bootTime + self.reconnectAfter:
+                reader.dropLink() # Still nothing since the port was opened again.
+            return
+        silentTime = timeNow - max(lastPacketTime or 0.0, link.openedAt)
+        if silentTime >= self.reconnectAfter:
+            reader.dropLink()
+        elif silentTime >= self.staleAfter:
+            if link.state == linkUp:
+                link.state = linkStale
+                link.staleCount += 1
+        elif link.state == linkStale:
+            # Back again, without a reconnect. The packet rate is only measured while the link is up.
+            link.state = linkUp
+            (link.packetCount, link.packetCountTime) = (reader.packetsReceived, lastPacketTime)
+        elif lastPacketTime - link.packetCountTime >= 0.5:
+            # The packets between two packet arrivals, over the time between them, smoothed over a few seconds.
+            packetRate = (reader.packetsReceived - link.packetCount) / (lastPacketTime - link.packetCountTime)
+            link.packetRate = packetRate if link.packetRate == 0 else 0.8 * link.packetRate + 0.2 * packetRate
+            (link.packetCount, link.packetCountTime) = (reader.packetsReceived, lastPacketTime)
+    # The reader has closed the port. The first attempt to open it again is straight away, unless it was already opened
+    # again and stayed silent, then the attempts back off.
+    def linkLost(self, link, reader, timeNow):
+        if link.state == linkConnecting and link.lostAt is not None:
+            link.nextAttempt = timeNow + link.backoff
+            link.backoff = min(2 * link.backoff, self.backoffMax)
+        else:
+            if link.state == linkUp:
+                link.staleCount += 1
+            link.lostAt = timeNow
+            link.lastPacketBefore = reader.lastPacketTime
+            link.nextAttempt = timeNow
+            link.attempts = 0
+        link.state = linkDown
+    def openPort(self, arduino, link, timeNow):
+        link.attempts += 1
+        try:
+            arduino.serialPort.open()
+        except (serial.SerialException, OSError) as err:
+            link.failedOpens += 1
+            link.lastError = err
+            link.nextAttempt = timeNow + link.backoff
+            link.backoff = min(2 * link.backoff, self.backoffMax)
+            return
+        if link.lostAt is None:
+            link.lostAt = timeNow # The port could not be opened at startup.
+        link.state = linkConnecting
+        link.openedAt = timeNow
+        # An Arduino is reset when its port is opened, so it starts again in text mode, with its LEDs off.
+        arduino.reader.setTxMode(txModeText)
+        arduino.rgbLEDs = "NAN"
+        arduino.reader.portOpen.set()
+    # The first good packet since the port was opened again.
+    def linkRecovered(self, arduino, link, packetTime):
+        link.state = linkUp
+        link.backoff = self.backoffMin
+        (link.packetCount, link.packetCountTime) = (arduino.reader.packetsReceived, packetTime)
+        if link.wantedTxMode != txModeText:
+            try:
+                arduino.reader.requestTxMode(link.wantedTxMode)
+            except serial.SerialException as err:
+                link.lastError = err
+        if link.lastPacketBefore is None:
+            return # The link had never been up, so nothing was lost.
+        outageTime = packetTime - link.lastPacketBefore
+        recovery = {"recoverSeconds": packetTime - link.lostAt, "outageSeconds": outageTime, "attempts": link.attempts,
+                    "samplesLost": max(0, int(round(outageTime * link.packetRate)) - 1)}
+        link.recoveries.append(recovery)
+        link.reconnects += 1
+        link.samplesLost += recovery["samplesLost"]
+        if self.onReconnect is not None:
+            self.onReconnect(arduino.deviceID, recovery)
+    # The device IDs of the links that have stopped being up since the last call, so the main loop can show no data on their meters.
+    def newlyStale(self):
+        staleIDs = []
+        for arduino in self.devices:
+            if arduino.link.staleCount != self.reportedStale.get(arduino.deviceID, 0):
+                self.reportedStale[arduino.deviceID] = arduino.link.staleCount
+                if arduino.link.state != linkUp:
+                    staleIDs.append(arduino.deviceID)
+        return staleIDs
+    # The device IDs of the links with their ports closed.
+    def downDevices(self):
+        return [arduino.deviceID for arduino in self.devices if arduino.link.state == linkDown]
+    def run(self):
+        self.running.set()
+        while self.running.is_set():
+            self.checkLinks()
+            time.sleep(self.checkInterval)
+    def stop(self, timeout = 1):
+        self.running.clear()
+        if self.is_alive():
+            self.join(timeout)
+    def stats(self):
+        return {arduino.deviceID: arduino.link.stats() for arduino in self.devices}
+
+# EOF
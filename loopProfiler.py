@@ -0,0 +1,226 @@
+# Optional profiling of the Lesson 11 hot paths.
+# Each stage (serial reads, decode, split, CRC8 check, float conversion, binary block decodes, every meter update, the
+# meter animation, command writes and whole frames) is timed with perf_counter_ns() into a log scale histogram, from which
+# p50/p95/p99 are worked out. CRC8 failures, malformed packets and readings clipped to a meter's scale are counted too.
+# Nothing is timed unless a loopProfiler instruments it: the serial port, parser, meters and so on are wrapped with
+# timed versions only when profiling is on, so the normal code paths cost exactly the same as before when it is off.
+
+# https://docs.python.org/3/library/time.html#time.perf_counter_ns
+
+
+import json
+import math
+import time
+import functools
+import threading
+from crc8Engine import calcCRC8
+from serialReader import convertSensorFields
+from binaryProtocol import txModeText
+
+# The histogram buckets are a quarter of an octave wide, from 1ns up to about 17s.
+bucketsPerOctave = 4
+bucketCount = 34 * bucketsPerOctave
+
+# The timings of one stage.
+class stageHistogram():
+    def __init__(self):
+        self.counts = [0] * bucketCount
+        self.sampleCount = 0
+        self.totalNs = 0
+        self.maxNs = 0
+    def record(self, elapsedNs):
+        self.counts[min(int(math.log2(elapsedNs + 1) * bucketsPerOctave), bucketCount - 1)] += 1
+        self.sampleCount += 1
+        self.totalNs += elapsedNs
+        if elapsedNs > self.maxNs:
+            self.maxNs = elapsedNs
+    # The time, in ns, that the given fraction of the samples were at or below (the upper edge of its bucket).
+    def percentile(self, fraction = 0.5):
+        if self.sampleCount == 0:
+            return 0
+        targetCount = fraction * self.sampleCount
+        runningCount = 0
+        for (bucketIndex, bucketSamples) in enumerate(self.counts):
+            runningCount += bucketSamples
+            if runningCount >= targetCount:
+                return min(int(2 ** ((bucketIndex + 1) / bucketsPerOctave)), self.maxNs)
+        return self.maxNs
+    def summary(self):
+        return {"count": self.sampleCount, "meanNs": self.totalNs / self.sampleCount if self.sampleCount else 0,
+                "p50Ns": self.percentile(0.5), "p95Ns": self.percentile(0.95), "p99Ns": self.percentile(0.99), "maxNs": self.maxNs}
+
+# A serial port stand in that times every read, i.e. the time spent waiting for the Arduino.
+class timedSerialPort():
+    def __init__(self, serialPort, stageTimer):
+        self.serialPort = serialPort
+        self.stageTimer = stageTimer
+    def read(self, readSize = 1):
+        timeStart = time.perf_counter_ns()
+        rxData = self.serialPort.read(readSize)
+        self.stageTimer.record("serialRead", time.perf_counter_ns() - timeStart)
+        return rxData
+    def __getattr__(self, attrName):
+        return getattr(self.serialPort, attrName)
+
+class loopProfiler():
+    def __init__(self, reportInterval = 10.0):
+        self.stages = {}
+        self.counters = {"crcFailures": 0, "malformedPackets": 0, "clippedReadings": 0}
+        # The serial reader and command channel threads add their stages (and counters) the first time they get to them,
+        # while the main loop may be reporting, so they are only ever added, and listed, under this lock. The counters are
+        # also counted under it, as more than one thread can count the same one, e.g. malformedPackets from every reader.
+        self.stageLock = threading.Lock()
+        self.reportInterval = reportInterval
+        self.lastReportTime = time.monotonic()
+    # Record the time taken by a stage.
+    def record(self, stageName, elapsedNs):
+        stageTimes = self.stages.get(stageName)
+        if stageTimes is None:
+            with self.stageLock:
+                stageTimes = self.stages.setdefault(stageName, stageHistogram())
+        stageTimes.record(elapsedNs)
+    def count(self, counterName, countBy = 1):
+        with self.stageLock:
+            self.counters[counterName] = self.counters.get(counterName, 0) + countBy
+    # A snapshot of the stages and counters, safe to go through while other threads are adding to them.
+    def snapshot(self):
+        with self.stageLock:
+            return (list(self.stages.items()), list(self.counters.items()))
+    # Wrap a function so that every call to it is timed as a stage.
+    def timed(self, stageName, stageFunction):
+        @functools.wraps(stageFunction)
+        def timedFunction(*args, **kwargs):
+            timeStart = time.perf_counter_ns()
+            try:
+                return stageFunction(*args, **kwargs)
+            finally:
+                self.record(stageName, time.perf_counter_ns() - timeStart)
+        return timedFunction
+    # The text packet parser, the same as parseSensorPacket(), but timing each step and counting the failures.
+    def parseSensorPacket(self, arduinoDataPacket = b""):
+        timeStart = time.perf_counter_ns()
+        arduinoDataPacket = str(arduinoDataPacket, 'utf-8', 'replace').strip('\r\n')
+        timeDecoded = time.perf_counter_ns()
+        self.record("decode", timeDecoded - timeStart)
+        if "!" in arduinoDataPacket:
+            (sensorData, chksumCRC8) = arduinoDataPacket.split("!", 1)
+            timeSplit = time.perf_counter_ns()
+            crcOK = chksumCRC8.isdigit() and calcCRC8(sensorData) == int(chksumCRC8)
+            self.record("calcCRC8", time.perf_counter_ns() - timeSplit)
+            if not crcOK:
+                self.count("crcFailures")
+                return None
+        else:
+            sensorData = arduinoDataPacket
+        timeSplit = time.perf_counter_ns()
+        sensorFields = sensorData.split(",")
+        timeConvert = time.perf_counter_ns()
+        self.record("split", timeConvert - timeSplit)
+        if len(sensorFields) != 5:
+            self.count("malformedPackets")
+            return None
+        sample = convertSensorFields(sensorFields)
+        self.record("floatConversion", time.perf_counter_ns() - timeConvert)
+        if sample is None:
+            self.count("malformedPackets")
+        return sample
+    # Time a serial reader: its port reads, its text parser (step by step), its binary parser, its block decodes of bursts of
+    # binary records, and its chunk processing.
+    def instrumentReader(self, arduinoReader):
+        arduinoReader.serialPort = timedSerialPort(arduinoReader.serialPort, self)
+        arduinoReader.packetParsers[txModeText] = self.parseSensorPacket
+        for (txMode, packetParser) in arduinoReader.packetParsers.items():
+            if txMode != txModeText:
+                arduinoReader.packetParsers[txMode] = self.countFailures(self.timed("binaryParse", packetParser))
+        arduinoReader.setTxMode(arduinoReader.txMode)
+        arduinoReader.putRecords = self.countRejects(self.timed("blockDecode", arduinoReader.putRecords))
+        arduinoReader.processBuffer = self.timed("processBuffer", arduinoReader.processBuffer)
+    # Count the packets a parser could not parse.
+    def countFailures(self, packetParser):
+        @functools.wraps(packetParser)
+        def countingParser(rxLine):
+            sample = packetParser(rxLine)
+            if sample is None:
+                self.count("malformedPackets")
+            return sample
+        return countingParser
+    # Count the frames a block decode rejected, as it returns how many there were.
+    def countRejects(self, blockDecode):
+        @functools.wraps(blockDecode)
+        def countingDecode(recordFrames):
+            badFrames = blockDecode(recordFrames)
+            if badFrames:
+                self.count("malformedPackets", badFrames)
+            return badFrames
+        return countingDecode
+    # Time an Arduino's command writes. With a command channel, sendCommand() only queues the command, and the batches
+    # of commands are written, and timed, in the background.
+    def instrumentDevice(self, arduino):
+        arduino.sendCommand = self.timed("commandWrite", arduino.sendCommand)
+        if arduino.commands is not None:
+            arduino.commands.writeBatch = self.timed("commandBatchWrite", arduino.commands.writeBatch)
+    # Time the update of every meter on a panel, and count the clipped readings. Lazy meters are instrumented when they are built.
+    def instrumentPanel(self, meterPanel):
+        for (meterName, meter) in meterPanel.meters.items():
+            self.instrumentMeter(meterName, meter)
+        buildLazyMeter = meterPanel.buildLazyMeter
+        def instrumentedBuild(meterName):
+            meter = buildLazyMeter(meterName)
+            self.instrumentMeter(meterName, meter)
+            return meter
+        meterPanel.buildLazyMeter = instrumentedBuild
+    def instrumentMeter(self, meterName, meter):
+        meter.update = self.countClips(meter, self.timed("meter:%s" % meterName, meter.update))
+    # Count the readings outside a meter's scale, i.e. that it will clip. Meters keep their scale as <prefix>ScaleMin/Max.
+    def countClips(self, meter, meterUpdate):
+        scaleNames = [attrName for attrName in vars(meter) if attrName.endswith("ScaleMin")]
+        if not scaleNames:
+            return meterUpdate
+        scaleMin = getattr(meter, scaleNames[0])
+        scaleMax = getattr(meter, scaleNames[0][:-3] + "Max")
+        @functools.wraps(meterUpdate)
+        def clipCountingUpdate(meterValue = "NAN", *args, **kwargs):
+            if not isinstance(meterValue, str) and meterValue == meterValue and not scaleMin <= meterValue <= scaleMax:
+                self.count("clippedReadings")
+            return meterUpdate(meterValue, *args, **kwargs)
+        return clipCountingUpdate
+    # Time whole frames, from the governor tick to the frame being redrawn.
+    def instrumentGovernor(self, renderPacer):
+        renderTick = renderPacer.tick
+        renderFrameDone = renderPacer.frameDone
+        frameStart = [None]
+        def timedTick():
+            renderTick()
+            frameStart[0] = time.perf_counter_ns()
+        def timedFrameDone():
+            if frameStart[0] is not None:
+                self.record("frame", time.perf_counter_ns() - frameStart[0])
+                frameStart[0] = None
+            renderFrameDone()
+        renderPacer.tick = timedTick
+        renderPacer.frameDone = timedFrameDone
+    # Time the needle and column animation, every frame.
+    def instrumentAnimator(self, meterMotion):
+        meterMotion.animate = self.timed("meterAnimation", meterMotion.animate)
+    def summary(self):
+        (stageItems, counterItems) = self.snapshot()
+        return {"stages": {stageName: stageTimes.summary() for (stageName, stageTimes) in stageItems}, "counters": dict(counterItems)}
+    # A one line summary of the p50/p95/p99 times, in us, and the counters.
+    def reportLine(self):
+        (stageItems, counterItems) = self.snapshot()
+        stageTexts = ["%s %.1f/%.1f/%.1f" % (stageName, stageTimes.percentile(0.5) / 1000, stageTimes.percentile(0.95) / 1000, stageTimes.percentile(0.99) / 1000)
+                      for (stageName, stageTimes) in stageItems]
+        counterTexts = ["%s %d" % counterItem for counterItem in counterItems]
+        return "Profile (p50/p95/p99 us): %s | %s" % (", ".join(stageTexts), ", ".join(counterTexts))
+    # Check if it is time for the next periodic report.
+    def reportDue(self):
+        timeNow = time.monotonic()
+        if timeNow - self.lastReportTime < self.reportInterval:
+            return False
+        self.lastReportTime = timeNow
+        return True
+    def dumpJSON(self, jsonPath = "lesson11-profile.json"):
+        with open(jsonPath, "w") as jsonFile:
+            json.dump(self.summary(), jsonFile, indent = 2)
+
+# EOF
@@ -0,0 +1,127 @@
+# Smooth, time based animation of the Lesson 11 meter needles and columns.
+# A meter update only sets where its needle (or column) should end up, as a fraction of its scale, and every frame the
+# needles move on towards their targets by the time since the last frame, on critically damped springs, so they move
+# smoothly at the display rate however often (or seldom) new readings arrive, and never overshoot a reading from rest.
+# All the springs are stepped together with NumPy, using the exact solution of the spring over the frame, so a long or
+# short frame never makes them unstable. Springs that have settled on their targets are not touched at all.
+# The needle angles come from one lookup table of the cos and sin of the angle along the scale, shared by every needle.
+# This module does not need vPython, the axis vectors are made by the function it is given.
+
+# https://en.wikipedia.org/wiki/Damping
+# https://www.glowscript.org/docs/VPythonDocs/index.html
+
+
+import time
+import numpy as np
+
+# A critically damped spring gets 90% of the way to its target in 3.89 / omega seconds: (1 + 3.89) * e^-3.89 = 0.1.
+responseFactor = 3.8897
+
+# The kinds of primitive a spring can drive.
+needleKind = 0  # A needle, e.g. meterType1, its axis points along the scale from 5pi/6 (the bottom) to pi/6 (the top).
+columnKind = 1  # A column, e.g. meterType3, its axis grows from columnBase up to columnBase + 1 at the top of the scale.
+columnBase = 0.15
+
+# A bank of critically damped springs, one for each animated primitive, stepped together.
+class springBank():
+    #  responseTime   Seconds for a spring to get 90% of the way to a new target.
+    #  settleDistance A spring this close to its target, and almost still, has settled on it.
+    def __init__(self, responseTime = 0.2, settleDistance = 1e-4):
+        self.omega = responseFactor / responseTime
+        self.settleDistance = settleDistance
+        self.position = np.zeros(0)
+        self.velocity = np.zeros(0)
+        self.target = np.zeros(0)
+        self.moving = np.zeros(0, dtype = bool)
+    def __len__(self):
+        return len(self.position)
+    # Add a spring at rest at a position, and return its index.
+    def add(self, position = 0.0):
+        self.position = np.append(self.position, position)
+        self.velocity = np.append(self.velocity, 0.0)
+        self.target = np.append(self.target, position)
+        self.moving = np.append(self.moving, False)
+        return len(self.position) - 1
+    def setTarget(self, springIndex, target = 0.0):
+        if target != self.target[springIndex]:
+            self.target[springIndex] = target
+            self.moving[springIndex] = True
+    # Move a spring straight to a position, it is still reported as moved by the next step.
+    def snapTo(self, springIndex, position = 0.0):
+        self.position[springIndex] = self.target[springIndex] = position
+        self.velocity[springIndex] = 0.0
+        self.moving[springIndex] = True
+    # Move every moving spring on by timeStep seconds, and return the indices of the springs that moved.
+    def step(self, timeStep = 0.01):
+        movingSprings = np.flatnonzero(self.moving)
+        if len(movingSprings) == 0:
+            return movingSprings
+        offset = self.position[movingSprings] - self.target[movingSprings]
+        velocity = self.velocity[movingSprings]
+        # x(t) = (x0 + (v0 + omega * x0) * t) * e^(-omega * t), and its derivative, from the offset x0 and velocity v0 now.
+        decay = np.exp(-self.omega * timeStep)
+        slope = velocity + self.omega * offset
+        offset = (offset + slope * timeStep) * decay
+        velocity = (velocity - self.omega * slope * timeStep) * decay
+        settled = (np.abs(offset) < self.settleDistance) & (np.abs(velocity) < self.settleDistance * self.omega)
+        offset[settled] = 0.0
+        velocity[settled] = 0.0
+        self.position[movingSprings] = self.target[movingSprings] + offset
+        self.velocity[movingSprings] = velocity
+        self.moving[movingSprings[settled]] = False
+        return movingSprings
+
+# Animates the needles and columns of the meters, every frame.
+class meterAnimator():
+    #  needleScale  The cos and sin of the needle angle at evenly spaced points along the scale, e.g. an "arcScale" from the geometry cache.
+    #  makeVector   Makes an axis from its x, y and z, e.g. vPython's vector.
+    #  responseTime Seconds for a needle to get 90% of the way to a new reading.
+    #  maxTimeStep  The longest frame the springs are moved on by, so a needle that starts moving after a long pause does not jump.
+    def __init__(self, needleScale, makeVector, responseTime = 0.2, maxTimeStep = 0.05):
+        self.springs = springBank(responseTime)
+        self.needleCos = np.asarray(needleScale["cos"], dtype = float)
+        self.needleSin = np.asarray(needleScale["sin"], dtype = float)
+        self.makeVector = makeVector
+        self.maxTimeStep = maxTimeStep
+        self.primitives = [] # The primitive each spring drives, e.g. a shadowPrimitive of a needle arrow.
+        self.kinds = np.zeros(0, dtype = np.intp)
+        self.lastTime = None
+        # Counters.
+        self.frames = 0         # Frames in which something moved.
+        self.axesPushed = 0
+    def __len__(self):
+        return len(self.primitives)
+    # Animate a primitive, starting at a fraction of its scale. Returns its spring index, for setTarget().
+    def add(self, primitive, animationKind = needleKind, fraction = 0.0):
+        self.primitives.append(primitive)
+        self.kinds = np.append(self.kinds, animationKind)
+        return self.springs.add(fraction)
+    # Set where a primitive should end up, as a fraction of its scale, from 0 at the bottom to 1 at the top.
+    def setTarget(self, springIndex, fraction = 0.0):
+        self.springs.setTarget(springIndex, fraction)
+    # Move every animated primitive on by the time since the last frame. Returns True if any are still moving.
+    def animate(self, timeNow = None):
+        timeNow = time.monotonic() if timeNow is None else timeNow
+        timeStep = 0.0 if self.lastTime is None else min(max(timeNow - self.lastTime, 0.0), self.maxTimeStep)
+        self.lastTime = timeNow
+        movedSprings = self.springs.step(timeStep)
+        if len(movedSprings) == 0:
+            return False
+        # A spring can overshoot a little when its target changes while it is moving, but the needles stop at the scale ends.
+        fractions = np.clip(self.springs.position[movedSprings], 0.0, 1.0)
+        lookupIndex = np.rint(fractions * (len(self.needleCos) - 1)).astype(np.intp)
+        isNeedle = self.kinds[movedSprings] == needleKind
+        axisX = np.where(isNeedle, self.needleCos[lookupIndex], 0.0)
+        axisY = np.where(isNeedle, self.needleSin[lookupIndex], columnBase + fractions)
+        # Plain Python lists are much faster to step through than NumPy scalars.
+        primitives = self.primitives
+        makeVector = self.makeVector
+        for (springIndex, x, y) in zip(movedSprings.tolist(), axisX.tolist(), axisY.tolist()):
+            primitives[springIndex].axis = makeVector(x, y, 0)
+        self.frames += 1
+        self.axesPushed += len(movedSprings)
+        return bool(self.springs.moving.any())
+    def stats(self):
+        return {"animated": len(self.primitives), "moving": int(np.count_nonzero(self.springs.moving)), "frames": self.frames, "axesPushed": self.axesPushed}
+
+# EOF
@@ -0,0 +1,585 @@
+# The Lesson 11 EasiFace vPython meter panel - the virtual meters, LEDs and the panel they are mounted on.
+# This is kept apart from Lesson11.py so that the panel, and vPython itself, are only loaded when there is a display.
+# The meters on a panel come from a layout file, see panelLayout.py, and their geometry comes from a geometry cache.
+
+# Internet References:
+# https://www.glowscript.org/docs/VPythonDocs/index.html
+
+
+from vpython import *
+import numpy as np
+from shadowState import shadowPrimitive, segmentBarState # Only push vPython attributes that have really changed.
+from thresholdEngine import thresholdClassifier # Threshold bands with hysteresis, to stop the LEDs flipping.
+from panelLayout import geometryCache, loadLayout, checkLayout # Panel layouts, and the meter geometry worked out only once.
+from meterAnimation import meterAnimator, needleKind, columnKind # Needles and columns that move smoothly at the display rate.
+
+# The geometry of every meter drawn, shared by all the meters with the same parameters. Use useGeometryCache() to keep it on disk.
+meterGeometry = geometryCache()
+def useGeometryCache(cachePath = None):
+    global meterGeometry
+    meterGeometry = geometryCache(cachePath)
+
+# Animate the needles and columns of the meters built after useMeterAnimation() is called, so that they move smoothly
+# towards each new reading, a little every frame, instead of jumping to it. Call meterMotion.animate() every frame.
+meterMotion = None
+def useMeterAnimation(responseTime = 0.2):
+    global meterMotion
+    # One lookup table of the needle angles, a thousandth of the scale apart, for every needle.
+    meterMotion = meterAnimator(meterGeometry.get("arcScale", 0, 1, 5 * np.pi / 6, np.pi / 6, 1000), vector, responseTime)
+    return meterMotion
+
+# Static parts (dials, ticks, labels, screws, LED legs...) never change once they are drawn, but every vPython object
+# has to be sent to the browser and rendered on its own. So they are collected in a batch and merged into a single
+# compound when the batch is finished. Batches can be nested - the outermost one does the merging, so a whole panel can
+# end up as one compound. Transparent (glass) and textured parts are kept apart, as they do not merge well.
+compoundStaticParts = True # Set to False to draw every static part as its own object, as before.
+class staticBatch():
+    def __init__(self):
+        self.parts = []
+        self.depth = 0
+        self.compound = None
+    def add(self, part):
+        self.parts.append(part)
+        return part
+    def finish(self):
+        self.depth -= 1
+        if self.depth == 0 and compoundStaticParts and len(self.parts) > 1:
+            self.compound = compound(self.parts)
+
+# Start, or join, a batch of static parts. Every call must be matched by a call to finish() on the returned batch.
+def startStaticParts(staticParts = None):
+    if staticParts is None:
+        staticParts = staticBatch()
+    staticParts.depth += 1
+    return staticParts
+
+# A place on which to put our things... Each canvas is added below the last, so every Arduino in a rack can have its own.
+def drawCanvas(showAxis = False, deviceID = None):
+    canvasTitle = "<b><i>Arduino with Python - Real World Measurements Visualised!</i></b>"
+    if deviceID is not None:
+        canvasTitle += " <b>%s</b>" % deviceID
+    canvas(title = canvasTitle, background = color.cyan, width = 800, height = 600)
+    # Axis for helping with virtual meter design and layout.
+    if showAxis:
+        # An origin axis.
+        arrow(color = color.blue, round = True, pos = vector(-0.5, 0, 0), axis = vector(1, 0, 0), shaftwidth = 0.02) # X axis.
+        arrow(color = color.blue, round = True, pos = vector(0, -0.5, 0), axis = vector(0, 1, 0), shaftwidth = 0.02) # Y axis.
+        arrow(color = color.blue, round = True, pos = vector(0, 0, -0.5), axis = vector(0, 0, 1), shaftwidth = 0.02) # Z axis.
+        # An Z offest axis.
+        for graduation in range(6): # X axis.
+            arrow(color = color.magenta, round = True, pos = vector(graduation / 2, 0, 0.25), axis = vector(0.5, 0, 0), shaftwidth = 0.02)
+            arrow(color = color.magenta, round = True, pos = vector(-graduation / 2, 0, 0.25), axis = vector(-0.5, 0, 0), shaftwidth = 0.02)
+        for graduation in range(4): # Y axis.
+            arrow(color = color.magenta, round = True, pos = vector(0, graduation / 2, 0.25), axis = vector(0, 0.5, 0), shaftwidth = 0.02)
+            arrow(color = color.magenta, round = True, pos = vector(0, -graduation / 2, 0.25), axis = vector(0, -0.5, 0), shaftwidth = 0.02)
+        for graduation in range(2): # Z axis.
+            arrow(color = color.magenta, round = True, pos = vector(0, 0, graduation / 2), axis = vector(0, 0, 0.5), shaftwidth = 0.02)
+            arrow(color = color.magenta, round = True, pos = vector(0, 0, -graduation / 2), axis = vector(0, 0, -0.5), shaftwidth = 0.02)
+
+# A bag of small screws for us to draw exactly where we like.
+def drawScrew(sPos = vector(0, 0, 0), staticParts = None):
+    staticParts = startStaticParts(staticParts)
+    staticParts.add(cylinder(color = color.black, opacity = 1, pos = vector(0, 0, 0.05) + sPos, axis = vector(0, 0, 0.04), radius = 0.06)) # Head.
+    staticParts.add(cylinder(color = color.black, opacity = 1, pos = vector(0, 0, 0) + sPos, axis = vector(0, 0, 0.05), radius = 0.03))    # Shaft.
+    staticParts.add(cone(color = color.black, opacity = 1, pos = vector(0, 0, 0) + sPos, axis = vector(0, 0, -0.25), radius = 0.03))       # Thread.
+    slotAngle = np.random.rand() * np.pi / 2 # An angle between 0 and 90 degrees.
+    screwCross1 = staticParts.add(box(color = vector(0.8, 0.8, 0.8), opacity = 1, pos = vector(0, 0, 0.0801) + sPos, size = vector(0.1, 0.02, 0.02))) # Cross pt1.
+    screwCross1.rotate(angle = slotAngle, axis = vector(0, 0, 1))               # Randomly rotate this part of the cross.
+    screwCross2 = staticParts.add(box(color = vector(0.8, 0.8, 0.8), opacity = 1, pos = vector(0, 0, 0.0801) + sPos, size = vector(0.1, 0.02, 0.02))) # Cross pt2.
+    screwCross2.rotate(angle = slotAngle + np.pi / 2, axis = vector(0, 0, 1))   # Add 90 degrees for the other part of the cross.
+    staticParts.finish()
+
+# Meter Type 1 - A rectangluar style meter with a curved scale and a needle, and a 30%/70% band indication BGR LED.
+class meterType1:
+    def __init__(self, mt1Pos = vector(0, 0, 0), mt1Color = color.red, mt1ScaleMin = 0, mt1ScaleMax = 5, mt1Label = "", mt1Units = "", staticParts = None):
+        self.mt1Pos = mt1Pos
+        self.mt1Color = mt1Color
+        self.mt1ScaleMin = int(mt1ScaleMin)
+        self.mt1ScaleMax = int(mt1ScaleMax)
+        self.mt1ScaleRange = mt1ScaleMax - mt1ScaleMin
+        self.mt1Label = mt1Label
+        self.mt1Units = mt1Units
+        # Draw the virtual meter...
+        staticParts = startStaticParts(staticParts)
+        staticParts.add(box(color = color.white, opacity = 1, size = vector(2.25, 1.5, 0.1), pos = vector(0, 0, 0) + self.mt1Pos)) # Draw the virtual meter box.
+        # Draw the virtual meter needle and set it to the 0 position.
+        needleAxis = vector(np.cos(5 * np.pi / 6), np.sin(5 * np.pi / 6), 0)
+        self.meterNeedle = shadowPrimitive(arrow(length = 1, shaftwidth = 0.02, color = self.mt1Color, round = True, pos = vector(0, -0.65, 0.1) + self.mt1Pos, axis = needleAxis), axis = needleAxis)
+        self.needleMotion = meterMotion.add(self.meterNeedle, needleKind) if meterMotion is not None else None
+        staticParts.add(cylinder(color = self.mt1Color, opacity = 1, radius = 0.05, pos = vector(0, -0.65, 0.05) + self.mt1Pos, axis = vector(0, 0, 0.1)))
+        staticParts.add(cylinder(color = color.gray(0.5), opacity = 1, radius = 0.2, pos = vector(0, -0.5, 0.05) + self.mt1Pos, axis = vector(0, 0, 0.01)))
+        # Draw the virtual meter scale major marks.
+        majorScale = meterGeometry.get("arcScale", self.mt1ScaleMin, self.mt1ScaleMax, 5 * np.pi / 6, np.pi / 6, 1)
+        for unitCounter, theta, cosTheta, sinTheta in zip(range(self.mt1ScaleMin, self.mt1ScaleMax + 1), majorScale["theta"], majorScale["cos"], majorScale["sin"]):
+            majorUnit = staticParts.add(text(text = str(unitCounter), color = self.mt1Color, opacity = 1, align = "center", height = 0.1, pos = vector(1.1 * cosTheta, 1.1 * sinTheta - 0.65, 0.095) + self.mt1Pos))
+            majorUnit.rotate(angle = theta - np.pi / 2, axis = vector(0, 0, 1))
+            staticParts.add(box(color = color.black, pos = vector(cosTheta, sinTheta - 0.65, 0.08) + self.mt1Pos, size = vector(0.1, 0.02, 0.02), axis = vector(cosTheta, sinTheta, 0)))
+        # Draw the virtual meter scale minor marks.
+        minorScale = meterGeometry.get("arcScale", self.mt1ScaleMin, self.mt1ScaleMax, 5 * np.pi / 6, np.pi / 6, 10)
+        for unitCounter, theta, cosTheta, sinTheta in zip(range(self.mt1ScaleMin * 10, (self.mt1ScaleMax * 10) + 1), minorScale["theta"], minorScale["cos"], minorScale["sin"]):
+            if unitCounter % 5 == 0 and unitCounter % 10 != 0: # Draw the minor unit midway between the major marks.
+                minorUnit = staticParts.add(text(text = "5", color = self.mt1Color, opacity = 1, align = "center", height = 0.05, pos = vector(1.05 * cosTheta, 1.05 * sinTheta - 0.65, 0.095) + self.mt1Pos))
+                minorUnit.rotate(angle = theta - np.pi / 2, axis = vector(0, 0, 1))
+            staticParts.add(box(color = color.black, pos = vector(cosTheta, sinTheta - 0.65, 0.08) + self.mt1Pos, size = vector(0.05, 0.01, 0.01), axis = vector(cosTheta, sinTheta, 0)))
+        # Meter Label and Units.
+        staticParts.add(text(text = self.mt1Label, color = self.mt1Color, opacity = 1, align = "center", height = 0.1, pos = vector(0, 0.6, 0.1) + self.mt1Pos, axis = vector(1, 0, 0)))
+        staticParts.add(text(text = self.mt1Units, color = self.mt1Color, opacity = 1, align = "center", height = 0.115, pos = vector(0, 0, 0.1) + self.mt1Pos, axis = vector(1, 0, 0)))
+        # Add the raw reading too - this is initially not visible as the value may not be provided in future updates.
+        self.rawValue = shadowPrimitive(label(text = "0000", visible = False, color = self.mt1Color, height = 10, opacity = 0, box = False, pos = vector(-0.75, 0.6, 0.1) + self.mt1Pos), text = "0000", visible = False)
+        # Add the digital reading too.
+        self.digitalValue = shadowPrimitive(label(text = "0.00V", visible = True, color = self.mt1Color, height = 10, opacity = 0, box = False, pos = vector(0.75, 0.6, 0.1) + self.mt1Pos), text = "0.00V")
+        # Add a 30%/70% band indicator RGB Color LED.
+        self.voltageRGBLED  = rgbColorLED(vector(0.75, -0.425, 0.05) + self.mt1Pos, self.mt1ScaleRange * 0.3, self.mt1ScaleRange * 0.7, staticParts = staticParts)
+        # Corner screws.
+        drawScrew(vector(-1.045, 0.67, -0.03) + self.mt1Pos, staticParts)  # Top Left corner.
+        drawScrew(vector(1.045, 0.67, -0.03) + self.mt1Pos, staticParts)   # Top Right corner.
+        drawScrew(vector(-1.045, -0.67, -0.03) + self.mt1Pos, staticParts) # Bottom Left corner.
+        drawScrew(vector(1.045, -0.67, -0.03) + self.mt1Pos, staticParts)  # Bottom Right corner.
+        staticParts.finish()
+        # Lets put a mostly transparent glass cover over the virtual meter.
+        box(color = color.white, opacity = 0.25, size = vector(2.25, 1.5, 0.32), pos = vector(0, 0, 0.15) + self.mt1Pos)
+        # At this point we have no data to drive the virtual meter.
+        self.DataWarning = shadowPrimitive(text(text = "-No Data-", color = self.mt1Color, opacity = 1, align = "center", height = 0.125, pos = vector(0, -0.25, 0.2) + self.mt1Pos, axis = vector(1, 0, 0)), opacity = 1)
+    def update(self, mt1Value = "NAN", mt1RawValue = "-1"):
+        if mt1Value != "nan":
+            # Clip the virtual meter value if it is out of range.
+            self.mt1Value = np.clip(mt1Value, self.mt1ScaleMin, self.mt1ScaleMax)
+            # If we have a raw value, store it and make it visible.
+            if mt1RawValue != "-1":
+                self.mt1RawValue = mt1RawValue
+                self.rawValue.visible = True
+            else:
+                self.rawValue.visible = False
+            # Turn off the data warning.
+            self.DataWarning.opacity = 0
+            # Print the raw potentiometer value.
+            self.rawValue.text = str("<i>%04d</i>" % self.mt1RawValue)
+            # Print the digital value.
+            self.digitalValue.text = str("%1.2f" % self.mt1Value) + "V"
+            # Use the value to set the angle of virtual meter needle... explanation...
+            #   0V is 5pi/6 rads, 5V is pi/6 rads, thus the needle movement range is 4pi/6 rads.
+            #   The value range is ScaleMin -> ScaleMax, or ScaleRange, so needle angle is the (needle range * value/max) ratio.
+            #       = 4pi/6 * (Value - ScaleMin) / ScaleRange rads.
+            #   Thus, the needle position is 5pi/6 - (4pi/6 * (Value - ScaleMin) / ScaleRange) rads.
+            # e.g. ScaleMin = -5, ScaleMax = +5, ScaleRange = 10 => needle position is 5pi/6 - (4pi/6 * (Value - -5) / 10) rads
+            # With animation, the needle moves there by itself, a little every frame.
+            if self.needleMotion is not None:
+                meterMotion.setTarget(self.needleMotion, (self.mt1Value - self.mt1ScaleMin) / self.mt1ScaleRange)
+            else:
+                theta  = (5 * np.pi / 6) - (4 * np.pi / 6 * ((self.mt1Value - self.mt1ScaleMin) / self.mt1ScaleRange))
+                self.meterNeedle.axis = vector(np.cos(theta), np.sin(theta), 0)
+            # Update the rgbLED.
+            self.voltageRGBLED.update(self.mt1Value)
+        else:
+            # Turn on the data warning.
+            self.DataWarning.opacity = 1
+
+# Meter Type 2 - A circular style virtual meter with a scale and a curved 101 segment bar.
+class meterType2:
+    def __init__(self, mt2Pos = vector(0, 0, 0), mt2Color = color.blue, mt2ScaleMin = 0, mt2ScaleMax = 100, mt2Label = "", mt2Units = "", staticParts = None):
+        self.mt2Pos = mt2Pos
+        self.mt2Color = mt2Color
+        self.mt2ScaleMin = int(mt2ScaleMin)
+        self.mt2ScaleMax = int(mt2ScaleMax)
+        self.mt2ScaleRange = mt2ScaleMax - mt2ScaleMin
+        self.mt2Label = mt2Label
+        self.mt2Units = mt2Units
+        # Draw the virtual meter...
+        staticParts = startStaticParts(staticParts)
+        staticParts.add(cylinder(color = color.white, opacity = 1, radius = 0.85, pos = vector(0, 0, -0.05) + self.mt2Pos, axis = vector(0, 0, 0.1))) # Draw the virtual meter dial.
+        # Draw the virtual meter segments and set them to "off" status.
+        self.meterSegments = [] # A list in which to put all the virtual meter segments for later reference and update.
+        segmentScale = meterGeometry.get("arcScale", 0, 100, 8 * np.pi / 6, np.pi / 6, 1)
+        for segmentCounter, cosTheta, sinTheta in zip(range(100 + 1), segmentScale["cos"], segmentScale["sin"]):
+            # Box segments have an off opacity equal to their proportional postion in the range, and point at the centre.
+            meterSegment = box(color = color.white, opacity = segmentCounter / self.mt2ScaleRange, size = vector(0.15, 0.025, 0.02), pos = vector(0.55 * cosTheta, 0.55 * sinTheta, 0.095) + self.mt2Pos, axis = vector(-cosTheta, -sinTheta, 0))
+            self.meterSegments.append(meterSegment)
+        # The segment colours, off is white and on is the meter colour, and the state of every segment.
+        self.segmentPalette = [color.white, self.mt2Color]
+        self.segmentBar = segmentBarState(np.ones(100 + 1), np.arange(100 + 1) / self.mt2ScaleRange)
+        # Draw the virtual meter scale major marks.
+        unitScale = meterGeometry.get("arcScale", self.mt2ScaleMin, self.mt2ScaleMax, 8 * np.pi / 6, np.pi / 6, 1)
+        for unitCounter, theta, cosTheta, sinTheta in zip(range(self.mt2ScaleMin, self.mt2ScaleMax + 1), unitScale["theta"], unitScale["cos"], unitScale["sin"]):
+            if unitCounter % 10 ==0:
+                majorUnit = staticParts.add(text(text = str(unitCounter), color = self.mt2Color, opacity = 1, align = "center", height = 0.065, pos = vector(0.75 * cosTheta, 0.75 * sinTheta, 0.095) + self.mt2Pos))
+                majorUnit.rotate(angle = theta - np.pi / 2, axis = vector(0, 0, 1))
+                staticParts.add(box(color = color.black, pos = vector(0.685 * cosTheta, 0.685 * sinTheta, 0.095) + self.mt2Pos, size = vector(0.1, 0.02, 0.02), axis = vector(cosTheta, sinTheta, 0)))
+        # Draw the virtual meter scale minor marks.
+        for unitCounter, theta, cosTheta, sinTheta in zip(range(self.mt2ScaleMin, self.mt2ScaleMax + 1), unitScale["theta"], unitScale["cos"], unitScale["sin"]):
+            if unitCounter % 5 == 0 and unitCounter % 10 != 0: # Draw the minor unit midway between the major marks.
+                minorUnit = staticParts.add(text(text = "5", color = self.mt2Color, opacity = 1, align = "center", height = 0.05, pos = vector(0.72 * cosTheta, 0.72 * sinTheta, 0.095) + self.mt2Pos))
+                minorUnit.rotate(angle = theta - np.pi / 2, axis = vector(0, 0, 1))
+            staticParts.add(box(color = color.black, pos = vector(0.685 * cosTheta, 0.685 * sinTheta, 0.095) + self.mt2Pos, size = vector(0.05, 0.01, 0.01), axis = vector(cosTheta, sinTheta, 0)))
+        # Meter Label and Units.
+        staticParts.add(text(text = self.mt2Label, color = self.mt2Color, opacity = 1, align = "center", height = 0.1, pos = vector(0, 0.2, 0.1) + self.mt2Pos, axis = vector(1, 0, 0)))
+        staticParts.add(text(text = self.mt2Units, color = self.mt2Color, opacity = 1, align = "center", height = 0.115, pos = vector(0, -0.3, 0.1) + self.mt2Pos, axis = vector(1, 0, 0)))
+        # Add the raw digital reading too.
+        self.rawValue = shadowPrimitive(label(text = "00.0", color = self.mt2Color, height = 10, opacity = 0, box = False, pos = vector(0.5, 0, 0.1) + self.mt2Pos), text = "00.0")
+        # Center screw.
+        drawScrew(vector(0, 0, -0.03) + self.mt2Pos, staticParts)
+        staticParts.finish()
+        # Lets put a mostly transparent glass cover over the virtual meter.
+        cylinder(color = color.white, opacity = 0.25, radius = 0.85, pos = vector(0, 0, -0.05) + self.mt2Pos, axis = vector(0, 0, 0.25))
+        # At this point we have no data to drive the virtual meter.
+        self.DataWarning = shadowPrimitive(text(text = "-No Data-", color = self.mt2Color, opacity = 1, align = "center", height = 0.125, pos = vector(0, -0.5, 0.2) + self.mt2Pos, axis = vector(1, 0, 0)), opacity = 1)
+    def update(self, mt2Value = "NAN"):
+        # If we have valid data.
+        if mt2Value != "NAN":
+            # Clip the virtual meter value if it is out of range.
+            self.mt2Value = np.clip(mt2Value, self.mt2ScaleMin, self.mt2ScaleMax)
+            # Turn off the data warning.
+            self.DataWarning.opacity = 0
+            # Print the raw digital sensor value.
+            self.rawValue.text = str("<i>%2.1f</i>" % self.mt2Value)
+            # Calculate the proportion of segments to light.
+            meterSegmentsOn = ((self.mt2Value - self.mt2ScaleMin) / self.mt2ScaleRange * 100) + 1
+            # Work out the colour and opacity of every segment at once, then only update the segments that have changed.
+            # On (fully or partially) segments are the meter colour, fully on segments are opacity 1, a partially on segment
+            # has the fractional part as its opacity, and off segments have an opacity equal to their position in the range.
+            changedSegments = self.segmentBar.update(meterSegmentsOn)
+            self.segmentBar.apply(self.meterSegments, self.segmentPalette, changedSegments)
+        else:
+            # Turn on the data warning.
+            self.DataWarning.opacity = 1
+
+# Meter Type 3 - A thermometer style virtual meter with a scale and rising column.
+class meterType3:
+    def __init__(self, mt3Pos = vector(0, 0, 0), mt3Color = color.red, mt3ScaleMin = 0.0, mt3ScaleMax = 100.0, mt3Label = "", mt3Units = "", staticParts = None):
+        self.mt3Pos = mt3Pos
+        self.mt3Color = mt3Color
+        self.mt3ScaleMin = mt3ScaleMin
+        self.mt3ScaleMax = mt3ScaleMax
+        self.mt3Range = mt3ScaleMax - mt3ScaleMin
+        self.mt3Label = mt3Label
+        self.mt3Units = mt3Units
+        # Draw the virtual meter...
+        staticParts = startStaticParts(staticParts)
+        staticParts.add(box(color = color.white, opacity = 1, size = vector(0.75, 1.75, 0.1), pos = vector(0, 0, 0) + self.mt3Pos)) # Draw the virtual meter box.
+        staticParts.add(sphere(color = self.mt3Color, radius = 0.1, pos = vector(0, -0.65, 0.15) + self.mt3Pos))
+        staticParts.add(cylinder(color = color.gray(0.5), opacity = 1, pos = vector(0, -0.65, 0.15) + self.mt3Pos, axis = vector(0, 1.15, 0), radius = 0.049))
+        staticParts.add(sphere(color = color.gray(0.5), opacity = 1, radius = 0.049, pos = vector(0, 0.5, 0.15) + self.mt3Pos))
+        self.measurement = shadowPrimitive(cylinder(color = self.mt3Color, pos = vector(0, -.65, 0.15) + self.mt3Pos, axis = vector(0, 0.15, 0), radius = 0.05), axis = vector(0, 0.15, 0))
+        self.measurementMotion = meterMotion.add(self.measurement, columnKind) if meterMotion is not None else None
+        majorTicks = meterGeometry.get("linearScale", self.mt3ScaleMin, self.mt3ScaleMax, 11)
+        for unitCounter, tick in zip(majorTicks["values"], majorTicks["offsets"]):
+            staticParts.add(text(text = str(unitCounter), color = self.mt3Color, align = "right", height = 0.05, pos = vector(-0.15, -0.6725 + 0.15 + tick, 0.15) + self.mt3Pos))
+            staticParts.add(box(color = color.black, pos = vector(-0.1, -0.65 + 0.15 + tick, 0.15) + self.mt3Pos, size = vector(0.05, 0.01, 0.01), axis = vector(1, 0, 0)))
+        for tick in meterGeometry.get("linearScale", self.mt3ScaleMin, self.mt3ScaleMax, 51)["offsets"]:
+            staticParts.add(box(color = color.black, pos = vector(-0.1, -0.65 + 0.15 + tick, 0.15) + self.mt3Pos, size = vector(0.025, 0.005, 0.005), axis = vector(1, 0, 0)))
+        staticParts.add(text(text = self.mt3Label, color = self.mt3Color, opacity = 1, align = "center", height = 0.075, pos = vector(0, 0.6, 0.15) + self.mt3Pos, axis = vector(1, 0, 0)))
+        staticParts.add(text(text = self.mt3Units, color = self.mt3Color, opacity = 1, align = "left", height = 0.095, pos = vector(0.125, -0.685, 0.15) + self.mt3Pos, axis = vector(1, 0, 0)))
+        # Add the raw reading too.
+        self.rawValue = shadowPrimitive(label(text = "00.0", color = self.mt3Color, height = 10, opacity = 0, box = False, pos = vector(0, -0.82, 0.1) + self.mt3Pos), text = "00.0")
+        # Corner screws.
+        drawScrew(vector(-0.3, 0.8, -0.03) + self.mt3Pos, staticParts)  # Top Left corner.
+        drawScrew(vector(0.3, 0.8, -0.03) + self.mt3Pos, staticParts)   # Top Right corner.
+        drawScrew(vector(-0.3, -0.8, -0.03) + self.mt3Pos, staticParts) # Bottom Left corner.
+        drawScrew(vector(0.3, -0.8, -0.03) + self.mt3Pos, staticParts)  # Bottom Right corner.
+        staticParts.finish()
+        # Lets put a mostly transparent glass cover over the virtual meter.
+        box(color = color.white, opacity = 0.25, size = vector(0.75, 1.75, 0.32), pos = vector(0, 0, 0.1) + self.mt3Pos)
+        # At this point we have no data to drive the virtual meter.
+        self.DataWarning = shadowPrimitive(text(text = "-No Data-", color = self.mt3Color, opacity = 1, align = "center", height = 0.125, pos = vector(0, 0, 0.2) + self.mt3Pos, axis = vector(1, 0, 0)), opacity = 1)
+    def update(self, mt3Value = "NAN"):
+        # If we have valid data.
+        if mt3Value != "NAN":
+            # Clip the virtual meter value if it is out of range.
+            self.mt3Value = np.clip(mt3Value, self.mt3ScaleMin, self.mt3ScaleMax)
+            # Turn off the data warning.
+            self.DataWarning.opacity = 0
+            # Print the raw digital sensor value.
+            self.rawValue.text = str("<i>%2.1f</i>" % self.mt3Value)
+            # Update the virtual meter reading - basically converting the measurement to a proportion of the unit length column.
+            if self.measurementMotion is not None:
+                meterMotion.setTarget(self.measurementMotion, (self.mt3Value - self.mt3ScaleMin) / self.mt3Range)
+            else:
+                self.measurement.axis = vector(0, 0.15 + ((self.mt3Value - self.mt3ScaleMin)  / self.mt3Range), 0)
+        else:
+            # Turn on the data warning.
+            self.DataWarning.opacity = 1
+
+# Meter Type 4 - A 10 segment LED bank style virtual meter with blue, green and red LEDs that illuminate from left to right, or bottom to top.
+class meterType4:
+    def __init__(self, mt4Pos = vector(0, 0, 0), mt4InARow = True, mt4OffColor = color.gray(0.5), mt4ScaleMin = 0.0, mt4ScaleMax = 100.0, staticParts = None):
+        self.mt4Pos = mt4Pos
+        self.mt4InARow = mt4InARow
+        self.mt4OffColor = mt4OffColor
+        self.mt4ScaleMin = mt4ScaleMin
+        self.mt4ScaleMax = mt4ScaleMax
+        self.mt4Range = mt4ScaleMax - mt4ScaleMin
+        # Draw the LED bank...
+        staticParts = startStaticParts(staticParts)
+        if self.mt4InARow:
+            staticParts.add(box(color = color.white, opacity = 1, size = vector(0.775, 0.2, 0.16), pos = vector(0, 0, 0.08) + self.mt4Pos)) # Draw the LED box horizontally.
+        else:
+            staticParts.add(box(color = color.white, opacity = 1, size = vector(.2, 0.775, 0.16), pos = vector(0, 0, 0.08) + self.mt4Pos)) # Draw the LED box vertically.
+        # Draw the LED bank segments and set them to off status.
+        self.ledSegments = [] # A list in which to put all the LED segments for later reference and update.
+        for axisOffset in meterGeometry.get("ledRow", 10, 0.675)["offsets"]: # The LED bank has 10 LEDs, in a row or a column.
+            if self.mt4InARow:
+                self.ledSegments.append(box(color = self.mt4OffColor, opacity = 1 , size = vector(0.05, 0.15, 0.07), pos = vector(axisOffset, 0, 0.13) + self.mt4Pos, axis = vector(0, 0, 0)))
+                staticParts.add(cylinder(color = color.white, opacity = 1, pos = vector(axisOffset, 0.05, 0.095) + self.mt4Pos, axis = vector(0, 0, -0.35), radius = 0.01))
+                staticParts.add(cylinder(color = color.white, opacity = 1, pos = vector(axisOffset, -0.05, 0.095) + self.mt4Pos, axis = vector(0, 0, -0.3), radius = 0.01))
+            else:
+                self.ledSegments.append(box(color = self.mt4OffColor, opacity = 1 , size = vector(0.15, 0.05, 0.07), pos = vector(0, axisOffset, 0.13) + self.mt4Pos, axis = vector(0, 0, 0)))
+                staticParts.add(cylinder(color = color.white, opacity = 1, pos = vector(0.05, axisOffset, 0.095) + self.mt4Pos, axis = vector(0, 0, -0.35), radius = 0.01))
+                staticParts.add(cylinder(color = color.white, opacity = 1, pos = vector(-0.05, axisOffset, 0.095) + self.mt4Pos, axis = vector(0, 0, -0.3), radius = 0.01))
+        # The LED colours, off then the first 3 LEDs are blue, the middle 4 LEDs are green and the remaining 3 LEDs are red.
+        # Fully on or off LEDs are opacity 1, and an LED is only partially on if it is more than 25% on.
+        self.ledPalette = [self.mt4OffColor, color.blue, color.green, color.red]
+        self.ledBar = segmentBarState([1, 1, 1, 2, 2, 2, 2, 3, 3, 3], np.ones(10), partialMinimum = 0.25)
+        staticParts.finish()
+        # At this point we have no data to drive the virtual meter.
+        self.DataWarning = shadowPrimitive(text(text = "-No Data-", color = self.mt4OffColor, opacity = 1, align = "center", height = 0.1, pos = vector(0, -0.055, 0.2) + self.mt4Pos, axis = vector(1, 0, 0)), opacity = 1)
+    def update(self, mt4Value = "NAN"):
+        # If we have valid data.
+        if mt4Value != "NAN":
+            # Clip the virtual meter value if it is out of range.
+            self.mt4Value = np.clip(mt4Value, self.mt4ScaleMin, self.mt4ScaleMax)
+            # Turn off the data warning.
+            self.DataWarning.opacity = 0
+            # Calculate the proportion of LED segments to light.
+            ledSegmentsOn = (self.mt4Value - self.mt4ScaleMin) / self.mt4Range * 10
+            # Work out the colour and opacity of every LED at once, then only update the LEDs that have changed.
+            changedSegments = self.ledBar.update(ledSegmentsOn)
+            self.ledBar.apply(self.ledSegments, self.ledPalette, changedSegments)
+        else:
+            # Turn on the data warning.
+            self.DataWarning.opacity = 1
+
+# A simple LED.
+class smallLED():
+    def __init__(self, smallLEDPos = vector(0, 0, 0), offColor = color.gray(0.5), staticParts = None):
+        self.smallLEDPos = smallLEDPos
+        self.offColor = offColor
+        self.ledDome = shadowPrimitive(sphere(color = self.offColor, opacity = 1, radius = 0.1, pos = vector(0, 0, 0.15) + self.smallLEDPos), color = self.offColor)
+        self.ledBody = shadowPrimitive(cylinder(color = self.offColor, opacity = 1, pos = vector(0, 0, 0.15) + self.smallLEDPos, axis = vector(0, 0, -0.1), radius = 0.1), color = self.offColor)
+        self.ledBase = shadowPrimitive(cylinder(color = self.offColor, opacity = 1, pos = vector(0, 0, 0.05) + self.smallLEDPos, axis = vector(0, 0, -0.05), radius = 0.125), color = self.offColor)
+        staticParts = startStaticParts(staticParts)
+        staticParts.add(cylinder(color = color.white, opacity = 1, pos = vector(-0.05, 0, 0) + self.smallLEDPos, axis = vector(0, 0, -0.25), radius = 0.01))
+        staticParts.add(cylinder(color = color.white, opacity = 1, pos = vector(0.05, 0, 0) + self.smallLEDPos, axis = vector(0, 0, -0.30), radius = 0.01))
+        staticParts.finish()
+    def update(self, smallLEDColor = "default"):
+        if smallLEDColor == "default":
+            self.color = self.offColor
+        else:
+            self.color = smallLEDColor
+        self.ledDome.color = self.color
+        self.ledBody.color = self.color
+        self.ledBase.color = self.color
+# A horizontal or vertical bank of 3 simple LEDs.
+class rgbLEDBank():
+    def __init__(self, rgbLEDBankPos = vector(0, 0, 0), rgbInARow = True, bgThreshold = 5, rgThreshold = 30, hysteresis = 0.5, staticParts = None):
+        self.rgbLEDBankPos = rgbLEDBankPos
+        self.rgbInARow = rgbInARow
+        self.bgThreshold = bgThreshold
+        self.rgThreshold = rgThreshold
+        self.hysteresis = hysteresis
+        # The blue, green and red bands, with hysteresis to stabilise the LEDs if a reading is jittering around a boundary.
+        self.thresholds = thresholdClassifier((self.bgThreshold, self.rgThreshold), self.hysteresis)
+        self.band = None # No LED is lit yet.
+        staticParts = startStaticParts(staticParts)
+        if self.rgbInARow:  # Draw the LEDs horizontally.
+            self.blueLED  = smallLED(vector(-0.25, 0, 0) + self.rgbLEDBankPos, staticParts = staticParts)
+            self.greenLED = smallLED(vector(0, 0, 0) + self.rgbLEDBankPos, staticParts = staticParts)
+            self.redLED   = smallLED(vector(0.25, 0, 0) + self.rgbLEDBankPos, staticParts = staticParts)            
+        else:               # Draw the LEDs vertically.
+            self.blueLED  = smallLED(vector(0, -0.25, 0) + self.rgbLEDBankPos, staticParts = staticParts)
+            self.greenLED = smallLED(vector(0, 0, 0) + self.rgbLEDBankPos, staticParts = staticParts)
+            self.redLED   = smallLED(vector(0, 0.25, 0) + self.rgbLEDBankPos, staticParts = staticParts)
+        staticParts.finish()
+    def update(self, sensorValue = "NAN"):
+        band = self.thresholds.classify(sensorValue)
+        # If we have valid data, and it has moved into a new band.
+        if band is not None and band != self.band:
+            self.sensorValue = sensorValue
+            self.band = band
+            if self.band == 0: # Under the blue-green threshold.
+                self.blueLED.update(color.blue)
+                self.greenLED.update()
+                self.redLED.update()
+            if self.band == 1: # Within the thresholds for green.
+                self.blueLED.update()
+                self.greenLED.update(color.green)
+                self.redLED.update()
+            if self.band == 2: # Over the green-red threshold.
+                self.blueLED.update()
+                self.greenLED.update()
+                self.redLED.update(color.red)
+# A 3 discrete RGB color LED.
+class rgbColorLED():
+    def __init__(self, rgbColorLEDPos = vector(0, 0, 0), bgThreshold = 1.5, rgThreshold = 3.5, hysteresis = 0.5, offColor = color.gray(0.5), staticParts = None):
+        self.rgbColorLEDPos = rgbColorLEDPos
+        self.offColor = offColor
+        self.bgThreshold = bgThreshold
+        self.rgThreshold = rgThreshold
+        self.hysteresis = hysteresis
+        # The blue, green and red bands, with hysteresis to stabilise the LED if a reading is jittering around a boundary.
+        self.thresholds = thresholdClassifier((self.bgThreshold, self.rgThreshold), self.hysteresis)
+        self.band = None # The LED is not lit yet.
+        self.ledDome = shadowPrimitive(sphere(color = self.offColor, opacity = 1, radius = 0.1, pos = vector(0, 0, 0.15) + self.rgbColorLEDPos), color = self.offColor)
+        self.ledBody = shadowPrimitive(cylinder(color = self.offColor, opacity = 1, pos = vector(0, 0, 0.15) + self.rgbColorLEDPos, axis = vector(0, 0, -0.1), radius = 0.1), color = self.offColor)
+        self.ledBase = shadowPrimitive(cylinder(color = self.offColor, opacity = 1, pos = vector(0, 0, 0.05) + self.rgbColorLEDPos, axis = vector(0, 0, -0.05), radius = 0.125), color = self.offColor)
+        staticParts = startStaticParts(staticParts)
+        staticParts.add(cylinder(color = color.white, opacity = 1, pos = vector(-0.06, 0, 0) + self.rgbColorLEDPos, axis = vector(0, 0, -0.25), radius = 0.01))
+        staticParts.add(cylinder(color = color.white, opacity = 1, pos = vector(-0.02, 0, 0) + self.rgbColorLEDPos, axis = vector(0, 0, -0.30), radius = 0.01))
+        staticParts.add(cylinder(color = color.white, opacity = 1, pos = vector(0.02, 0, 0) + self.rgbColorLEDPos, axis = vector(0, 0, -0.35), radius = 0.01))
+        staticParts.add(cylinder(color = color.white, opacity = 1, pos = vector(0.06, 0, 0) + self.rgbColorLEDPos, axis = vector(0, 0, -0.25), radius = 0.01))
+        staticParts.finish()
+    def update(self, sensorValue = "NAN"):
+        band = self.thresholds.classify(sensorValue)
+        # If we have valid data, and it has moved into a new band.
+        if band is not None and band != self.band:
+            self.sensorValue = sensorValue
+            self.band = band
+            self.color = (color.blue, color.green, color.red)[self.band] # Under, within or over the thresholds.
+            self.ledDome.color = self.color
+            self.ledBody.color = self.color
+            self.ledBase.color = self.color
+# A full range RGB tricolor LED.
+class rgbTriColorLED():
+    def __init__(self, rgbTriColorLEDPos = vector(0, 0, 0), offColorR = 127, offColorG = 127, offColorB = 127, staticParts = None):
+        self.rgbTriColorLEDPos = rgbTriColorLEDPos
+        self.offColorR = offColorR / 255
+        self.offColorG = offColorG / 255
+        self.offColorB = offColorB / 255
+        self.offColor = vector(self.offColorR, self.offColorG, self.offColorB)
+        self.ledDome = shadowPrimitive(sphere(color = self.offColor, opacity = 1, radius = 0.1, pos = vector(0, 0, 0.15) + self.rgbTriColorLEDPos), color = self.offColor)
+        self.ledBody = shadowPrimitive(cylinder(color = self.offColor, opacity = 1, pos = vector(0, 0, 0.15) + self.rgbTriColorLEDPos, axis = vector(0, 0, -0.1), radius = 0.1), color = self.offColor)
+        self.ledBase = shadowPrimitive(cylinder(color = self.offColor, opacity = 1, pos = vector(0, 0, 0.05) + self.rgbTriColorLEDPos, axis = vector(0, 0, -0.05), radius = 0.125), color = self.offColor)
+        staticParts = startStaticParts(staticParts)
+        staticParts.add(cylinder(color = color.white, opacity = 1, pos = vector(-0.06, 0, 0) + self.rgbTriColorLEDPos, axis = vector(0, 0, -0.25), radius = 0.01))
+        staticParts.add(cylinder(color = color.white, opacity = 1, pos = vector(-0.02, 0, 0) + self.rgbTriColorLEDPos, axis = vector(0, 0, -0.30), radius = 0.01))
+        staticParts.add(cylinder(color = color.white, opacity = 1, pos = vector(0.02, 0, 0) + self.rgbTriColorLEDPos, axis = vector(0, 0, -0.35), radius = 0.01))
+        staticParts.add(cylinder(color = color.white, opacity = 1, pos = vector(0.06, 0, 0) + self.rgbTriColorLEDPos, axis = vector(0, 0, -0.25), radius = 0.01))
+        staticParts.finish()
+    def update(self, rgbTriColorLEDR = "default", rgbTriColorLEDG = "default", rgbTriColorLEDB = "default"):
+        if rgbTriColorLEDR == "default":
+            self.colorR = self.offColorR
+        else:
+            self.colorR = rgbTriColorLEDR / 255
+        if rgbTriColorLEDG == "default":
+            self.colorG = self.offColorG
+        else:
+            self.colorG = rgbTriColorLEDG / 255
+        if rgbTriColorLEDB == "default":
+            self.colorB = self.offColorB
+        else:
+            self.colorB = rgbTriColorLEDB / 255
+        self.color = vector(self.colorR, self.colorG, self.colorB)
+        self.ledDome.color = self.color
+        self.ledBody.color = self.color
+        self.ledBase.color = self.color
+
+# Convert a layout colour, a vPython colour name or [red, green, blue], to a vPython colour.
+def layoutColor(colorSpec = "red"):
+    if isinstance(colorSpec, str):
+        return getattr(color, colorSpec)
+    return vector(*colorSpec)
+
+# Build a meter from its layout. The layout names match the meter parameters, without their prefix, e.g. "scaleMin" is mt1ScaleMin for a meterType1.
+meterParamPrefixes = {"meterType1": "mt1", "meterType2": "mt2", "meterType3": "mt3", "meterType4": "mt4", "rgbLEDBank": "rgb"}
+def buildMeter(meterSpec, staticParts = None):
+    meterArgs = {}
+    for (specName, specValue) in meterSpec.items():
+        if specName in ("pos", "color", "offColor"):
+            specValue = vector(*specValue) if specName == "pos" else layoutColor(specValue)
+        elif specName == "thresholds":
+            (meterArgs["bgThreshold"], meterArgs["rgThreshold"]) = specValue
+            continue
+        elif specName == "hysteresis":
+            meterArgs["hysteresis"] = specValue
+            continue
+        elif specName not in ("scaleMin", "scaleMax", "label", "units", "inARow"):
+            continue # The name, type, channels and so on are for the panel.
+        meterArgs[meterParamPrefixes[meterSpec["type"]] + specName[0].upper() + specName[1:]] = specValue
+    if meterSpec["type"] == "rgbLEDBank":
+        meterArgs["rgbLEDBankPos"] = meterArgs.pop("rgbPos")
+    return globals()[meterSpec["type"]](staticParts = staticParts, **meterArgs)
+
+# A meter panel, the EasiFace meter panel by default, or any other panel layout (a file path or an already loaded layout).
+# Each meter is kept as an attribute of the panel, by its name in the layout. With lazy meters, a meter is only built when
+# its channel first has a valid reading, so a large panel starts quickly and meters that never get any data cost nothing.
+class easiFacePanel():
+    def __init__(self, panelLayout = None, lazyMeters = None):
+        self.panelLayout = checkLayout(panelLayout) if isinstance(panelLayout, dict) else loadLayout(panelLayout)
+        self.lazyMeters = self.panelLayout.get("lazyMeters", False) if lazyMeters is None else lazyMeters
+        self.meterSpecs = {meterSpec["name"]: meterSpec for meterSpec in self.panelLayout["meters"]}
+        # The meters driven by each channel, in layout order, as (meter name, raw channel or None).
+        self.channelMeters = {}
+        for meterSpec in self.panelLayout["meters"]:
+            self.channelMeters.setdefault(meterSpec["channel"], []).append((meterSpec["name"], meterSpec.get("rawChannel")))
+        self.meters = {} # The meters that have been built, by name.
+        # All the static parts of the whole panel end up in a single compound.
+        staticParts = startStaticParts()
+        # Lets draw some virtual meters.
+        if not self.lazyMeters:
+            for meterSpec in self.panelLayout["meters"]:
+                self.meters[meterSpec["name"]] = buildMeter(meterSpec, staticParts)
+                setattr(self, meterSpec["name"], self.meters[meterSpec["name"]])
+        # Now lets stamp my logo and name on the virtual meter display... and "EasiFace" is my logo - you need your own!
+        # Warning - I found that when the logo text had a space in it, it broke vPython.
+        for logoLine in self.panelLayout.get("logo", []):
+            (logoRadiusX, logoRadiusY) = logoLine["radius"]
+            logoText = logoLine["text"]
+            for letterCounter, theta in zip(range(len(logoText)), np.linspace(5 * np.pi / 8, 3 * np.pi / 8, len(logoText))):
+                logoCharacter = staticParts.add(text(text = logoText[letterCounter], color = color.green, opacity = 1, align = "center", height = 0.2, pos = vector(logoRadiusX * np.cos(theta), logoRadiusY * np.sin(theta) - 3, -0.035), axis = vector(1, 0, 0)))
+                logoCharacter.rotate(angle = theta - np.pi / 2, axis = vector(0, 0, 1))
+        # Next, lets put a pyramid below the logo, just because we can.
+        if self.panelLayout.get("pyramid", False):
+            staticParts.add(pyramid(pos = vector(0, -2, 0), color = color.green, size = vector(0.5, 0.25, 0.25), axis = vector(0, 1, 0)))
+        # Finally, lets mount it all on a dark gray metal panel and screw that onto the canvas.
+        if "backPanel" in self.panelLayout:
+            backPanel = self.panelLayout["backPanel"]
+            box(color = layoutColor(backPanel.get("color", [0.5, 0.5, 0.5])), opacity = 1, texture = textures.metal, size = vector(*backPanel["size"]), pos = vector(*backPanel["pos"]))
+        for screwPos in self.panelLayout.get("screws", []):
+            drawScrew(vector(*screwPos), staticParts)
+        staticParts.finish()
+        self.staticParts = staticParts
+        meterGeometry.save()
+    # Build a lazy meter, with its own static parts, when its channel first has a valid reading.
+    def buildLazyMeter(self, meterName):
+        meter = self.meters[meterName] = buildMeter(self.meterSpecs[meterName])
+        setattr(self, meterName, meter)
+        meterGeometry.save()
+        return meter
+    # Update every meter driven by the given channels, e.g. {"tDHT11": 21.0, "hDHT11": 45.0}, with the usual "-1" and "NAN" markers.
+    def updateChannels(self, channelValues):
+        meters = self.meters
+        for (channelName, channelValue) in channelValues.items():
+            for (meterName, rawChannelName) in self.channelMeters.get(channelName, ()):
+                meter = meters.get(meterName)
+                if meter is None:
+                    if isinstance(channelValue, str) or channelValue != channelValue:
+                        continue # Still no valid reading for this lazy meter.
+                    meter = self.buildLazyMeter(meterName)
+                if rawChannelName is not None:
+                    meter.update(channelValue, channelValues.get(rawChannelName, "-1"))
+                else:
+                    meter.update(channelValue)
+    # Update the potentiometer voltage meter, with the calculated float voltage and the raw integer value.
+    def updatePot1(self, pot1Voltage = "nan", pot1Value = "-1"):
+        self.updateChannels({"pot1Voltage": pot1Voltage, "pot1Value": pot1Value})
+    # Update the DHT11 and DHT22 temperature and humidity meters, and their LEDs.
+    def updateDHT(self, tDHT11 = "NAN", hDHT11 = "NAN", tDHT22 = "NAN", hDHT22 = "NAN"):
+        self.updateChannels({"tDHT11": tDHT11, "hDHT11": hDHT11, "tDHT22": tDHT22, "hDHT22": hDHT22})
+    # Put an error message on top of the virtual meters, initially not visible.
+    def showSerialError(self):
+        self.serialErrorVisible = 0
+        self.serialError = text(text = "-Serial Error-", color = color.red, opacity = self.serialErrorVisible, align = "center", height = 0.5, pos = vector(0, -0.25, 0.25), axis = vector(1, 0, 0))
+    # Flash the serial error message on top of the virtual meters.
+    def flashSerialError(self):
+        self.serialErrorVisible = (self.serialErrorVisible + 1) % 2 # Using modulo 2 maths to toggle the variable between 0 and 1.
+        self.serialError.opacity = self.serialErrorVisible
+    # Take the serial error message off the virtual meters, e.g. once the serial link is back.
+    def hideSerialError(self):
+        if self.serialErrorVisible:
+            self.serialErrorVisible = 0
+            self.serialError.opacity = 0
+    # Show some text, e.g. the profiling report, along the bottom of the panel. The overlay is only drawn when first used.
+    def showOverlay(self, overlayText = ""):
+        if not hasattr(self, "overlay"):
+            self.overlay = shadowPrimitive(label(text = "", color = color.black, height = 8, opacity = 0, box = False, pos = vector(0, -2.7, 0.3)), text = "")
+        self.overlay.text = overlayText.replace(" | ", "\n")
+
+# EOF
@@ -0,0 +1,129 @@
+# Declarative meter panel layouts, and a cache of the meter geometry, for the Lesson 11 meter panel.
+# A layout file (JSON, or TOML with Python 3.11+) says which meters are on a panel, where they go, what they look like,
+# and which sensor channel drives each one, so a panel can be changed without changing any code. See easiFacePanel.json.
+# The geometry of the meters (the angles and positions of the scale marks, labels and segments) depends only on their
+# parameters, so it is worked out once per set of parameters and kept, in memory and, optionally, in a file on disk.
+# This module does not need vPython, so layouts can be checked, and geometry cached, without a display.
+
+# https://docs.python.org/3/library/json.html
+# https://docs.python.org/3/library/tomllib.html
+# https://numpy.org/doc/stable/reference/generated/numpy.savez.html
+
+
+import os
+import json
+import numpy as np
+
+# The layout used when none is given, the EasiFace meter panel.
+defaultLayoutFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), "easiFacePanel.json")
+
+# The derived values of the analytics plugins, by plugin name. They are kept here, rather than with the plugins in
+# analyticsPipeline.py, so that a layout can be loaded and checked without loading the worker pool and shared memory.
+derivedChannels = {"dewPoint": ("dewPointDHT11", "dewPointDHT22"),
+                   "sensorDrift": ("tDrift", "hDrift", "driftAlarm"),
+                   "anomalyScore": ("anomalyScore",)}
+derivedChannelNames = tuple(derivedName for derivedNames in derivedChannels.values() for derivedName in derivedNames)
+
+# The meter types a layout can use, and the channels that can drive them, including the derived values of the analytics plugins.
+meterTypes = ("meterType1", "meterType2", "meterType3", "meterType4", "rgbLEDBank")
+channelNames = ("pot1Voltage", "pot1Value", "tDHT11", "hDHT11", "tDHT22", "hDHT22") + derivedChannelNames
+
+# Change this whenever a geometry builder changes, so that geometry cached by an older version is never used.
+geometryVersion = 1
+
+# A scale on an arc, from startAngle to endAngle, with unitDivisions marks per unit.
+def arcScaleGeometry(scaleMin = 0, scaleMax = 5, startAngle = 5 * np.pi / 6, endAngle = np.pi / 6, unitDivisions = 1):
+    scaleTheta = np.linspace(startAngle, endAngle, (scaleMax - scaleMin) * unitDivisions + 1)
+    return {"theta": scaleTheta, "cos": np.cos(scaleTheta), "sin": np.sin(scaleTheta)}
+
+# A straight scale with tickCount evenly spaced ticks, from 0 to 1 along the scale, with their values.
+def linearScaleGeometry(scaleMin = 0.0, scaleMax = 100.0, tickCount = 11):
+    return {"values": np.linspace(scaleMin, scaleMax, tickCount), "offsets": np.linspace(0, 1, tickCount)}
+
+# The offsets of a row (or column) of evenly spaced LEDs.
+def ledRowGeometry(ledCount = 10, rowLength = 0.675):
+    return {"offsets": np.linspace(-rowLength / 2, rowLength / 2, ledCount)}
+
+geometryBuilders = {"arcScale": arcScaleGeometry, "linearScale": linearScaleGeometry, "ledRow": ledRowGeometry}
+
+# A cache of meter geometry, keyed by the kind of geometry and its parameters, e.g. "arcScale(0,5,2.618,0.5236,10)".
+# With a cache file, the geometry is loaded from it when the cache is made, and any new geometry is saved to it by save().
+class geometryCache():
+    def __init__(self, cachePath = None):
+        self.cachePath = cachePath
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.unsaved = False
+        if cachePath and os.path.exists(cachePath):
+            self.load()
+    def geometryKey(self, geometryKind, geometryParams):
+        return "%s(%s)" % (geometryKind, ",".join(repr(float(geometryParam)) for geometryParam in geometryParams))
+    # Return the geometry of the given kind and parameters, working it out only if it has not been seen before.
+    def get(self, geometryKind = "arcScale", *geometryParams):
+        geometryKey = self.geometryKey(geometryKind, geometryParams)
+        geometry = self.entries.get(geometryKey)
+        if geometry is not None:
+            self.hits += 1
+            return geometry
+        self.misses += 1
+        geometry = self.entries[geometryKey] = geometryBuilders[geometryKind](*geometryParams)
+        self.unsaved = True
+        return geometry
+    # Load the geometry from the cache file, ignoring it if it is from another geometry version or is unreadable.
+    def load(self):
+        try:
+            with np.load(self.cachePath, allow_pickle = False) as cacheFile:
+                if int(cacheFile["geometryVersion"]) != geometryVersion:
+                    return
+                for arrayName in cacheFile.files:
+                    if "|" in arrayName:
+                        (geometryKey, partName) = arrayName.rsplit("|", 1)
+                        self.entries.setdefault(geometryKey, {})[partName] = cacheFile[arrayName]
+        except (OSError, ValueError, KeyError):
+            self.entries = {}
+    # Save the geometry to the cache file, if there is one and anything new has been worked out.
+    def save(self):
+        if not self.cachePath or not self.unsaved:
+            return
+        cacheArrays = {"%s|%s" % (geometryKey, partName): partArray for (geometryKey, geometry) in self.entries.items() for (partName, partArray) in geometry.items()}
+        # Write to a temporary file first, so a half written cache file is never loaded.
+        with open(self.cachePath + ".tmp", "wb") as cacheFile:
+            np.savez(cacheFile, geometryVersion = geometryVersion, **cacheArrays)
+        os.replace(self.cachePath + ".tmp", self.cachePath)
+        self.unsaved = False
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+# Load a panel layout from a JSON or TOML file, the default EasiFace layout if None.
+def loadLayout(layoutPath = None):
+    layoutPath = defaultLayoutFile if layoutPath is None else layoutPath
+    if layoutPath.endswith(".toml"):
+        import tomllib # Python 3.11+.
+        with open(layoutPath, "rb") as layoutFile:
+            panelLayout = tomllib.load(layoutFile)
+    else:
+        with open(layoutPath, "r", encoding = "utf-8") as layoutFile:
+            panelLayout = json.load(layoutFile)
+    checkLayout(panelLayout)
+    return panelLayout
+
+# Check a layout, so that a mistake in it is reported when it is loaded rather than part way through drawing the panel.
+def checkLayout(panelLayout):
+    meterNames = set()
+    for meterSpec in panelLayout.get("meters", []):
+        meterName = meterSpec.get("name")
+        if not meterName or meterName in meterNames:
+            raise ValueError("Every meter in a panel layout needs its own name: %r" % meterSpec)
+        meterNames.add(meterName)
+        if meterSpec.get("type") not in meterTypes:
+            raise ValueError("Meter %s has an unknown type %r, it should be one of %s." % (meterName, meterSpec.get("type"), ", ".join(meterTypes)))
+        for channelKey in ("channel", "rawChannel"):
+            # Every meter needs a channel to drive it, the raw channel is optional.
+            if (channelKey == "channel" or channelKey in meterSpec) and meterSpec.get(channelKey) not in channelNames:
+                raise ValueError("Meter %s has an unknown %s %r, it should be one of %s." % (meterName, channelKey, meterSpec.get(channelKey), ", ".join(channelNames)))
+        if len(meterSpec.get("pos", ())) != 3:
+            raise ValueError("Meter %s needs a pos of [x, y, z]." % meterName)
+    return panelLayout
+
+# EOF
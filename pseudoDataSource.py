@@ -0,0 +1,153 @@
+# A pseudo data source for testing the Lesson 11 meter panel, and the rest of the pipeline, without an Arduino.
+# The samples are made in large blocks with NumPy, from a signal model for each sensor channel: a random walk, a sine
+# wave with noise, or jitter around a set of thresholds (e.g. the LED thresholds, to exercise their hysteresis). Readings
+# can drop out as NAN at a set rate. The RNG is seeded, so the same seed always gives the same samples, and the samples
+# can be paced at any sample rate, or not paced at all for stress testing.
+
+# https://numpy.org/doc/stable/reference/random/generator.html
+# https://en.wikipedia.org/wiki/Random_walk
+
+
+import time
+import numpy as np
+from sensorHistory import channelNames
+
+# A random walk from startValue, with normally distributed steps, kept between lowValue and highValue.
+# The walk carries on from where the last block finished.
+class randomWalk():
+    def __init__(self, startValue = 50.0, stepSize = 0.5, lowValue = 0.0, highValue = 100.0):
+        self.lastValue = startValue
+        self.stepSize = stepSize
+        self.lowValue = lowValue
+        self.highValue = highValue
+    def generate(self, sampleTimes, rng):
+        walkValues = np.clip(self.lastValue + np.cumsum(rng.normal(0, self.stepSize, len(sampleTimes))), self.lowValue, self.highValue)
+        if len(walkValues):
+            self.lastValue = walkValues[-1]
+        return walkValues
+
+# A sine wave around meanValue, with normally distributed noise added.
+class sineWave():
+    def __init__(self, meanValue = 20.0, amplitude = 10.0, wavePeriod = 60.0, noiseLevel = 0.2):
+        self.meanValue = meanValue
+        self.amplitude = amplitude
+        self.wavePeriod = wavePeriod
+        self.noiseLevel = noiseLevel
+    def generate(self, sampleTimes, rng):
+        return self.meanValue + self.amplitude * np.sin(2 * np.pi * sampleTimes / self.wavePeriod) + rng.normal(0, self.noiseLevel, len(sampleTimes))
+
+# Readings that hover around each of a set of thresholds in turn, for dwellTime seconds each, with normally distributed
+# jitter, so they keep crossing the threshold they are on.
+class thresholdJitter():
+    def __init__(self, thresholds = (30, 70), jitterLevel = 1.0, dwellTime = 5.0):
+        self.thresholds = np.array(thresholds, dtype = float)
+        self.jitterLevel = jitterLevel
+        self.dwellTime = dwellTime
+    def generate(self, sampleTimes, rng):
+        thresholdIndex = (sampleTimes // self.dwellTime).astype(int) % len(self.thresholds)
+        return self.thresholds[thresholdIndex] + rng.normal(0, self.jitterLevel, len(sampleTimes))
+
+# The default signal model of each channel, and the resolution its readings are rounded to.
+# The potentiometer jitters around the 1.5V and 3.5V rgbLEDs thresholds (as raw values), the DHT11 temperature around the
+# 5 and 30 alert LED thresholds, and the rest wander about like the real sensors.
+def defaultChannelModels():
+    return {"pot1Value": (thresholdJitter((1.5 * 1024 / 5, 3.5 * 1024 / 5), 20, 2.0), 1),
+            "tDHT11": (thresholdJitter((5, 30), 0.5, 5.0), 1),
+            "hDHT11": (randomWalk(45, 0.5, 0, 100), 1),
+            "tDHT22": (sineWave(22, 15, 60, 0.1), 0.1),
+            "hDHT22": (sineWave(50, 30, 90, 0.5), 0.1)}
+
+class pseudoDataSource():
+    #  sampleRate    Samples per second, or 0 for as fast as they are asked for.
+    #  blockSize     The number of samples made at a time.
+    #  dropoutRate   The chance of each reading dropping out, as "-1" or "NAN".
+    #  randomSeed    The RNG seed, the same seed gives the same samples.
+    #  channelModels The signal model and resolution of each channel, see defaultChannelModels().
+    def __init__(self, sampleRate = 10, blockSize = 1024, dropoutRate = 0.0, randomSeed = 11, channelModels = None):
+        self.sampleRate = sampleRate
+        self.blockSize = blockSize
+        self.dropoutRate = dropoutRate
+        self.rng = np.random.default_rng(randomSeed)
+        self.channelModels = defaultChannelModels() if channelModels is None else channelModels
+        # Unpaced samples are still made on a time line for the signal models, at 10 samples per second.
+        self.signalRate = sampleRate if sampleRate else 10
+        self.samplesMade = 0    # Total number of samples ever made.
+        self.blockSamples = []
+        self.blockIndex = 0
+        self.startTime = None
+        self.samplesTaken = 0   # Total number of samples ever taken, or skipped over.
+    # Make the next blockSize samples, as a float64 array with a row of readings for each sample, NaN for a dropout.
+    def generateBlock(self, sampleCount = None):
+        sampleCount = self.blockSize if sampleCount is None else sampleCount
+        sampleTimes = np.arange(self.samplesMade, self.samplesMade + sampleCount) / self.signalRate
+        readings = np.empty((sampleCount, len(channelNames)))
+        for (channelIndex, channelName) in enumerate(channelNames):
+            (signalModel, resolution) = self.channelModels[channelName]
+            readings[:, channelIndex] = np.round(signalModel.generate(sampleTimes, self.rng) / resolution) * resolution
+        # The potentiometer is a 10 bit ADC, and the DHT humidities are percentages.
+        readings[:, 0] = np.clip(readings[:, 0], 0, 1023)
+        readings[:, 2::2] = np.clip(readings[:, 2::2], 0, 100)
+        if self.dropoutRate:
+            readings[self.rng.random(readings.shape) < self.dropoutRate] = np.nan
+        self.samplesMade += sampleCount
+        return readings
+    # Convert a block of readings into samples, with the usual "-1" and "NAN" markers, as the virtual meters expect.
+    def blockToSamples(self, readings):
+        return [("-1" if pot1Value != pot1Value else int(pot1Value),
+                 "NAN" if tDHT11 != tDHT11 else tDHT11, "NAN" if hDHT11 != hDHT11 else hDHT11,
+                 "NAN" if tDHT22 != tDHT22 else tDHT22, "NAN" if hDHT22 != hDHT22 else hDHT22)
+                for (pot1Value, tDHT11, hDHT11, tDHT22, hDHT22) in readings.tolist()]
+    # Take the next sample, making a new block if the last one has been used up.
+    def takeSample(self):
+        if self.blockIndex >= len(self.blockSamples):
+            self.blockSamples = self.blockToSamples(self.generateBlock())
+            self.blockIndex = 0
+        sample = self.blockSamples[self.blockIndex]
+        self.blockIndex += 1
+        self.samplesTaken += 1
+        return sample
+    # Skip over some samples. Whole blocks that are skipped are still made, to keep the signals and the RNG in step,
+    # but are not converted into samples.
+    def skipSamples(self, skipCount = 1):
+        while skipCount > 0:
+            if self.blockIndex >= len(self.blockSamples):
+                if skipCount >= self.blockSize:
+                    self.generateBlock()
+                    self.samplesTaken += self.blockSize
+                    skipCount -= self.blockSize
+                    continue
+                self.blockSamples = self.blockToSamples(self.generateBlock())
+                self.blockIndex = 0
+            blockSkip = min(skipCount, len(self.blockSamples) - self.blockIndex)
+            self.blockIndex += blockSkip
+            self.samplesTaken += blockSkip
+            skipCount -= blockSkip
+    # Return the newest sample that is due, skipping any older ones that are also due, or None if nothing new is due yet.
+    # This never waits, so it can be called once per vPython frame, like sessionReplay.nextSample(). Unpaced, a new
+    # sample is always due.
+    def nextSample(self):
+        if not self.sampleRate:
+            return self.takeSample()
+        if self.startTime is None:
+            self.startTime = time.monotonic()
+        dueSamples = int((time.monotonic() - self.startTime) * self.sampleRate) + 1
+        if dueSamples <= self.samplesTaken:
+            return None
+        self.skipSamples(dueSamples - self.samplesTaken - 1)
+        return self.takeSample()
+    # Yield every sample in order, waiting between them to keep to the sample rate.
+    def samples(self, sampleCount = None):
+        while sampleCount is None or sampleCount > 0:
+            if self.sampleRate:
+                if self.startTime is None:
+                    self.startTime = time.monotonic()
+                waitTime = self.startTime + self.samplesTaken / self.sampleRate - time.monotonic()
+                if waitTime > 0:
+                    time.sleep(waitTime)
+            yield self.takeSample()
+            if sampleCount is not None:
+                sampleCount -= 1
+    def __iter__(self):
+        return self.samples()
+
+# EOF
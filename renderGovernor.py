@@ -0,0 +1,90 @@
+# A render rate governor for the Lesson 11 main loop.
+# The main loop used to run at a fixed rate(100), redrawing the meters whether or not anything had changed.
+# The governor runs it fast only while new data is arriving, drops to an idle rate when nothing changes, and keeps
+# time for animations such as the serial error flash. It also keeps count of the frames that were redrawn, skipped
+# (nothing new to show), or took longer than their frame budget, and reports the over budget frames now and then.
+
+# https://www.glowscript.org/docs/VPythonDocs/rate.html
+
+
+import time
+
+class renderGovernor():
+    def __init__(self, maxRate = 100, idleRate = 20, idleAfter = 1.0, pacer = None, reportInterval = 10.0):
+        self.maxRate = maxRate          # The frame rate while new data is arriving.
+        self.idleRate = idleRate        # The frame rate once nothing has changed for idleAfter seconds.
+        self.idleAfter = idleAfter
+        # The function that waits for the next frame, vPython rate() or something like it. It is given the frame rate.
+        self.pacer = pacer if pacer is not None else (lambda frameRate: time.sleep(1 / frameRate))
+        self.reportInterval = reportInterval
+        self.lastDataTime = time.monotonic()
+        self.animationTimes = {}
+        self.frameStartTime = None
+        self.frameEnded = True
+        # Counters.
+        self.frames = 0
+        self.redraws = 0
+        self.skippedFrames = 0
+        self.overBudgetFrames = 0
+        self.frameTimeTotal = 0.0
+        self.lastReportTime = time.monotonic()
+        self.reportFrames = 0
+        self.reportOverBudget = 0
+        self.reportFrameTime = 0.0
+        self.reportRedraws = 0
+    # The frame rate to run at now.
+    def frameRate(self):
+        if time.monotonic() - self.lastDataTime < self.idleAfter:
+            return self.maxRate
+        return self.idleRate
+    # Wait for the next frame, and start timing it. A frame that was never marked as redrawn was skipped.
+    def tick(self):
+        if not self.frameEnded:
+            self.skippedFrames += 1
+        self.pacer(self.frameRate())
+        self.frameStartTime = time.monotonic()
+        self.frameEnded = False
+        self.frames += 1
+        self.reportFrames += 1
+    # Note that new data has arrived, which keeps the frame rate up.
+    def dataArrived(self):
+        self.lastDataTime = time.monotonic()
+    # Check if an animation, e.g. a flashing message, is due its next step. Every animation keeps its own time.
+    def animationDue(self, animationName = "", animationPeriod = 0.5):
+        timeNow = time.monotonic()
+        if timeNow < self.animationTimes.get(animationName, 0.0):
+            return False
+        self.animationTimes[animationName] = timeNow + animationPeriod
+        return True
+    # Mark the current frame as redrawn, and check how long it took against the frame budget.
+    def frameDone(self):
+        if self.frameEnded:
+            return
+        frameTime = time.monotonic() - self.frameStartTime
+        self.frameEnded = True
+        self.redraws += 1
+        self.reportRedraws += 1
+        self.frameTimeTotal += frameTime
+        self.reportFrameTime += frameTime
+        if frameTime > 1 / self.maxRate:
+            self.overBudgetFrames += 1
+            self.reportOverBudget += 1
+        self.report()
+    # Print a report, at most once every reportInterval seconds, if any frames have gone over budget.
+    def report(self):
+        timeNow = time.monotonic()
+        reportTime = timeNow - self.lastReportTime
+        if reportTime < self.reportInterval:
+            return
+        if self.reportOverBudget:
+            print("Render Info: %d of %d frames over the %.1fms budget in the last %.0fs, mean frame time %.1fms, %.1fHz achieved, %d frames skipped." % (
+                  self.reportOverBudget, self.reportRedraws, 1000 / self.maxRate, reportTime, 1000 * self.reportFrameTime / max(self.reportRedraws, 1),
+                  self.reportFrames / reportTime, self.reportFrames - self.reportRedraws))
+        self.lastReportTime = timeNow
+        self.reportFrames = self.reportRedraws = self.reportOverBudget = 0
+        self.reportFrameTime = 0.0
+    def stats(self):
+        return {"frames": self.frames, "redraws": self.redraws, "skippedFrames": self.skippedFrames, "overBudgetFrames": self.overBudgetFrames,
+                "meanFrameTime": self.frameTimeTotal / self.redraws if self.redraws else 0.0, "frameRate": self.frameRate()}
+
+# EOF
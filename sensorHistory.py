@@ -0,0 +1,136 @@
+# A rolling history of the Lesson 11 sensor readings.
+# Each channel keeps its most recent readings in a fixed size NumPy ring buffer, and updates its min, max, mean,
+# variance and EWMA as every reading goes in, or falls out of the window, without ever rescanning the window.
+# Missing readings ("-1" or "NAN") are kept in the history as NaN, but are left out of the statistics.
+
+# https://en.wikipedia.org/wiki/Algorithms_for_calculating_variance#Welford's_online_algorithm
+# https://en.wikipedia.org/wiki/Moving_average#Exponential_moving_average
+# https://en.wikipedia.org/wiki/Sliding_window_minimum
+
+
+import time
+from collections import deque
+import numpy as np
+from sessionRecorder import sampleToNumbers
+
+# The sensor channels, in the same order as a sample.
+channelNames = ("pot1Value", "tDHT11", "hDHT11", "tDHT22", "hDHT22")
+
+# The history of one sensor channel.
+class channelHistory():
+    def __init__(self, capacity = 1024, ewmaAlpha = 0.1):
+        self.capacity = capacity
+        self.ewmaAlpha = ewmaAlpha
+        self.timestamps = np.zeros(capacity)
+        self.readings = np.full(capacity, np.nan)
+        self.writeIndex = 0     # Total number of readings ever added.
+        # Running statistics of the valid readings in the window.
+        self.validCount = 0
+        self.mean = 0.0
+        self.sumSquares = 0.0   # The sum of the squared differences from the mean (Welford's M2).
+        self.ewma = np.nan
+        # The indices of the window minimum and maximum candidates, the oldest (and the min or max) first.
+        self.minCandidates = deque()
+        self.maxCandidates = deque()
+    def __len__(self):
+        return min(self.writeIndex, self.capacity)
+    # Add a reading, NaN if it is missing, and drop the oldest one if the window is full.
+    def append(self, reading = np.nan, timestamp = None):
+        if self.writeIndex >= self.capacity:
+            self.forget(self.writeIndex - self.capacity)
+        readingIndex = self.writeIndex
+        self.timestamps[readingIndex % self.capacity] = time.monotonic() if timestamp is None else timestamp
+        self.readings[readingIndex % self.capacity] = reading
+        self.writeIndex += 1
+        if reading != reading: # NaN is not equal to itself.
+            return
+        # Welford's online mean and variance.
+        self.validCount += 1
+        meanDelta = reading - self.mean
+        self.mean += meanDelta / self.validCount
+        self.sumSquares += meanDelta * (reading - self.mean)
+        # The EWMA starts at the first valid reading.
+        self.ewma = reading if self.ewma != self.ewma else self.ewma + self.ewmaAlpha * (reading - self.ewma)
+        # A new reading beats every older candidate that is not smaller (or larger), as those can never be the min (or max) again.
+        while self.minCandidates and self.readings[self.minCandidates[-1] % self.capacity] >= reading:
+            self.minCandidates.pop()
+        self.minCandidates.append(readingIndex)
+        while self.maxCandidates and self.readings[self.maxCandidates[-1] % self.capacity] <= reading:
+            self.maxCandidates.pop()
+        self.maxCandidates.append(readingIndex)
+    # Take the oldest reading out of the running statistics, just before it is overwritten.
+    def forget(self, readingIndex):
+        reading = self.readings[readingIndex % self.capacity]
+        if reading != reading:
+            return
+        self.validCount -= 1
+        if self.validCount == 0:
+            self.mean = 0.0
+            self.sumSquares = 0.0
+        else:
+            meanDelta = reading - self.mean
+            self.mean -= meanDelta / self.validCount
+            self.sumSquares = max(0.0, self.sumSquares - meanDelta * (reading - self.mean))
+        if self.minCandidates and self.minCandidates[0] == readingIndex:
+            self.minCandidates.popleft()
+        if self.maxCandidates and self.maxCandidates[0] == readingIndex:
+            self.maxCandidates.popleft()
+    # The statistics of the valid readings in the window, NaN if there are none.
+    def stats(self):
+        if self.validCount == 0:
+            return {"count": 0, "min": np.nan, "max": np.nan, "mean": np.nan, "variance": np.nan, "ewma": self.ewma, "last": self.last()}
+        return {"count": self.validCount,
+                "min": float(self.readings[self.minCandidates[0] % self.capacity]),
+                "max": float(self.readings[self.maxCandidates[0] % self.capacity]),
+                "mean": self.mean,
+                "variance": self.sumSquares / self.validCount,
+                "ewma": self.ewma,
+                "last": self.last()}
+    def last(self):
+        return float(self.readings[(self.writeIndex - 1) % self.capacity]) if self.writeIndex else np.nan
+    # The timestamps and readings of the last readingCount readings (all of the window if None), oldest first.
+    def window(self, readingCount = None):
+        readingCount = len(self) if readingCount is None else min(readingCount, len(self))
+        windowIndices = np.arange(self.writeIndex - readingCount, self.writeIndex) % self.capacity
+        return (self.timestamps[windowIndices], self.readings[windowIndices])
+    # The statistics of the last readingCount readings, worked out from the window with NumPy.
+    def windowStats(self, readingCount = None):
+        (windowTimestamps, windowReadings) = self.window(readingCount)
+        validReadings = windowReadings[~np.isnan(windowReadings)]
+        if len(validReadings) == 0:
+            return {"count": 0, "min": np.nan, "max": np.nan, "mean": np.nan, "variance": np.nan}
+        return {"count": len(validReadings), "min": float(validReadings.min()), "max": float(validReadings.max()),
+                "mean": float(validReadings.mean()), "variance": float(validReadings.var())}
+    # Decimate the last readingCount readings into bucketCount buckets for plotting, keeping the min and max of each
+    # bucket so that spikes are not lost. Returns the bucket start times, minimums and maximums (NaN for an empty bucket).
+    def decimate(self, bucketCount = 100, readingCount = None):
+        (windowTimestamps, windowReadings) = self.window(readingCount)
+        if len(windowReadings) == 0:
+            return (np.zeros(0), np.zeros(0), np.zeros(0))
+        bucketStarts = np.unique(np.linspace(0, len(windowReadings), min(bucketCount, len(windowReadings)), endpoint = False).astype(int))
+        # fmin and fmax ignore NaN, unless the whole bucket is NaN.
+        return (windowTimestamps[bucketStarts], np.fmin.reduceat(windowReadings, bucketStarts), np.fmax.reduceat(windowReadings, bucketStarts))
+
+# The history of all the sensor channels of one Arduino.
+class sensorHistory():
+    def __init__(self, capacity = 1024, ewmaAlpha = 0.1):
+        self.channels = {channelName: channelHistory(capacity, ewmaAlpha) for channelName in channelNames}
+    def __getitem__(self, channelName):
+        return self.channels[channelName]
+    # Add a sample, using the "-1" and "NAN" markers, to every channel.
+    def record(self, sample, timestamp = None):
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        readings = sampleToNumbers(sample)
+        self.channels["pot1Value"].append(np.nan if readings[0] == -1 else readings[0], timestamp)
+        for (channelName, reading) in zip(channelNames[1:], readings[1:]):
+            self.channels[channelName].append(reading, timestamp)
+    def stats(self):
+        return {channelName: channel.stats() for (channelName, channel) in self.channels.items()}
+    # The EWMA of every channel as a sample, with the usual "-1" and "NAN" markers, ready for a meter panel.
+    # A channel whose latest reading is missing is shown as missing, rather than holding its old EWMA.
+    def smoothedSample(self):
+        ewmaReadings = [np.nan if channel.last() != channel.last() else channel.ewma for channel in self.channels.values()]
+        pot1Value = "-1" if ewmaReadings[0] != ewmaReadings[0] else int(round(ewmaReadings[0]))
+        return tuple([pot1Value] + ["NAN" if reading != reading else float(reading) for reading in ewmaReadings[1:]])
+
+# EOF
@@ -0,0 +1,419 @@
+# A background serial reader for the Lesson 11 meter panel.
+# The reader thread drains the serial port in large chunks, splits and parses the Arduino packets, and pushes the
+# samples into a bounded ring buffer. The vPython render loop then samples the ring buffer at its own refresh rate.
+# With a link supervisor (see linkSupervisor.py), a lost link does not stop the reader: it closes its port and waits for
+# the supervisor to open it again, then throws away the partial packet it starts in the middle of.
+
+# https://pyserial.readthedocs.io/en/latest/pyserial_api.html
+# https://en.wikipedia.org/wiki/Circular_buffer
+
+
+import time
+import threading
+from array import array
+from crc8Engine import calcCRC8
+from binaryProtocol import txModeText, txModeBinary, frameDelimiters, replyPrefixes, parseBinaryPacket, decodeRecordSamples, parseTxModeAck, parseCommandAck, txModeCommand
+
+# Convert a received Arduino packet, e.g. b"512,21.00,45.00,NAN,NAN!123\r\n", into sensor values.
+# Invalid readings are returned as "-1" or "NAN", as before. None is returned if the packet fails its CRC8 or is malformed.
+def parseSensorPacket(arduinoDataPacket = b""):
+    # Convert the CSV data from a byte stream to a CSV string, and strip the CRLF from the end.
+    arduinoDataPacket = str(arduinoDataPacket, 'utf-8', 'replace').strip('\r\n')
+    # Check if there is a CRC8 checksum.
+    if "!" in arduinoDataPacket:
+        # Convert the CSV string into data and CRC8 checksum parts.
+        (sensorData, chksumCRC8) = arduinoDataPacket.split("!", 1)
+        # Check the CRC8 checksum.
+        if not chksumCRC8.isdigit() or calcCRC8(sensorData) != int(chksumCRC8):
+            return None
+    else:
+        sensorData = arduinoDataPacket      # Assuming we only have the sensor data.
+    # Convert the sensorData string into separate variables.
+    sensorFields = sensorData.split(",")
+    if len(sensorFields) != 5:
+        return None
+    return convertSensorFields(sensorFields)
+
+# Check the 5 sensor fields of a packet and convert them to numbers. Invalid readings stay as "-1" or "NAN".
+# None is returned if a field is not a number.
+def convertSensorFields(sensorFields):
+    (pot1Value, tDHT11, hDHT11, tDHT22, hDHT22) = sensorFields
+    try:
+        if pot1Value != "-1":
+            pot1Value = int(pot1Value)
+        if tDHT11 != "NAN":
+            tDHT11 = float(tDHT11)
+        if hDHT11 != "NAN":
+            hDHT11 = float(hDHT11)
+        if tDHT22 != "NAN":
+            tDHT22 = float(tDHT22)
+        if hDHT22 != "NAN":
+            hDHT22 = float(hDHT22)
+    except ValueError:
+        return None
+    return (pot1Value, tDHT11, hDHT11, tDHT22, hDHT22)
+
+nanReading = float("nan")
+
+# A text packet parser that works in place on the raw bytes of the reader's receive buffer, without decoding or stripping.
+# The "!" is found with find(), the CRC8 is checked over the raw sensor data, and the readings are written into a
+# preallocated float64 record, with real NaN for the missing ones (float() reads the Arduino's "NAN" as NaN anyway).
+# The record is only written once every field has converted, so a bad packet never leaves half a record.
+# Packets that fail their CRC8 check, or are malformed, are counted rather than raising.
+class sensorRecordParser():
+    def __init__(self):
+        self.record = array("d", [nanReading] * 5)  # pot1Value, tDHT11, hDHT11, tDHT22, hDHT22, of the last good packet.
+        self.packetsParsed = 0
+        self.crcFailures = 0
+        self.malformedPackets = 0
+    # Parse the packet between lineStart and lineEnd (the end of the buffer if None) of a receive buffer into the record.
+    # Returns the readings as a sample, with the usual "-1" and "NAN" markers, or None if the record was not written.
+    def parseInto(self, rxBuffer, lineStart = 0, lineEnd = None):
+        if lineEnd is None:
+            lineEnd = len(rxBuffer)
+        dataEnd = rxBuffer.find(b"!", lineStart, lineEnd)
+        if dataEnd >= 0:
+            try:
+                # int() skips the CR, so the checksum is not stripped first.
+                chksumCRC8 = int(rxBuffer[dataEnd + 1:lineEnd])
+            except ValueError:
+                self.malformedPackets += 1
+                return None
+            # The sensor data is sliced out once, for the CRC8 check and the split. Iterating over a memoryview of the
+            # buffer instead measured slower, as the CRC8 loop then has to go through the buffer protocol for every byte.
+            sensorData = rxBuffer[lineStart:dataEnd]
+            if calcCRC8(sensorData) != chksumCRC8:
+                self.crcFailures += 1
+                return None
+        else:
+            # Assuming we only have the sensor data, without its CR.
+            dataEnd = lineEnd - 1 if lineEnd > lineStart and rxBuffer[lineEnd - 1] == 0x0d else lineEnd
+            sensorData = rxBuffer[lineStart:dataEnd]
+        # One C level split of the sensor data, much cheaper than finding each comma in turn.
+        sensorFields = sensorData.split(b",")
+        if len(sensorFields) != 5:
+            self.malformedPackets += 1
+            return None
+        try:
+            pot1Value = int(sensorFields[0])
+            tDHT11 = float(sensorFields[1])
+            hDHT11 = float(sensorFields[2])
+            tDHT22 = float(sensorFields[3])
+            hDHT22 = float(sensorFields[4])
+        except ValueError:
+            self.malformedPackets += 1
+            return None
+        record = self.record
+        record[0] = nanReading if pot1Value == -1 else pot1Value
+        record[1] = tDHT11
+        record[2] = hDHT11
+        record[3] = tDHT22
+        record[4] = hDHT22
+        self.packetsParsed += 1
+        # NaN is not equal to itself.
+        return ("-1" if pot1Value == -1 else pot1Value,
+                "NAN" if tDHT11 != tDHT11 else tDHT11,
+                "NAN" if hDHT11 != hDHT11 else hDHT11,
+                "NAN" if tDHT22 != tDHT22 else tDHT22,
+                "NAN" if hDHT22 != hDHT22 else hDHT22)
+    # Parse a whole packet, so the parser can stand in for parseSensorPacket().
+    def __call__(self, arduinoDataPacket = b""):
+        return self.parseInto(arduinoDataPacket)
+    def stats(self):
+        return {"packetsParsed": self.packetsParsed, "crcFailures": self.crcFailures, "malformedPackets": self.malformedPackets}
+
+# A bounded single producer, single consumer ring buffer.
+# The producer only ever moves the write index and the consumer only ever moves the read index, so no lock is needed.
+# If the buffer is full, new samples are dropped and counted, rather than blocking the producer.
+class sampleRingBuffer():
+    def __init__(self, capacity = 256):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.writeIndex = 0     # Total number of samples ever written.
+        self.readIndex = 0      # Total number of samples ever read.
+        self.overruns = 0       # Number of times the producer found the buffer full.
+        self.droppedSamples = 0 # Number of samples lost because the buffer was full.
+        self.wasFull = False
+    def __len__(self):
+        return self.writeIndex - self.readIndex
+    def put(self, sample):
+        if self.writeIndex - self.readIndex >= self.capacity:
+            # Count an overrun once per full period, but every dropped sample.
+            if not self.wasFull:
+                self.overruns += 1
+                self.wasFull = True
+            self.droppedSamples += 1
+            return False
+        self.wasFull = False
+        self.slots[self.writeIndex % self.capacity] = sample
+        self.writeIndex += 1 # Publish the sample only after it has been stored.
+        return True
+    def get(self):
+        if self.readIndex == self.writeIndex:
+            return None
+        sample = self.slots[self.readIndex % self.capacity]
+        self.readIndex += 1
+        return sample
+    # Return all the waiting samples, oldest first.
+    def getAll(self):
+        samples = []
+        writeIndex = self.writeIndex # Take a snapshot, the producer may keep writing.
+        while self.readIndex < writeIndex:
+            samples.append(self.slots[self.readIndex % self.capacity])
+            self.readIndex += 1
+        return samples
+    # Return only the newest waiting sample, discarding any older ones, or None if nothing is waiting.
+    def getLatest(self):
+        writeIndex = self.writeIndex
+        if self.readIndex == writeIndex:
+            return None
+        sample = self.slots[(writeIndex - 1) % self.capacity]
+        self.readIndex = writeIndex
+        return sample
+
+# A daemon thread that reads, splits and parses the Arduino packets.
+# The reader follows the Arduino's transmit mode: CSV text lines, or COBS framed binary records, see binaryProtocol.py.
+# The text lines are parsed in place in the receive buffer by a sensorRecordParser, unless a packetParser is given, e.g.
+# parseSensorPacket(), which is given each line.
+class serialReader(threading.Thread):
+    def __init__(self, serialPort, sampleBuffer = None, packetParser = None, chunkSize = 4096, maxLineLength = 256):
+        threading.Thread.__init__(self, name = "serialReader", daemon = True)
+        self.serialPort = serialPort
+        self.samples = sampleBuffer if sampleBuffer is not None else sampleRingBuffer()
+        self.recordParser = sensorRecordParser()
+        self.packetParsers = {txModeText: packetParser, txModeBinary: parseBinaryPacket}
+        # In binary mode, this many frames or more, e.g. a backlog after a slow frame, are decoded together with NumPy, see
+        # putRecords(). Fewer are quicker to decode one at a time, as each NumPy call has a fixed cost.
+        self.blockDecodeMin = 40
+        self.chunkSize = chunkSize
+        self.maxLineLength = maxLineLength
+        self.rxBuffer = bytearray()
+        self.running = threading.Event()
+        self.txModeChanged = threading.Event()
+        # Set while the port is open. A port that is not open yet is left for a link supervisor to open.
+        self.portOpen = threading.Event()
+        if getattr(serialPort, "is_open", True):
+            self.portOpen.set()
+        # With a link supervisor, a read error closes the port and the reader waits for it to be opened again, instead of stopping.
+        self.reconnectable = False
+        self.dropRequested = False
+        self.resyncPending = False
+        self.lastPacketTime = None # When the last good packet arrived (monotonic seconds), for the link supervisor.
+        # An optional function that is given every parsed sample, or None for a bad packet, e.g. sessionRecorder.record.
+        self.sampleTap = None
+        # An optional function that is given every command acknowledgement from the Arduino, e.g. commandChannel.acknowledge.
+        self.ackTap = None
+        # Start in text mode, as the Arduino does.
+        self.setTxMode(txModeText)
+        # Counters.
+        self.bytesReceived = 0
+        self.packetsReceived = 0
+        self.badPackets = 0     # Packets that failed the CRC8 check or could not be parsed.
+        self.readErrors = 0
+        self.linkDrops = 0
+        self.resyncBytes = 0    # Bytes thrown away to get back in step with the packets after the link was lost.
+        self.lastError = None
+    # Change the framing and parser used for the received data.
+    def setTxMode(self, txMode = txModeText):
+        self.txMode = txMode
+        self.frameDelimiter = frameDelimiters[txMode]
+        self.packetParser = self.packetParsers[txMode]
+        self.txModeChanged.set()
+    # Parse all the complete lines (or frames) in the receive buffer.
+    def processBuffer(self):
+        if self.packetParser is None:
+            return self.processRecordBuffer()
+        # One C level split of the whole buffer, the last part is an incomplete line (or empty) that is kept for next time.
+        frameDelimiter = self.frameDelimiter
+        rxLines = self.rxBuffer.split(frameDelimiter)
+        self.rxBuffer = rxLines.pop()
+        # Local name lookups are faster than attribute lookups in the loop.
+        packetParser = self.packetParser
+        putSample = self.samples.put
+        sampleTap = self.sampleTap
+        badPackets = 0
+        # A burst of binary records, e.g. a backlog after a slow frame, is put aside and decoded together by putRecords(),
+        # and only the Arduino's replies are parsed here.
+        blockMode = self.txMode == txModeBinary and len(rxLines) >= self.blockDecodeMin
+        recordFrames = []
+        for (lineIndex, rxLine) in enumerate(rxLines):
+            if blockMode:
+                if not rxLine.startswith(replyPrefixes):
+                    recordFrames.append(rxLine)
+                    continue
+            else:
+                sample = packetParser(rxLine)
+                if sample is not None:
+                    putSample(sample)
+                    if sampleTap is not None:
+                        sampleTap(sample)
+                    continue
+            # A packet that does not parse may be the Arduino acknowledging a transmit mode change, or a command.
+            (replyOK, txMode) = self.handleReply(rxLine)
+            if not replyOK:
+                badPackets += 1
+            elif txMode is not None and txMode != self.txMode:
+                if recordFrames:
+                    badPackets += self.putRecords(recordFrames)
+                # Everything after the acknowledgement uses the new framing, so put it back together and split it again.
+                self.rxBuffer = bytearray(frameDelimiter.join(rxLines[lineIndex + 1:] + [self.rxBuffer]))
+                self.setTxMode(txMode)
+                self.packetsReceived += lineIndex + 1
+                self.badPackets += badPackets
+                return self.processBuffer()
+        if recordFrames:
+            badPackets += self.putRecords(recordFrames)
+        self.packetsReceived += len(rxLines)
+        self.badPackets += badPackets
+        if badPackets < len(rxLines):
+            self.lastPacketTime = time.monotonic()
+        # A line that never ends is garbage, so throw it away rather than let the buffer grow forever.
+        if len(self.rxBuffer) > self.maxLineLength:
+            self.badPackets += 1
+            self.rxBuffer = bytearray()
+    # Parse all the complete text lines in place in the receive buffer, which is kept and reused, with the record parser.
+    def processRecordBuffer(self):
+        rxBuffer = self.rxBuffer
+        # Local name lookups are faster than attribute lookups in the loop.
+        parseInto = self.recordParser.parseInto
+        putSample = self.samples.put
+        sampleTap = self.sampleTap
+        (lineStart, packetCount, badPackets, newTxMode) = (0, 0, 0, None)
+        while newTxMode is None:
+            lineEnd = rxBuffer.find(b"\n", lineStart)
+            if lineEnd < 0:
+                break
+            packetCount += 1
+            # The sensor data starts with a digit or "-", so only a line starting with a letter can be one of the replies.
+            if rxBuffer[lineStart] <= 0x39 or not rxBuffer.startswith(replyPrefixes, lineStart):
+                sample = parseInto(rxBuffer, lineStart, lineEnd)
+                if sample is not None:
+                    putSample(sample)
+                    if sampleTap is not None:
+                        sampleTap(sample)
+                else:
+                    badPackets += 1
+                    if sampleTap is not None:
+                        sampleTap(None)
+            else:
+                (replyOK, txMode) = self.handleReply(rxBuffer[lineStart:lineEnd])
+                badPackets += not replyOK
+                if txMode is not None and txMode != self.txMode:
+                    newTxMode = txMode
+            lineStart = lineEnd + 1
+        # The parsed lines are dropped from the front of the buffer, which is kept for the rest.
+        del rxBuffer[:lineStart]
+        self.packetsReceived += packetCount
+        self.badPackets += badPackets
+        if badPackets < packetCount:
+            self.lastPacketTime = time.monotonic()
+        if newTxMode is not None:
+            # Everything after the acknowledgement uses the new framing.
+            self.setTxMode(newTxMode)
+            return self.processBuffer()
+        # A line that never ends is garbage, so throw it away rather than let the buffer grow forever.
+        if len(rxBuffer) > self.maxLineLength:
+            self.badPackets += 1
+            del rxBuffer[:]
+    # Handle a frame that is not a sample, which may be the Arduino acknowledging a transmit mode change, or a command.
+    # Returns (replyOK, txMode), with the transmit mode it acknowledges, or None.
+    def handleReply(self, rxLine):
+        txMode = parseTxModeAck(rxLine)
+        if txMode is not None:
+            return (True, txMode)
+        commandAck = parseCommandAck(rxLine) if self.ackTap is not None else None
+        if commandAck is not None:
+            self.ackTap(commandAck)
+            return (True, None)
+        if self.sampleTap is not None:
+            self.sampleTap(None)
+        return (False, None)
+    # Decode a block of binary record frames together, and store the samples. Returns the number of bad frames.
+    def putRecords(self, recordFrames):
+        samples = decodeRecordSamples(recordFrames)
+        putSample = self.samples.put
+        sampleTap = self.sampleTap
+        for sample in samples:
+            putSample(sample)
+            if sampleTap is not None:
+                sampleTap(sample)
+        badPackets = len(recordFrames) - len(samples)
+        if sampleTap is not None:
+            for badCounter in range(badPackets):
+                sampleTap(None)
+        return badPackets
+    # Ask the Arduino to change its transmit mode and wait for it to acknowledge the change.
+    # An Arduino sketch that does not know the txMode command just ignores it, so False means carry on in the current mode.
+    def negotiateTxMode(self, txMode = txModeBinary, timeout = 1.0):
+        if txMode == self.txMode:
+            return True
+        self.requestTxMode(txMode)
+        self.txModeChanged.wait(timeout)
+        return self.txMode == txMode
+    # Just send the transmit mode change request, so several Arduinos can be asked at once and then waited for together.
+    def requestTxMode(self, txMode = txModeBinary):
+        self.txModeChanged.clear()
+        self.serialPort.write(txModeCommand(txMode).encode())
+    # Feed some received bytes to the reader, this is also useful for testing without a serial port.
+    def feed(self, rxData = b""):
+        self.bytesReceived += len(rxData)
+        if self.resyncPending:
+            # The link was lost part way through a packet, so everything up to the next frame delimiter is garbage.
+            frameEnd = rxData.find(self.frameDelimiter)
+            if frameEnd < 0:
+                self.resyncBytes += len(rxData)
+                return
+            self.resyncBytes += frameEnd + 1
+            rxData = rxData[frameEnd + 1:]
+            self.resyncPending = False
+        self.rxBuffer += rxData
+        self.processBuffer()
+    def run(self):
+        self.running.set()
+        while self.running.is_set():
+            if not self.portOpen.is_set():
+                # The link is down, until a link supervisor opens the port again.
+                self.portOpen.wait(0.1)
+                continue
+            if self.dropRequested:
+                self.closePort()
+                continue
+            try:
+                # Block for at least one byte (up to the port timeout), then take everything else that is waiting.
+                rxData = self.serialPort.read(max(1, min(self.serialPort.in_waiting, self.chunkSize)))
+            except Exception as err:
+                self.readErrors += 1
+                self.lastError = err
+                if not self.reconnectable:
+                    break
+                self.closePort()
+                continue
+            if rxData:
+                self.feed(rxData)
+        self.running.clear()
+    # Ask the reader to close its port, e.g. because the link has gone quiet, so that a link supervisor can open it again.
+    def dropLink(self):
+        self.dropRequested = True
+    # Close the port after the link has been lost, and throw away the partial packet. The port is only marked as closed once
+    # it really is, so a link supervisor never tries to open it while it is still open.
+    def closePort(self):
+        try:
+            self.serialPort.close()
+        except Exception as err:
+            self.lastError = err
+        self.rxBuffer = bytearray()
+        self.resyncPending = True
+        self.dropRequested = False
+        self.linkDrops += 1
+        self.portOpen.clear()
+    def stop(self, timeout = 1):
+        self.running.clear()
+        if self.is_alive():
+            self.join(timeout)
+    # A snapshot of the reader counters.
+    def stats(self):
+        return {"bytesReceived": self.bytesReceived, "packetsReceived": self.packetsReceived, "badPackets": self.badPackets,
+                "crcFailures": self.recordParser.crcFailures, "malformedPackets": self.recordParser.malformedPackets,
+                "readErrors": self.readErrors, "linkDrops": self.linkDrops, "resyncBytes": self.resyncBytes, "overruns": self.samples.overruns, "droppedSamples": self.samples.droppedSamples}
+
+# EOF
@@ -0,0 +1,151 @@
+# Offline analytics over Lesson 11 column exports, see columnarExport.py.
+# The column files of every chunk are memory-mapped, not read, and each aggregate is worked out a chunk at a time with
+# whole array NumPy operations (bincount, reduceat), so days of readings can be summarised without a Python loop over
+# the readings, or ever holding more than one chunk of a column in memory. The aggregates are per time bucket, e.g. per
+# minute, with the buckets lined up with the wall clock:
+#  channelStats()  The count, minimum, maximum and mean of the valid readings of each channel.
+#  bandTimes()     The time a channel spent in each LED band, e.g. the potentiometer in the blue, green and red bands.
+#  crcErrorRates() The packets received, the packets that failed their CRC8 check (or could not be parsed), and their rate.
+
+# https://numpy.org/doc/stable/reference/generated/numpy.load.html
+# https://numpy.org/doc/stable/reference/generated/numpy.ufunc.reduceat.html
+
+
+import sys
+import time
+import numpy as np
+from sensorHistory import channelNames
+from columnarExport import readIndex, columnPath
+
+# The potentiometer thresholds of the rgbLEDs, 1.5V and 3.5V, as raw ADC values.
+rgbLEDsThresholds = (1.5 * 1024 / 5, 3.5 * 1024 / 5)
+
+# The bands of an array of readings, the same as thresholdClassifier.rawBand() gives (without any hysteresis).
+def rawBands(readings, thresholds = rgbLEDsThresholds):
+    thresholds = np.asarray(thresholds, dtype = float)
+    readingBands = np.minimum(np.searchsorted(thresholds, readings, side = "right"), max(len(thresholds) - 1, 1))
+    readingBands[readings < thresholds[0]] = 0
+    readingBands[readings > thresholds[-1]] = len(thresholds)
+    return readingBands
+
+# A read-only view of a column export.
+class columnStore():
+    def __init__(self, exportDir = "lesson11-columns"):
+        self.exportDir = exportDir
+        self.exportIndex = readIndex(exportDir)
+    def __len__(self):
+        return sum(chunkInfo["records"] for chunkInfo in self.exportIndex["chunks"])
+    # The wall clock time of the first and last records.
+    def timeRange(self):
+        chunkInfos = self.exportIndex["chunks"]
+        if not chunkInfos:
+            return (None, None)
+        return (min(chunkInfo["firstTime"] + chunkInfo["wallClockOffset"] for chunkInfo in chunkInfos),
+                max(chunkInfo["lastTime"] + chunkInfo["wallClockOffset"] for chunkInfo in chunkInfos))
+    # Memory-map a column of a chunk.
+    def column(self, chunkIndex, columnName):
+        return np.load(columnPath(self.exportDir, chunkIndex, columnName), mmap_mode = "r")
+    # Yield the wall clock times and the readings of every chunk, in order. The readings are a float array with a column
+    # for each channel, NaN where a reading is missing, or its packet failed the CRC8 check.
+    def chunks(self, columnNames = channelNames):
+        for chunkInfo in self.exportIndex["chunks"]:
+            wallTimes = self.column(chunkInfo["chunk"], "timestamp") + chunkInfo["wallClockOffset"]
+            crcOK = self.column(chunkInfo["chunk"], "crcOK").astype(bool)
+            readings = np.empty((chunkInfo["records"], len(columnNames)))
+            for (columnIndex, columnName) in enumerate(columnNames):
+                readings[:, columnIndex] = self.column(chunkInfo["chunk"], columnName)
+                if columnName == "pot1Value":
+                    readings[readings[:, columnIndex] == -1, columnIndex] = np.nan
+            readings[~crcOK] = np.nan
+            yield (wallTimes, crcOK, readings)
+    # The start times of the buckets that the records fall into, lined up with the wall clock (e.g. on the minute).
+    def bucketTimes(self, bucketSeconds = 60):
+        (firstTime, lastTime) = self.timeRange()
+        if firstTime is None:
+            return np.zeros(0)
+        return np.arange(np.floor(firstTime / bucketSeconds), np.floor(lastTime / bucketSeconds) + 1) * bucketSeconds
+    def bucketIndices(self, wallTimes, bucketTimes, bucketSeconds):
+        return ((wallTimes - bucketTimes[0]) // bucketSeconds).astype(np.intp)
+    # The count, min, max and mean of the valid readings of each channel, in each bucket, as (buckets x channels) arrays.
+    # A bucket with no valid readings of a channel has a NaN min, max and mean.
+    def channelStats(self, bucketSeconds = 60, columnNames = channelNames):
+        bucketTimes = self.bucketTimes(bucketSeconds)
+        bucketShape = (len(bucketTimes), len(columnNames))
+        (counts, sums) = (np.zeros(bucketShape, dtype = np.int64), np.zeros(bucketShape))
+        (mins, maxs) = (np.full(bucketShape, np.inf), np.full(bucketShape, -np.inf))
+        for (wallTimes, crcOK, readings) in self.chunks(columnNames):
+            buckets = self.bucketIndices(wallTimes, bucketTimes, bucketSeconds)
+            if np.any(buckets[1:] < buckets[:-1]):
+                bucketOrder = np.argsort(buckets, kind = "stable")
+                (buckets, readings) = (buckets[bucketOrder], readings[bucketOrder])
+            validReadings = ~np.isnan(readings)
+            for columnIndex in range(len(columnNames)):
+                counts[:, columnIndex] += np.bincount(buckets, validReadings[:, columnIndex], len(bucketTimes)).astype(np.int64)
+                sums[:, columnIndex] += np.bincount(buckets, np.where(validReadings[:, columnIndex], readings[:, columnIndex], 0.0), len(bucketTimes))
+            # The buckets are in order, so each one is a run of readings that reduceat can take the min and max of, NaN only if all are NaN.
+            runStarts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+            runBuckets = buckets[runStarts]
+            with np.errstate(invalid = "ignore"):
+                mins[runBuckets] = np.fmin(mins[runBuckets], np.fmin.reduceat(readings, runStarts, axis = 0))
+                maxs[runBuckets] = np.fmax(maxs[runBuckets], np.fmax.reduceat(readings, runStarts, axis = 0))
+        noReadings = counts == 0
+        mins[noReadings] = maxs[noReadings] = np.nan
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            means = np.where(noReadings, np.nan, sums / counts)
+        return {"bucketTimes": bucketTimes, "channels": columnNames, "count": counts, "min": mins, "max": maxs, "mean": means}
+    # The seconds a channel spent in each band, in each bucket, as a (buckets x bands) array. A valid reading holds its band
+    # until the next valid reading, as the LEDs do, but for no longer than maxGap, e.g. while the Arduino was disconnected.
+    # The bands are the raw bands, without the hysteresis that thresholdClassifier adds.
+    def bandTimes(self, channelName = "pot1Value", thresholds = rgbLEDsThresholds, bucketSeconds = 60, maxGap = 1.0):
+        bucketTimes = self.bucketTimes(bucketSeconds)
+        bandCount = len(thresholds) + 1
+        bandSeconds = np.zeros(len(bucketTimes) * bandCount)
+        (carryTime, carryReading) = (np.zeros(0), np.zeros(0))
+        for (wallTimes, crcOK, readings) in self.chunks((channelName,)):
+            validReadings = ~np.isnan(readings[:, 0])
+            # The last valid reading of the chunk before holds its band until the first valid reading of this chunk.
+            wallTimes = np.concatenate((carryTime, wallTimes[validReadings]))
+            readings = np.concatenate((carryReading, readings[validReadings, 0]))
+            if len(readings) < 2:
+                (carryTime, carryReading) = (wallTimes, readings)
+                continue
+            holdTimes = np.clip(np.diff(wallTimes), 0, maxGap)
+            (carryTime, carryReading) = (wallTimes[-1:], readings[-1:])
+            buckets = self.bucketIndices(wallTimes[:-1], bucketTimes, bucketSeconds)
+            bandSeconds += np.bincount(buckets * bandCount + rawBands(readings[:-1], thresholds), holdTimes, len(bandSeconds))
+        return {"bucketTimes": bucketTimes, "bandSeconds": bandSeconds.reshape(len(bucketTimes), bandCount)}
+    # The packets received, the bad packets (failed CRC8 checks and unparsable packets), and the bad packet rate, in each bucket.
+    def crcErrorRates(self, bucketSeconds = 60):
+        bucketTimes = self.bucketTimes(bucketSeconds)
+        (packets, badPackets) = (np.zeros(len(bucketTimes), dtype = np.int64), np.zeros(len(bucketTimes), dtype = np.int64))
+        for chunkInfo in self.exportIndex["chunks"]:
+            buckets = self.bucketIndices(self.column(chunkInfo["chunk"], "timestamp") + chunkInfo["wallClockOffset"], bucketTimes, bucketSeconds)
+            packets += np.bincount(buckets, minlength = len(bucketTimes))
+            badPackets += np.bincount(buckets, self.column(chunkInfo["chunk"], "crcOK") == 0, len(bucketTimes)).astype(np.int64)
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            errorRates = np.where(packets > 0, badPackets / packets, np.nan)
+        return {"bucketTimes": bucketTimes, "packets": packets, "badPackets": badPackets, "errorRate": errorRates}
+
+# Summarise an export from the command line, e.g. "python sessionAnalytics.py lesson11-columns".
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python sessionAnalytics.py <export directory> [bucket seconds]")
+        sys.exit(1)
+    sensorColumns = columnStore(sys.argv[1])
+    bucketSeconds = float(sys.argv[2]) if len(sys.argv) > 2 else 60
+    (firstTime, lastTime) = sensorColumns.timeRange()
+    if firstTime is None:
+        print("%s is empty." % sys.argv[1])
+        sys.exit(0)
+    print("%d records from %s to %s" % (len(sensorColumns), time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(firstTime)), time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(lastTime))))
+    sensorStats = sensorColumns.channelStats(bucketSeconds)
+    bandStats = sensorColumns.bandTimes(bucketSeconds = bucketSeconds)
+    errorStats = sensorColumns.crcErrorRates(bucketSeconds)
+    print("%-19s %7s %6s  %s  %s" % ("Bucket", "Packets", "Bad %", "  ".join("%-20s" % ("%s min/mean/max" % channelName) for channelName in channelNames), "Blue/Green/Red s"))
+    for bucketIndex in np.flatnonzero(errorStats["packets"]):
+        channelTexts = ["%6.1f/%6.1f/%6.1f" % (sensorStats["min"][bucketIndex, columnIndex], sensorStats["mean"][bucketIndex, columnIndex], sensorStats["max"][bucketIndex, columnIndex])
+                        for columnIndex in range(len(channelNames))]
+        print("%-19s %7d %6.2f  %s  %s" % (time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sensorStats["bucketTimes"][bucketIndex])), errorStats["packets"][bucketIndex],
+              100 * errorStats["errorRate"][bucketIndex], "  ".join("%-20s" % channelText for channelText in channelTexts), "/".join("%.0f" % bandSeconds for bandSeconds in bandStats["bandSeconds"][bucketIndex])))
+
+# EOF
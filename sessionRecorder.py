@@ -0,0 +1,182 @@
+# Recording and replay of Lesson 11 sensor sessions.
+# The parsed sensor samples are appended, with a monotonic timestamp and a CRC8 pass/fail flag, to a preallocated,
+# memory-mapped file of NumPy structured records. The file grows in large chunks as it fills up.
+# A sessionReplay reads the records straight out of the memory map (no copying) and plays them back in real time,
+# N times faster, or as fast as possible, in the same format as pseudoData() and the serial reader.
+
+# https://numpy.org/doc/stable/reference/generated/numpy.memmap.html
+
+#  File layout:
+#  0      8 bytes   Magic, b"L11REC01".
+#  8      uint64    Number of records written.
+#  16     48 bytes  Reserved (0x00).
+#  64     ...       The records, see sessionDType.
+
+
+import time
+import struct
+import numpy as np
+
+sessionMagic = b"L11REC01"
+sessionHeader = struct.Struct("<8sQ48x")
+# Missing readings are NaN, a missing potentiometer value is -1.
+sessionDType = np.dtype([("timestamp", "<f8"), ("pot1Value", "<i2"), ("crcOK", "u1"), ("tDHT11", "<f8"), ("hDHT11", "<f8"), ("tDHT22", "<f8"), ("hDHT22", "<f8")], align = True)
+
+# Convert a sample using the "-1" and "NAN" markers into plain numbers.
+def sampleToNumbers(sample):
+    (pot1Value, tDHT11, hDHT11, tDHT22, hDHT22) = sample
+    return (-1 if pot1Value == "-1" else pot1Value,
+            np.nan if tDHT11 == "NAN" else tDHT11, np.nan if hDHT11 == "NAN" else hDHT11,
+            np.nan if tDHT22 == "NAN" else tDHT22, np.nan if hDHT22 == "NAN" else hDHT22)
+
+# Convert a session record back into a sample using the "-1" and "NAN" markers, as the virtual meters expect.
+def recordToSample(sessionRecord):
+    pot1Value = int(sessionRecord["pot1Value"])
+    readings = [float(sessionRecord[fieldName]) for fieldName in ("tDHT11", "hDHT11", "tDHT22", "hDHT22")]
+    return tuple(["-1" if pot1Value == -1 else pot1Value] + ["NAN" if reading != reading else reading for reading in readings])
+
+# Open an existing session file as a read-only, zero copy, structured array of its records.
+def openSession(sessionPath = "session.l11rec"):
+    with open(sessionPath, "rb") as sessionFile:
+        (fileMagic, recordCount) = sessionHeader.unpack(sessionFile.read(sessionHeader.size))
+    if fileMagic != sessionMagic:
+        raise ValueError("%s is not a Lesson 11 session file" % sessionPath)
+    if recordCount == 0:
+        return np.zeros(0, dtype = sessionDType)
+    return np.memmap(sessionPath, dtype = sessionDType, mode = "r", offset = sessionHeader.size, shape = (recordCount,))
+
+# Append sensor samples to a memory-mapped session file.
+class sessionRecorder():
+    def __init__(self, sessionPath = "session.l11rec", chunkRecords = 65536, flushRecords = 1024):
+        self.sessionPath = sessionPath
+        self.chunkRecords = chunkRecords
+        self.flushRecords = flushRecords # Write the record count to the file header this often.
+        self.recordCount = 0
+        self.capacity = 0
+        self.records = None
+        # Start a new file with an empty header and the first chunk.
+        with open(self.sessionPath, "wb") as sessionFile:
+            sessionFile.write(sessionHeader.pack(sessionMagic, 0))
+        self.growFile()
+    # Make the file a chunk bigger and map it again.
+    def growFile(self):
+        if self.records is not None:
+            self.records.flush()
+            del self.records
+        self.capacity += self.chunkRecords
+        with open(self.sessionPath, "r+b") as sessionFile:
+            sessionFile.truncate(sessionHeader.size + self.capacity * sessionDType.itemsize)
+        self.records = np.memmap(self.sessionPath, dtype = sessionDType, mode = "r+", offset = sessionHeader.size, shape = (self.capacity,))
+    # Record a sample. A sample of None records a packet that failed its CRC8 check, or could not be parsed.
+    def record(self, sample = None, timestamp = None):
+        if self.recordCount == self.capacity:
+            self.growFile()
+        sessionRecord = self.records[self.recordCount]
+        sessionRecord["timestamp"] = time.monotonic() if timestamp is None else timestamp
+        if sample is None:
+            sessionRecord["crcOK"] = 0
+            sessionRecord["pot1Value"] = -1
+            for fieldName in ("tDHT11", "hDHT11", "tDHT22", "hDHT22"):
+                sessionRecord[fieldName] = np.nan
+        else:
+            sessionRecord["crcOK"] = 1
+            (sessionRecord["pot1Value"], sessionRecord["tDHT11"], sessionRecord["hDHT11"], sessionRecord["tDHT22"], sessionRecord["hDHT22"]) = sampleToNumbers(sample)
+        self.recordCount += 1
+        if self.recordCount % self.flushRecords == 0:
+            self.writeHeader()
+    # Record a whole block of samples at once, e.g. from a NumPy structured array with the session field names.
+    def recordBlock(self, sessionRecords):
+        while self.recordCount + len(sessionRecords) > self.capacity:
+            self.growFile()
+        recordSlice = self.records[self.recordCount:self.recordCount + len(sessionRecords)]
+        for fieldName in sessionDType.names:
+            recordSlice[fieldName] = sessionRecords[fieldName]
+        self.recordCount += len(sessionRecords)
+        self.writeHeader()
+    # Update the record count in the file header, so the file can be replayed even if we never get to close it.
+    def writeHeader(self):
+        with open(self.sessionPath, "r+b") as sessionFile:
+            sessionFile.write(sessionHeader.pack(sessionMagic, self.recordCount))
+    def flush(self):
+        self.records.flush()
+        self.writeHeader()
+    # Flush everything and trim the unused part of the last chunk off the file.
+    def close(self):
+        if self.records is None:
+            return
+        self.flush()
+        del self.records
+        self.records = None
+        with open(self.sessionPath, "r+b") as sessionFile:
+            sessionFile.truncate(sessionHeader.size + self.recordCount * sessionDType.itemsize)
+    def __enter__(self):
+        return self
+    def __exit__(self, excType, excValue, excTraceback):
+        self.close()
+
+# Play back a recorded session.
+# replaySpeed is 1 for real time, N for N times faster, or 0 for as fast as possible.
+class sessionReplay():
+    def __init__(self, sessionPath = "session.l11rec", replaySpeed = 1, skipBadPackets = True):
+        self.records = openSession(sessionPath)
+        self.replaySpeed = replaySpeed
+        # Packets that failed their CRC8 check never reached the virtual meters, so by default they are not replayed either.
+        self.skipBadPackets = skipBadPackets
+        self.rewind()
+    def __len__(self):
+        return len(self.records)
+    def rewind(self):
+        self.replayIndex = 0
+        self.replayStart = None
+    def finished(self):
+        return self.replayIndex >= len(self.records)
+    # The recorded time of a record, relative to the start of the session.
+    def sessionTime(self, recordIndex):
+        return self.records["timestamp"][recordIndex] - self.records["timestamp"][0]
+    # Start the replay clock so that the current record is due now.
+    def startClock(self):
+        if self.replayStart is None:
+            self.replayStart = time.monotonic() - self.sessionTime(self.replayIndex) / self.replaySpeed
+    def isPlayable(self, recordIndex):
+        return not self.skipBadPackets or self.records["crcOK"][recordIndex] == 1
+    # Return the newest sample that is due, skipping any older ones that are also due, or None if nothing new is due yet.
+    # This never waits, so it can be called once per vPython frame, like sampleRingBuffer.getLatest().
+    def nextSample(self):
+        if len(self.records) == 0:
+            return None # An empty session, e.g. the Arduino never sent anything, has no clock to start.
+        if self.replaySpeed:
+            self.startClock()
+            # Find the last record that is due at this replay time.
+            dueTime = self.records["timestamp"][0] + (time.monotonic() - self.replayStart) * self.replaySpeed
+            dueIndex = int(np.searchsorted(self.records["timestamp"], dueTime, side = "right"))
+        else:
+            # As fast as possible, so the next playable record is always due.
+            while not self.finished() and not self.isPlayable(self.replayIndex):
+                self.replayIndex += 1
+            dueIndex = self.replayIndex + 1
+        # Take the newest playable record that has become due.
+        for recordIndex in range(min(dueIndex, len(self.records)) - 1, self.replayIndex - 1, -1):
+            if self.isPlayable(recordIndex):
+                self.replayIndex = recordIndex + 1
+                return recordToSample(self.records[recordIndex])
+        self.replayIndex = max(self.replayIndex, min(dueIndex, len(self.records)))
+        return None
+    # Yield every sample in order, waiting between them to keep to the replay speed.
+    def samples(self):
+        while not self.finished():
+            recordIndex = self.replayIndex
+            self.replayIndex += 1
+            if not self.isPlayable(recordIndex):
+                continue
+            if self.replaySpeed:
+                self.startClock()
+                waitTime = self.replayStart + self.sessionTime(recordIndex) / self.replaySpeed - time.monotonic()
+                if waitTime > 0:
+                    time.sleep(waitTime)
+            yield recordToSample(self.records[recordIndex])
+    # Yield the records in blocks, as zero copy views of the memory map, for fast analysis.
+    def blocks(self, blockRecords = 65536):
+        for blockStart in range(0, len(self.records), blockRecords):
+            yield self.records[blockStart:blockStart + blockRecords]
+
+# EOF
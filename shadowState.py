@@ -0,0 +1,118 @@
+# A dirty-checking shadow state layer for the Lesson 11 vPython meter primitives.
+# Every attribute assignment on a vPython object is sent to the browser, even if the value has not changed.
+# A shadowPrimitive remembers the last value pushed for each attribute and only assigns it again when it really changes.
+
+# https://www.glowscript.org/docs/VPythonDocs/index.html
+# https://numpy.org/doc/stable/reference/generated/numpy.where.html
+
+
+import numpy as np
+
+# Counters of the attribute assignments that were pushed to, or saved from, the vPython renderer.
+shadowStats = {"pushed": 0, "skipped": 0}
+
+# Make a comparable key from an attribute value - vPython vectors are compared by their components.
+def attrKey(attrValue):
+    if hasattr(attrValue, "x") and hasattr(attrValue, "y") and hasattr(attrValue, "z"):
+        return (attrValue.x, attrValue.y, attrValue.z)
+    return attrValue
+
+# A vPython primitive and the last values pushed to it.
+# Assigning an attribute on the shadow, e.g. shadow.opacity = 1, only reaches the primitive if the value has changed.
+# Reading an attribute is passed straight through to the primitive.
+class shadowPrimitive():
+    def __init__(self, primitive, **knownAttrs):
+        object.__setattr__(self, "primitive", primitive)
+        # The attributes the primitive was created with are already known, so they do not need to be pushed again.
+        object.__setattr__(self, "shadow", {attrName: attrKey(attrValue) for (attrName, attrValue) in knownAttrs.items()})
+    def __getattr__(self, attrName):
+        return getattr(self.primitive, attrName)
+    def __setattr__(self, attrName, attrValue):
+        self.set(attrName, attrValue)
+    # Set an attribute only if it differs from the last value pushed. Returns True if it was pushed.
+    def set(self, attrName, attrValue):
+        newKey = attrKey(attrValue)
+        if attrName in self.shadow and self.shadow[attrName] == newKey:
+            shadowStats["skipped"] += 1
+            return False
+        setattr(self.primitive, attrName, attrValue)
+        self.shadow[attrName] = newKey
+        shadowStats["pushed"] += 1
+        return True
+    # Forget the last pushed values, e.g. if something else has changed the primitive.
+    def invalidate(self):
+        self.shadow.clear()
+
+# Work out which segments of a segment bar can have changed when its "segments on" value moves from old to new.
+# Segments below the whole part of both values are fully on in both, and segments above both are fully off in both,
+# so only the segments between (and including) the two whole parts need to be looked at.
+# Returns a range of segment indices, all of them if there is no old value.
+def changedSegmentRange(oldSegmentsOn = None, newSegmentsOn = 0, segmentCount = 0):
+    if oldSegmentsOn is None:
+        return range(segmentCount)
+    if oldSegmentsOn == newSegmentsOn:
+        return range(0)
+    firstSegment = max(0, min(int(oldSegmentsOn), int(newSegmentsOn)))
+    lastSegment = min(segmentCount - 1, max(int(oldSegmentsOn), int(newSegmentsOn)))
+    return range(firstSegment, lastSegment + 1)
+
+# The colour and opacity of every segment in a segment bar, worked out for all the segments at once with NumPy.
+# A segment bar lights its segments from the bottom up: segments below the whole part of the "segments on" value are
+# fully on, the next one is partially on (its opacity is the fractional part), and the rest are off.
+# Colours are given as indices into a palette kept by the meter, so they can be compared as plain numbers.
+#  onColorIndex     The palette index of each segment when it is on, e.g. the blue/green/red bands of an LED bank.
+#  offOpacity       The opacity of each segment when it is off, e.g. a ramp along the bar.
+#  offColorIndex    The palette index of every segment when it is off.
+#  partialMinimum   A partially on segment whose fractional part is below this is shown as off.
+class segmentBarState():
+    def __init__(self, onColorIndex, offOpacity, offColorIndex = 0, partialMinimum = 0.0):
+        self.onColorIndex = np.asarray(onColorIndex, dtype = np.intp)
+        self.offOpacity = np.asarray(offOpacity, dtype = float)
+        self.offColorIndex = offColorIndex
+        self.partialMinimum = partialMinimum
+        self.offColorIndexes = np.full(len(self.onColorIndex), offColorIndex, dtype = np.intp)
+        # The segments are drawn off, so that is where we start.
+        self.colorIndex = self.offColorIndexes.copy()
+        self.opacity = self.offOpacity.copy()
+        self.colorChanged = np.zeros(len(self.onColorIndex), dtype = bool)
+        self.opacityChanged = np.zeros(len(self.onColorIndex), dtype = bool)
+    def __len__(self):
+        return len(self.onColorIndex)
+    # Work out the colour indices and opacities of all the segments for a "segments on" value.
+    # The fully on segments are always the first ones, so they can be set with a slice instead of a mask.
+    def segmentStates(self, segmentsOn = 0.0):
+        wholeSegments = max(0, int(segmentsOn))
+        partialOpacity = segmentsOn % 1 # Using modulo maths to get the fractional part of the number.
+        colorIndex = self.offColorIndexes.copy()
+        colorIndex[:wholeSegments] = self.onColorIndex[:wholeSegments]
+        opacity = self.offOpacity.copy()
+        opacity[:wholeSegments] = 1.0
+        if wholeSegments < len(opacity) and partialOpacity >= self.partialMinimum:
+            colorIndex[wholeSegments] = self.onColorIndex[wholeSegments]
+            opacity[wholeSegments] = partialOpacity
+        return (colorIndex, opacity)
+    # Move the bar to a new "segments on" value. Returns the indices of the segments whose colour or opacity changed.
+    def update(self, segmentsOn = 0.0):
+        (colorIndex, opacity) = self.segmentStates(segmentsOn)
+        self.colorChanged = colorIndex != self.colorIndex
+        self.opacityChanged = opacity != self.opacity
+        self.colorIndex = colorIndex
+        self.opacity = opacity
+        return np.flatnonzero(self.colorChanged | self.opacityChanged)
+    # Push the changed segments to their vPython primitives using the meter's colour palette.
+    # The bar state already is the shadow of its segments, so only the attributes that changed in the last update() are
+    # assigned, straight to the primitives.
+    def apply(self, segmentPrimitives, colorPalette, changedSegments):
+        # Plain Python lists are much faster to step through than NumPy scalars.
+        for (segmentIndex, colorChanged, colorIndex, opacityChanged, opacity) in zip(changedSegments.tolist(),
+                self.colorChanged[changedSegments].tolist(), self.colorIndex[changedSegments].tolist(),
+                self.opacityChanged[changedSegments].tolist(), self.opacity[changedSegments].tolist()):
+            if colorChanged:
+                segmentPrimitives[segmentIndex].color = colorPalette[colorIndex]
+            if opacityChanged:
+                segmentPrimitives[segmentIndex].opacity = opacity
+        pushedCount = int(np.count_nonzero(self.colorChanged) + np.count_nonzero(self.opacityChanged))
+        shadowStats["pushed"] += pushedCount
+        shadowStats["skipped"] += 2 * len(self.onColorIndex) - pushedCount
+
+# EOF
@@ -0,0 +1,292 @@
+# A local streaming server for the Lesson 11 sensor data, so other programs on this computer can follow the readings
+# without opening the Arduino's serial port (which only one program can have open).
+# The main loop publishes each sample, and the rgbLEDs state, which just queues it for an asyncio event loop in a
+# background thread. There, each sample is turned into a Server-Sent Events frame once, and the same frame (the same
+# bytes object) is given to every client, so the main loop does the same work however many clients there are. Every
+# client has its own bounded queue of frames: a slow client's queue fills up while it is being waited for, and then its
+# drop policy applies, without holding up the other clients. A client can ask for a downsampled feed, e.g. at most one
+# sample per second, and for only some of the Arduinos in a rack.
+
+#  GET /stream            The samples, as Server-Sent Events, starting with the latest sample of every Arduino.
+#  GET /stream?rate=1     At most 1 sample per second (of each Arduino).
+#  GET /stream?device=ID  Only the samples of that Arduino, it can be given more than once.
+#  GET /latest            The latest sample of every Arduino, as JSON.
+#  GET /stats             The server and client counters, as JSON.
+
+# https://html.spec.whatwg.org/multipage/server-sent-events.html
+# https://docs.python.org/3/library/asyncio-stream.html
+
+
+import json
+import socket
+import math
+import time
+import asyncio
+import threading
+import collections
+from urllib.parse import urlsplit, parse_qs
+
+# The sample fields, in the order the Arduino sends them.
+sampleFields = ("pot1Value", "tDHT11", "hDHT11", "tDHT22", "hDHT22")
+# The drop policies for a client whose queue is full.
+dropPolicies = ("oldest", "newest", "disconnect")
+
+# A sample as a Server-Sent Events frame, e.g. b'id: 7\ndata: {"seq":7,...,"pot1Value":512,...,"rgbLEDs":2}\n\n'.
+# The invalid readings, "-1" and "NAN", are sent as null.
+def sampleFrame(sequence, timestamp, deviceID, sample, rgbLEDs = None):
+    sampleData = {"seq": sequence, "time": round(timestamp, 3), "device": deviceID}
+    for (fieldName, reading) in zip(sampleFields, sample):
+        sampleData[fieldName] = None if isinstance(reading, str) or reading != reading else reading
+    sampleData["rgbLEDs"] = rgbLEDs if isinstance(rgbLEDs, int) else None
+    return ("id: %d\ndata: %s\n\n" % (sequence, json.dumps(sampleData, separators = (",", ":")))).encode()
+
+# A plain HTTP response, for everything but the stream.
+def httpResponse(httpStatus = "200 OK", responseBody = b"", contentType = "application/json", extraHeaders = ""):
+    return ("HTTP/1.1 %s\r\nContent-Type: %s\r\nContent-Length: %d\r\nCache-Control: no-cache\r\n%sConnection: close\r\n\r\n" %
+            (httpStatus, contentType, len(responseBody), extraHeaders)).encode() + responseBody
+
+# One stream client, and the frames waiting to be sent to it. Only used by the event loop.
+class streamClient():
+    def __init__(self, writer, clientQueue = 256, dropPolicy = "oldest", deviceIDs = None, minInterval = 0.0):
+        self.writer = writer
+        self.frames = collections.deque()
+        self.clientQueue = clientQueue
+        self.dropPolicy = dropPolicy
+        self.deviceIDs = deviceIDs  # The device IDs to send, or None for all of them.
+        self.minInterval = minInterval
+        self.lastOffered = {}       # When a frame of each device was last queued, for the downsampled feed.
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.tooSlow = False        # Disconnected by the "disconnect" drop policy.
+        # Counters.
+        self.framesSent = 0
+        self.framesDropped = 0
+        self.framesSkipped = 0      # Frames left out of a downsampled feed.
+    # Queue a frame, if the client wants it, applying the drop policy if its queue is full.
+    def offer(self, deviceID, timestamp, frame):
+        if self.closed or (self.deviceIDs is not None and str(deviceID) not in self.deviceIDs):
+            return
+        if self.minInterval:
+            if timestamp - self.lastOffered.get(deviceID, -math.inf) < self.minInterval:
+                self.framesSkipped += 1
+                return
+            self.lastOffered[deviceID] = timestamp
+        self.queue(frame)
+    def queue(self, frame):
+        if len(self.frames) >= self.clientQueue:
+            self.framesDropped += 1
+            if self.dropPolicy == "newest":
+                return
+            if self.dropPolicy == "disconnect":
+                self.tooSlow = True
+                self.close()
+                return
+            self.frames.popleft()
+        self.frames.append(frame)
+        self.ready.set()
+    # Send the waiting frames, all together, and wait for them to be taken before sending any more. Frames queued
+    # meanwhile wait in the client's queue, so a slow client only ever holds up itself.
+    async def pump(self):
+        while not self.closed:
+            await self.ready.wait()
+            self.ready.clear()
+            while self.frames and not self.closed:
+                frames = list(self.frames)
+                self.frames.clear()
+                self.writer.writelines(frames)
+                self.framesSent += len(frames)
+                await self.writer.drain()
+    # Close the connection straight away, throwing away anything still waiting to be sent, which also ends a pump() waiting for it.
+    def close(self):
+        self.closed = True
+        self.ready.set()
+        self.writer.transport.abort()
+    def stats(self):
+        return {"framesSent": self.framesSent, "framesDropped": self.framesDropped, "framesSkipped": self.framesSkipped, "framesWaiting": len(self.frames)}
+
+class streamServer(threading.Thread):
+    #  host          The address to serve on, only this computer by default.
+    #  port          The port to serve on, 0 for any free port (see serverPort once it is ready).
+    #  clientQueue   The most frames waiting for one client before its drop policy applies.
+    #  dropPolicy    What to do when a client's queue is full: drop its "oldest" frame, drop the "newest" one, or "disconnect" it.
+    #  maxClients    The most stream clients at once.
+    #  allowOrigin   The web pages that may read the stream, e.g. "*" for a dashboard opened from a file, or None for none.
+    def __init__(self, host = "127.0.0.1", port = 8011, clientQueue = 256, dropPolicy = "oldest", maxClients = 64, allowOrigin = None):
+        threading.Thread.__init__(self, name = "streamServer", daemon = True)
+        if dropPolicy not in dropPolicies:
+            raise ValueError("The drop policy must be one of %s." % ", ".join(dropPolicies))
+        self.host = host
+        self.serverPort = port
+        self.clientQueue = clientQueue
+        self.dropPolicy = dropPolicy
+        self.maxClients = maxClients
+        self.corsHeader = "Access-Control-Allow-Origin: %s\r\n" % allowOrigin if allowOrigin else ""
+        self.keepAliveInterval = 15.0
+        # The samples published since the last fan out, shared with the threads that publish them.
+        self.pendingSamples = collections.deque(maxlen = 4096)
+        self.pendingLock = threading.Lock()
+        self.wakeRequested = False
+        # Only used by the event loop.
+        self.clients = set()
+        self.latestFrames = {}      # The latest frame of each device, and when it was published, for new clients and /latest.
+        self.sequence = 0
+        self.streamLoop = None
+        self.wakeUp = None
+        self.running = threading.Event()
+        self.ready = threading.Event()
+        # Counters.
+        self.samplesPublished = 0
+        self.samplesDropped = 0     # Samples published faster than the event loop could take them.
+        self.framesBuilt = 0
+        self.clientsServed = 0
+        self.clientsRefused = 0
+        self.clientsTooSlow = 0
+        self.framesDropped = 0      # Frames dropped for the clients that have gone.
+        self.lastError = None
+    # Publish a sample of an Arduino, and its rgbLEDs state. This never waits, and costs the same however many clients there
+    # are, so it can be called from the main loop. Nothing is kept while the server is not running.
+    def publish(self, deviceID, sample, rgbLEDs = None, timestamp = None):
+        if self.streamLoop is None:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.pendingLock:
+            if len(self.pendingSamples) == self.pendingSamples.maxlen:
+                self.samplesDropped += 1
+            self.pendingSamples.append((timestamp, deviceID, sample, rgbLEDs))
+            self.samplesPublished += 1
+            wakeUp = not self.wakeRequested
+            self.wakeRequested = True
+        # Only the first sample since the last fan out needs to wake the event loop up.
+        if wakeUp:
+            try:
+                self.streamLoop.call_soon_threadsafe(self.wakeUp.set)
+            except (AttributeError, RuntimeError): # The event loop has just stopped.
+                pass
+    # Build one frame for each waiting sample, and offer it to every client.
+    def fanOut(self):
+        with self.pendingLock:
+            pendingSamples = list(self.pendingSamples)
+            self.pendingSamples.clear()
+            self.wakeRequested = False
+        for (timestamp, deviceID, sample, rgbLEDs) in pendingSamples:
+            self.sequence += 1
+            frame = sampleFrame(self.sequence, timestamp, deviceID, sample, rgbLEDs)
+            self.framesBuilt += 1
+            self.latestFrames[deviceID] = (timestamp, frame)
+            for client in self.clients:
+                client.offer(deviceID, timestamp, frame)
+    async def handleClient(self, reader, writer):
+        try:
+            requestHead = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5.0)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+        requestLine = requestHead.split(b"\r\n", 1)[0].decode("latin-1").split()
+        if len(requestLine) < 2 or requestLine[0] != "GET":
+            await self.respond(writer, httpResponse("405 Method Not Allowed", b"", "text/plain", self.corsHeader))
+            return
+        requestURL = urlsplit(requestLine[1])
+        requestQuery = parse_qs(requestURL.query)
+        if requestURL.path == "/stream":
+            await self.stream(writer, requestQuery)
+        elif requestURL.path == "/latest":
+            latestJSON = b"[" + b",".join(frame.split(b"data: ", 1)[1].rstrip() for (timestamp, frame) in self.latestFrames.values()) + b"]"
+            await self.respond(writer, httpResponse("200 OK", latestJSON, "application/json", self.corsHeader))
+        elif requestURL.path == "/stats":
+            await self.respond(writer, httpResponse("200 OK", json.dumps(self.stats()).encode(), "application/json", self.corsHeader))
+        else:
+            await self.respond(writer, httpResponse("404 Not Found", b"", "text/plain", self.corsHeader))
+    async def respond(self, writer, response):
+        try:
+            writer.write(response)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+    # Stream the samples to a client until it goes away, or is disconnected.
+    async def stream(self, writer, requestQuery):
+        try:
+            sampleRate = float(requestQuery.get("rate", ["0"])[0])
+        except ValueError:
+            sampleRate = -1
+        if not sampleRate >= 0:
+            await self.respond(writer, httpResponse("400 Bad Request", b"The rate must be a number of samples per second.", "text/plain", self.corsHeader))
+            return
+        if len(self.clients) >= self.maxClients:
+            self.clientsRefused += 1
+            await self.respond(writer, httpResponse("503 Service Unavailable", b"Too many clients.", "text/plain", self.corsHeader))
+            return
+        deviceIDs = set(requestQuery["device"]) if "device" in requestQuery else None
+        client = streamClient(writer, self.clientQueue, self.dropPolicy, deviceIDs, 1 / sampleRate if sampleRate else 0.0)
+        # Small transport and socket buffers, so a slow client's frames wait (and are dropped) in its own queue, not in them.
+        writer.transport.set_write_buffer_limits(16384)
+        writer.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 16384)
+        writer.write(("HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n%sConnection: keep-alive\r\n\r\nretry: 1000\n\n" % self.corsHeader).encode())
+        for (deviceID, (timestamp, frame)) in self.latestFrames.items():
+            client.offer(deviceID, timestamp, frame)
+        self.clients.add(client)
+        self.clientsServed += 1
+        try:
+            await client.pump()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(client)
+            client.close()
+            self.clientsTooSlow += client.tooSlow
+            self.framesDropped += client.framesDropped
+    async def serve(self):
+        self.wakeUp = asyncio.Event()
+        try:
+            server = await asyncio.start_server(self.handleClient, self.host, self.serverPort)
+        except OSError as err:
+            self.lastError = err
+            self.ready.set()
+            return
+        self.serverPort = server.sockets[0].getsockname()[1]
+        self.streamLoop = asyncio.get_running_loop()
+        self.ready.set()
+        keepAliveDue = time.monotonic() + self.keepAliveInterval
+        while self.running.is_set():
+            try:
+                await asyncio.wait_for(self.wakeUp.wait(), max(0.0, keepAliveDue - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+            self.wakeUp.clear()
+            self.fanOut()
+            # A comment now and then keeps the connections open, and finds the clients that have gone away.
+            if time.monotonic() >= keepAliveDue:
+                for client in self.clients:
+                    client.queue(b": keepalive\n\n")
+                keepAliveDue = time.monotonic() + self.keepAliveInterval
+        self.streamLoop = None
+        server.close()
+        for client in list(self.clients):
+            client.close()
+        await asyncio.sleep(0) # Let the clients' pumps finish.
+        await server.wait_closed()
+    def run(self):
+        self.running.set()
+        asyncio.run(self.serve())
+    # Start serving, and wait until the server is ready. Returns False, with the error in lastError, if it could not start.
+    def startServing(self, timeout = 5.0):
+        self.start()
+        self.ready.wait(timeout)
+        return self.streamLoop is not None
+    def stop(self, timeout = 1):
+        self.running.clear()
+        streamLoop = self.streamLoop
+        if streamLoop is not None and self.is_alive():
+            try:
+                streamLoop.call_soon_threadsafe(self.wakeUp.set)
+            except RuntimeError:
+                pass
+        if self.is_alive():
+            self.join(timeout)
+    # A snapshot of the server counters, and of each client.
+    def stats(self):
+        return {"samplesPublished": self.samplesPublished, "samplesDropped": self.samplesDropped, "framesBuilt": self.framesBuilt, "clients": len(self.clients),
+                "clientsServed": self.clientsServed, "clientsRefused": self.clientsRefused, "clientsTooSlow": self.clientsTooSlow, "framesDropped": self.framesDropped,
+                "clientStats": [client.stats() for client in list(self.clients)]}
+
+# EOF
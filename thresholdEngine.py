@@ -0,0 +1,85 @@
+# A threshold classifier with hysteresis for the Lesson 11 LEDs.
+# A reading is put into a band by a set of thresholds, e.g. blue, green or red by the 30% and 70% thresholds.
+# A reading that jitters around a threshold would flip between the bands, sending a new rgbLEDs command to the Arduino,
+# and recolouring the virtual LEDs, every time. So a band only changes once the reading has gone past the threshold
+# by half of the hysteresis, and, optionally, stayed in the new band for a minimum dwell time.
+
+# https://en.wikipedia.org/wiki/Hysteresis#Control_systems
+# https://docs.python.org/3/library/bisect.html
+
+
+import time
+from bisect import bisect_right
+
+# The band state of one channel.
+class thresholdState():
+    def __init__(self):
+        self.band = None        # The current band, None until there is a valid reading.
+        self.pendingBand = None # A new band that is waiting out its minimum dwell time.
+        self.pendingSince = 0.0
+        self.bandChanges = 0
+
+# Put readings into bands, keeping a separate state for each channel (e.g. each Arduino, or each LED).
+# Band 0 is below the first threshold, band 1 is between the first and second thresholds, and so on. A reading that is
+# exactly on a threshold is in the middle band(s), as the original rgbLEDsAction() did, e.g. 1.5 <= green <= 3.5.
+#  thresholds   The band thresholds, in ascending order.
+#  hysteresis   The width of the dead band around each threshold.
+#  minDwell     The time, in seconds, a reading has to stay in a new band before the band changes.
+class thresholdClassifier():
+    def __init__(self, thresholds = (30, 70), hysteresis = 0.5, minDwell = 0.0):
+        self.thresholds = tuple(thresholds)
+        self.hysteresis = hysteresis
+        self.minDwell = minDwell
+        self.channels = {}
+    # The band of a reading without any hysteresis.
+    def rawBand(self, sensorValue):
+        if sensorValue < self.thresholds[0]:
+            return 0
+        if sensorValue > self.thresholds[-1]:
+            return len(self.thresholds)
+        # A value on the highest threshold still belongs to the band below it.
+        return min(bisect_right(self.thresholds, sensorValue), max(len(self.thresholds) - 1, 1))
+    def state(self, channel = None):
+        if channel not in self.channels:
+            self.channels[channel] = thresholdState()
+        return self.channels[channel]
+    # Classify a reading for a channel, and return its band. Invalid readings ("nan", "NAN" or NaN) return None,
+    # and leave the channel state as it was.
+    def classify(self, sensorValue = "nan", channel = None, timeNow = None):
+        if isinstance(sensorValue, str) or sensorValue != sensorValue:
+            return None
+        channelState = self.state(channel)
+        if channelState.band is None:
+            channelState.band = self.rawBand(sensorValue)
+            return channelState.band
+        # Only go up (or down) a band once the reading is past the threshold by half the hysteresis.
+        newBand = self.rawBand(sensorValue)
+        if newBand > channelState.band:
+            newBand = max(channelState.band, self.rawBand(sensorValue - self.hysteresis / 2))
+        elif newBand < channelState.band:
+            newBand = min(channelState.band, self.rawBand(sensorValue + self.hysteresis / 2))
+        if newBand == channelState.band:
+            channelState.pendingBand = None
+            return channelState.band
+        # The new band has to last for the minimum dwell time.
+        if self.minDwell > 0:
+            timeNow = time.monotonic() if timeNow is None else timeNow
+            if newBand != channelState.pendingBand:
+                channelState.pendingBand = newBand
+                channelState.pendingSince = timeNow
+            if timeNow - channelState.pendingSince < self.minDwell:
+                return channelState.band
+        channelState.band = newBand
+        channelState.pendingBand = None
+        channelState.bandChanges += 1
+        return channelState.band
+    # Forget the state of a channel, or of all the channels.
+    def reset(self, channel = None):
+        if channel is None:
+            self.channels.clear()
+        else:
+            self.channels.pop(channel, None)
+    def stats(self):
+        return {channel: channelState.bandChanges for (channel, channelState) in self.channels.items()}
+
+# EOF